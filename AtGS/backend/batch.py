@@ -0,0 +1,160 @@
+import argparse
+import csv
+import itertools
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import world_generation
+from world_cache import load_or_generate_world
+from biomes import OCEAN, add_water_biomes, classify_biome_ids
+from civ import spawn_civs
+from civ_table import CivTable
+from grid_engine import EXPAND_PROB, init_ownership_grid, monthly_grid_update
+from diplomacy import DIPLOMACY_STATES, init_diplomacy_states, update_diplomacy_states
+
+# Monte Carlo batch runs: every seed is simulated for every combination of the
+# parameter grid, and each run is reduced to one row of summary statistics.
+#
+#   python batch.py --seeds 0 32 --num-civs 15 50 --expand-prob 0.1 0.2 --months 120 360 --workers 8
+#
+# Runs are grouped by seed, so each worker loads (or generates) the terrain of
+# a seed once and reuses it for all parameter combinations. The months values
+# are snapshots of one run per combination: a run for months=[120, 360] is
+# summarized after month 120 and continues to 360.
+
+DEFAULT_RESULTS_FILE = "batch_results.npz"
+TERRITORY_PERCENTILES = [0, 25, 50, 75, 100]
+
+
+def parameter_grid(num_civs, expand_probs, sea_levels):
+    """All (num_civs, expand_prob, sea_level) combinations, in a stable order."""
+    return list(itertools.product(num_civs, expand_probs, sea_levels))
+
+
+def summarize(table, ownership, land_mask, relations):
+    """Reduces the state of one run to a flat dict of numbers."""
+    num_civs = len(table)
+    territory = table.territory_size
+    city_counts = table.cities.counts_by_owner(num_civs)
+    populations = table.cities.population_by_owner(num_civs)
+    state_counts = np.bincount(relations, minlength=len(DIPLOMACY_STATES))
+
+    row = {
+        "land_tiles": int(land_mask.sum()),
+        "owned_tiles": int((ownership >= 0).sum()),
+    }
+    for percentile, value in zip(TERRITORY_PERCENTILES, np.percentile(territory, TERRITORY_PERCENTILES)):
+        row[f"territory_p{percentile}"] = float(value)
+    row["territory_mean"] = float(territory.mean())
+    row["territory_std"] = float(territory.std())
+    row["cities_total"] = int(city_counts.sum())
+    row["cities_mean"] = float(city_counts.mean())
+    row["cities_max"] = int(city_counts.max())
+    row["population_total"] = float(populations.sum())
+    row["population_mean"] = float(populations.mean())
+    row["population_max"] = float(populations.max())
+    for name, count in zip(DIPLOMACY_STATES, state_counts.tolist()):
+        row["diplomacy_" + name.lower().replace(" ", "_")] = count
+    return row
+
+
+def run_seed(seed, width, height, grid, months):
+    """Simulates all parameter combinations for one seed; returns the summary rows."""
+    world = load_or_generate_world(seed, width, height)
+    months = sorted(months)
+    rows = []
+
+    biome_ids_by_sea_level = {}
+    for num_civs, expand_prob, sea_level in grid:
+        if sea_level not in biome_ids_by_sea_level:
+            if sea_level == world_generation.sea_level:
+                biome_ids_by_sea_level[sea_level] = world["biome_ids"]
+            else:
+                # Only the classification depends on the sea level, the noise and water layers are reused
+                biome_ids = classify_biome_ids(world["height_map"], world["temp_map"], world["moist_map"], sea_level)
+                biome_ids_by_sea_level[sea_level] = add_water_biomes(biome_ids, world["lake_map"],
+                                                                     world["river_map"])
+        biome_ids = biome_ids_by_sea_level[sea_level]
+        land_mask = biome_ids != OCEAN
+
+        # Same seed -> same capitals and random stream for every parameter combination
+        random.seed(seed)
+        rng = np.random.default_rng(seed)
+        civs = spawn_civs(biome_ids, width, height, num_civs=num_civs)
+        ownership = init_ownership_grid(civs, width, height)
+        table = CivTable.from_civ_dicts(civs, rng)
+        relations = init_diplomacy_states(num_civs)
+
+        start = time.perf_counter()
+        month = 0
+        for snapshot in months:
+            while month < snapshot:
+                monthly_grid_update(table, ownership, land_mask, rng, expand_prob=expand_prob)
+                update_diplomacy_states(table, relations, rng)
+                month += 1
+            row = {"seed": seed, "num_civs": num_civs, "expand_prob": expand_prob, "sea_level": sea_level,
+                   "months": snapshot}
+            row.update(summarize(table, ownership, land_mask, relations))
+            row["seconds"] = time.perf_counter() - start
+            rows.append(row)
+    return rows
+
+
+def write_results(path, rows):
+    """One array per column (.npz), or plain CSV if path ends with .csv."""
+    if not rows:
+        raise ValueError(f"No results to write to {path} (empty seed range or parameter grid?)")
+    columns = list(rows[0].keys())
+    if path.endswith(".csv"):
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        np.savez_compressed(path, **{column: np.array([row[column] for row in rows]) for column in columns})
+    print(f"batch: {len(rows)} rows written to {path}")
+
+
+def run_batch(seeds, grid, months, width=world_generation.map_width, height=world_generation.map_height,
+              workers=1):
+    rows = []
+    if workers <= 1:
+        for seed in seeds:
+            rows.extend(run_seed(seed, width, height, grid, months))
+            print(f"batch: seed {seed} done")
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(run_seed, seed, width, height, grid, months): seed for seed in seeds}
+            for future in as_completed(futures):
+                rows.extend(future.result())
+                print(f"batch: seed {futures[future]} done")
+
+    rows.sort(key=lambda row: (row["seed"], row["num_civs"], row["expand_prob"], row["sea_level"], row["months"]))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run many seeds and parameter combinations with the grid engine.")
+    parser.add_argument("--seeds", type=int, nargs=2, metavar=("START", "STOP"), default=[0, 8],
+                        help="seed range, STOP exclusive")
+    parser.add_argument("--num-civs", type=int, nargs="+", default=[15])
+    parser.add_argument("--expand-prob", type=float, nargs="+", default=[EXPAND_PROB])
+    parser.add_argument("--sea-level", type=float, nargs="+", default=[world_generation.sea_level])
+    parser.add_argument("--months", type=int, nargs="+", default=[360],
+                        help="summarize each run after these months")
+    parser.add_argument("--width", type=int, default=world_generation.map_width)
+    parser.add_argument("--height", type=int, default=world_generation.map_height)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--output", default=DEFAULT_RESULTS_FILE, help="results file (.npz columns or .csv)")
+    args = parser.parse_args()
+
+    grid = parameter_grid(args.num_civs, args.expand_prob, args.sea_level)
+    seeds = range(args.seeds[0], args.seeds[1])
+    if not seeds:
+        parser.error(f"--seeds {args.seeds[0]} {args.seeds[1]} is empty, STOP is exclusive")
+    print(f"batch: {len(seeds)} seeds x {len(grid)} parameter combinations on {args.workers} workers")
+    results = run_batch(seeds, grid, args.months, width=args.width, height=args.height, workers=args.workers)
+    write_results(args.output, results)
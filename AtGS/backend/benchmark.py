@@ -0,0 +1,343 @@
+import argparse
+import atexit
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import world_generation
+from world_generation import generate_noise_map
+from hydrology import generate_hydrology
+from world_cache import load_or_generate_world
+from biomes import OCEAN, classify_biome_ids
+from civ import spawn_civs, monthly_civ_update
+from civ_table import CivTable
+from grid_engine import init_ownership_grid, monthly_grid_update
+from diplomacy import init_diplomacy, update_diplomacy, init_diplomacy_states, update_diplomacy_states
+from main import init_map_ownership, export_json
+from nomads import HabitabilityMap, NomadGroups, nomad_step
+from economy import Economy
+from parallel_tick import ParallelTick
+from world_export import ownership_to_array, write_binary_world
+
+# Benchmarks for the hot paths: terrain generation, the monthly tick, diplomacy
+# and the export. Every case runs with fixed seeds, so two result files of the
+# same tree only differ by noise of the machine.
+#
+#   python benchmark.py --sizes 256 1080p --output results.json
+#   python benchmark.py --sizes 256 --baseline results.json
+
+SIZES = {
+    "256": (256, 256),
+    "1080p": (1920, 1080),
+    "4096": (4096, 4096),
+}
+
+BENCH_SEED = 1234
+DIPLOMACY_CIV_COUNTS = [15, 150, 1500]
+NOMAD_GROUP_COUNTS = [1000, 10000]
+TICK_WORKER_COUNTS = sorted({1, os.cpu_count() or 1})
+DEFAULT_RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_results.json')
+DEFAULT_THRESHOLD = 0.10
+# A slowdown also has to exceed this many seconds; sub-millisecond cases jitter by more than the threshold
+DEFAULT_MIN_DELTA = 0.005
+DEFAULT_REPEAT = 3
+
+
+def _spawn(world, num_civs=15):
+    random.seed(BENCH_SEED)
+    return spawn_civs(world["biome_ids"], world["map_width"], world["map_height"], num_civs=num_civs)
+
+
+def _dict_state(world):
+    civs = _spawn(world)
+    map_ownership = init_map_ownership(world["map_width"], world["map_height"])
+    for civ in civs:
+        for (x, y) in civ["territory"]:
+            map_ownership[y][x] = civ["id"]
+    return civs, map_ownership
+
+
+def _grid_state(world):
+    civs = _spawn(world)
+    rng = np.random.default_rng(BENCH_SEED)
+    ownership = init_ownership_grid(civs, world["map_width"], world["map_height"])
+    return CivTable.from_civ_dicts(civs, rng), ownership, world["biome_ids"] != OCEAN, rng
+
+
+def _run_months(update, months):
+    def run():
+        for _ in range(months):
+            update()
+    return run
+
+
+# Each case is (name, params, setup). setup() prepares the inputs untimed and
+# returns the function that is measured.
+
+def _noise_case(world):
+    def setup():
+        return lambda: generate_noise_map(world["map_width"], world["map_height"], world_generation.scale,
+                                          seed=BENCH_SEED)
+    return setup
+
+
+def _classify_case(world):
+    def setup():
+        return lambda: classify_biome_ids(world["height_map"], world["temp_map"], world["moist_map"],
+                                          world_generation.sea_level)
+    return setup
+
+
+def _hydrology_case(world, erosion_iterations=0):
+    def setup():
+        return lambda: generate_hydrology(world["height_map"], world["moist_map"], world_generation.sea_level,
+                                          erosion_iterations)
+    return setup
+
+
+def _spawn_case(world):
+    def setup():
+        return lambda: _spawn(world)
+    return setup
+
+
+def _civ_update_case(world, months):
+    def setup():
+        civs, map_ownership = _dict_state(world)
+        return _run_months(lambda: monthly_civ_update(civs, world["biome_ids"], world["map_width"],
+                                                      world["map_height"], map_ownership), months)
+    return setup
+
+
+def _grid_update_case(world, months, economy=False):
+    def setup():
+        table, ownership, land_mask, rng = _grid_state(world)
+        stocks = Economy.from_world(world, ownership) if economy else None
+        return _run_months(lambda: monthly_grid_update(table, ownership, land_mask, rng, economy=stocks), months)
+    return setup
+
+
+def _parallel_tick_case(world, workers, months):
+    def setup():
+        table, ownership, land_mask, _ = _grid_state(world)
+
+        def run():
+            # Pool start-up is part of the measurement
+            with ParallelTick(ownership, land_mask, BENCH_SEED, len(table), workers=workers) as tick:
+                for _ in range(months):
+                    tick.step(table)
+        return run
+    return setup
+
+
+def _nomad_case(world, num_groups, months):
+    def setup():
+        habitat = HabitabilityMap(world["biome_ids"], world["food_map"], world["wood_map"], world["minerals_map"])
+        groups = NomadGroups.spawn(habitat.land_mask, num_groups, np.random.default_rng(BENCH_SEED))
+        return _run_months(lambda: nomad_step(groups, habitat), months)
+    return setup
+
+
+def _diplomacy_case(world, num_civs):
+    def setup():
+        civs = _spawn(world, num_civs)
+        relations = init_diplomacy(civs)
+        return lambda: update_diplomacy(civs, relations)
+    return setup
+
+
+def _diplomacy_states_case(world, num_civs):
+    def setup():
+        civs = _spawn(world, num_civs)
+        states = init_diplomacy_states(num_civs)
+        rng = np.random.default_rng(BENCH_SEED)
+        return lambda: update_diplomacy_states(civs, states, rng)
+    return setup
+
+
+def _export_case(world, export_format):
+    def setup():
+        civs, map_ownership = _dict_state(world)
+        relations = init_diplomacy_states(len(civs))
+        output_dir = tempfile.mkdtemp(prefix="atgs-bench-")
+        atexit.register(shutil.rmtree, output_dir, ignore_errors=True)
+
+        def run():
+            if export_format == "binary":
+                write_binary_world(output_dir, world, civs, ownership_to_array(map_ownership), relations=relations)
+                return
+            export_json(world, civs, map_ownership, relations, output_dir)
+        return run
+    return setup
+
+
+def build_cases(world):
+    cases = [
+        ("generate_noise_map", {}, _noise_case(world)),
+        ("classify_biome", {}, _classify_case(world)),
+        ("hydrology", {}, _hydrology_case(world)),
+        ("hydrology", {"erosion_iterations": 5}, _hydrology_case(world, 5)),
+        ("spawn_civs", {"civs": 15}, _spawn_case(world)),
+        ("monthly_civ_update", {"months": 1}, _civ_update_case(world, 1)),
+        ("monthly_civ_update", {"months": 360}, _civ_update_case(world, 360)),
+        ("monthly_grid_update", {"months": 1}, _grid_update_case(world, 1)),
+        ("monthly_grid_update", {"months": 360}, _grid_update_case(world, 360)),
+        ("monthly_grid_update", {"months": 360, "economy": True}, _grid_update_case(world, 360, economy=True)),
+    ]
+    for workers in TICK_WORKER_COUNTS:
+        cases.append(("parallel_tick", {"workers": workers, "months": 360}, _parallel_tick_case(world, workers, 360)))
+    for num_groups in NOMAD_GROUP_COUNTS:
+        cases.append(("nomad_step", {"groups": num_groups, "months": 12}, _nomad_case(world, num_groups, 12)))
+    for num_civs in DIPLOMACY_CIV_COUNTS:
+        cases.append(("update_diplomacy", {"civs": num_civs}, _diplomacy_case(world, num_civs)))
+        cases.append(("update_diplomacy_states", {"civs": num_civs}, _diplomacy_states_case(world, num_civs)))
+    cases.append(("export", {"format": "json"}, _export_case(world, "json")))
+    cases.append(("export", {"format": "binary"}, _export_case(world, "binary")))
+    return cases
+
+
+def case_key(result):
+    params = ",".join(f"{key}={value}" for key, value in sorted(result["params"].items()))
+    return f'{result["size"]}/{result["name"]}' + (f"[{params}]" if params else "")
+
+
+def measure(setup, repeat, trace_memory):
+    """Best wall time of repeat runs, then one run under tracemalloc for the peak."""
+    times = []
+    for _ in range(repeat):
+        run = setup()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    peak_mb = None
+    if trace_memory:
+        # Separate run, tracemalloc slows down allocation-heavy Python code
+        tracemalloc.start()
+        run = setup()
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_mb = round((peak - before) / 1024 ** 2, 3)
+
+    return min(times), peak_mb
+
+
+def run_benchmarks(sizes, repeat=DEFAULT_REPEAT, only=None, trace_memory=True, use_cache=True):
+    results = []
+    for size in sizes:
+        width, height = SIZES[size]
+        print(f"== {size} ({width}x{height}) ==")
+        if use_cache:
+            world = load_or_generate_world(BENCH_SEED, width, height)
+        else:
+            world = world_generation.generate_world(width, height, seed=BENCH_SEED)
+
+        for name, params, setup in build_cases(world):
+            if only and not any(name.startswith(prefix) for prefix in only):
+                continue
+            seconds, peak_mb = measure(setup, repeat, trace_memory)
+            result = {"size": size, "name": name, "params": params, "seconds": round(seconds, 6),
+                      "peak_mb": peak_mb, "repeat": repeat}
+            results.append(result)
+            memory = f", peak {peak_mb:.1f} MB" if peak_mb is not None else ""
+            print(f"{case_key(result):55s} {seconds:10.4f} s{memory}")
+    return results
+
+
+def compare(results, baseline, threshold, min_delta=DEFAULT_MIN_DELTA):
+    """
+    Prints the ratio to the baseline per case and returns the keys of the
+    regressions: cases more than threshold and more than min_delta seconds slower.
+    """
+    baseline_by_key = {case_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        key = case_key(result)
+        old = baseline_by_key.get(key)
+        if old is None:
+            print(f"{key:55s} (not in baseline)")
+            continue
+        ratio = result["seconds"] / old["seconds"] if old["seconds"] > 0 else float("inf")
+        flag = ""
+        if ratio > 1 + threshold and result["seconds"] - old["seconds"] > min_delta:
+            flag = "  REGRESSION"
+            regressions.append(key)
+        elif ratio < 1 - threshold:
+            flag = "  faster"
+        print(f"{key:55s} {old['seconds']:10.4f} s -> {result['seconds']:10.4f} s  x{ratio:.2f}{flag}")
+    return regressions
+
+
+def machine_info():
+    return {
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "seed": BENCH_SEED,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time world generation, the simulation tick, diplomacy and export.")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(SIZES),
+                        help="map sizes to run (default: all)")
+    parser.add_argument("--only", nargs="+", default=None,
+                        help="only run cases whose name starts with one of these prefixes")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help=f"timed runs per case, the best one is kept (default {DEFAULT_REPEAT})")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run for peak memory")
+    parser.add_argument("--no-cache", action="store_true", help="regenerate the benchmark worlds")
+    parser.add_argument("--output", default=DEFAULT_RESULTS_FILE, help="results file (JSON)")
+    parser.add_argument("--baseline", default=None,
+                        help="results file to compare against; exits with 1 if a case got slower")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="relative slowdown that counts as a regression (default 0.10)")
+    parser.add_argument("--min-delta", type=float, default=DEFAULT_MIN_DELTA,
+                        help=f"seconds a case must also lose to count as a regression (default {DEFAULT_MIN_DELTA})")
+    args = parser.parse_args()
+
+    # Read the baseline first, it may be the file the results are written to
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    results = run_benchmarks(args.sizes, repeat=args.repeat, only=args.only,
+                             trace_memory=not args.no_memory, use_cache=not args.no_cache)
+
+    regressions = []
+    if baseline is not None:
+        print(f"\nComparison with {args.baseline} (threshold {args.threshold:.0%}):")
+        regressions = compare(results, baseline, args.threshold, args.min_delta)
+
+    # A partial run (--only, fewer sizes) updates its cases and keeps the others of an existing file
+    if (args.only or set(args.sizes) != set(SIZES)) and os.path.exists(args.output):
+        with open(args.output, 'r', encoding='utf-8') as f:
+            previous = json.load(f)["results"]
+        rerun = {case_key(result) for result in results}
+        results = [result for result in previous if case_key(result) not in rerun] + results
+
+    # Write to a temporary file and rename, so an interrupted run never leaves a half-written baseline
+    temp_path = args.output + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({"machine": machine_info(), "results": results}, f, indent=2)
+    os.replace(temp_path, args.output)
+    print("Results written to", args.output)
+
+    if regressions:
+        print(f"{len(regressions)} regression(s)")
+        sys.exit(1)
@@ -0,0 +1,76 @@
+import numpy as np
+
+# Biome-ID Tabelle: Index in BIOME_NAMES == uint8-Wert im Biome-Raster
+# Lake und River werden nicht aus den Schwellenwerten, sondern aus der Hydrologie bestimmt
+BIOME_NAMES = ['Ocean', 'Beach', 'Desert', 'Swamp', 'Grassland', 'Forest', 'Snow', 'Taiga', 'Tundra', 'Lake', 'River']
+BIOME_IDS = {name: biome_id for biome_id, name in enumerate(BIOME_NAMES)}
+
+OCEAN = BIOME_IDS['Ocean']
+BEACH = BIOME_IDS['Beach']
+DESERT = BIOME_IDS['Desert']
+SWAMP = BIOME_IDS['Swamp']
+GRASSLAND = BIOME_IDS['Grassland']
+FOREST = BIOME_IDS['Forest']
+SNOW = BIOME_IDS['Snow']
+TAIGA = BIOME_IDS['Taiga']
+TUNDRA = BIOME_IDS['Tundra']
+LAKE = BIOME_IDS['Lake']
+RIVER = BIOME_IDS['River']
+
+BIOME_COLORS = {
+    'Ocean': [0, 0, 128],
+    'Beach': [238, 214, 175],
+    'Desert': [210, 180, 140],
+    'Swamp': [47, 79, 47],
+    'Grassland': [124, 252, 0],
+    'Forest': [34, 139, 34],
+    'Snow': [255, 250, 250],
+    'Taiga': [0, 100, 0],
+    'Tundra': [176, 196, 222],
+    'Lake': [65, 105, 225],
+    'River': [30, 144, 255],
+}
+
+# ID -> RGB, z.B. BIOME_COLOR_TABLE[biome_ids] ergibt direkt ein (h, w, 3) Bild
+BIOME_COLOR_TABLE = np.array([BIOME_COLORS[name] for name in BIOME_NAMES], dtype=np.uint8)
+
+
+def classify_biome_ids(height_map, temp_map, moist_map, sea_level):
+    """
+    Biome classification of whole maps: returns a uint8 biome-ID array (first
+    matching condition wins; Lake and River are added by add_water_biomes).
+    """
+    h = np.asarray(height_map)
+    t = np.asarray(temp_map)
+    m = np.asarray(moist_map)
+
+    conditions = [
+        h < sea_level,
+        h < sea_level + 0.05,
+        (t > 0.7) & (m < 0.3),
+        (t > 0.7) & (m > 0.7),
+        t > 0.7,
+        (t > 0.4) & (m < 0.3),
+        t > 0.4,
+        h > 0.8,
+        m > 0.5,
+    ]
+    choices = [OCEAN, BEACH, DESERT, SWAMP, GRASSLAND, GRASSLAND, FOREST, SNOW, TAIGA]
+    return np.select(conditions, choices, default=TUNDRA).astype(np.uint8)
+
+
+def add_water_biomes(biome_ids, lake_map, river_map):
+    """
+    Marks the lake and river tiles of the hydrology layers in a copy of the
+    biome-ID array; ocean tiles stay ocean.
+    """
+    biome_ids = np.array(biome_ids, dtype=np.uint8)
+    land = biome_ids != OCEAN
+    biome_ids[land & (np.asarray(river_map) != 0)] = RIVER
+    biome_ids[land & (np.asarray(lake_map) != 0)] = LAKE
+    return biome_ids
+
+
+def biome_names_grid(biome_ids):
+    """Builds the legacy list-of-lists of biome name strings from an ID array."""
+    return np.array(BIOME_NAMES, dtype=object)[biome_ids].tolist()
@@ -0,0 +1,149 @@
+import json
+import os
+import numpy as np
+from civ_table import CivTable
+
+# Periodic checkpoints of the grid engine state, so long runs can be resumed.
+#
+# Every checkpoint is one compressed .npz file: the CivTable/CityTable columns,
+# the diplomacy state vector, the generator state, the ownership grid and the
+# arrays of optional simulation parts (anything with a to_arrays() method, e.g.
+# economy.Economy); those are small or change everywhere, so they are always
+# stored whole.
+# Only every full_every-th checkpoint stores the whole ownership grid; the ones
+# in between store the tiles that changed since that full checkpoint
+# (flat index + new owner). checkpoint.json names the newest checkpoint and the
+# full one it is based on; it is replaced last, so a crash while writing leaves
+# the previous checkpoint intact.
+
+MANIFEST_NAME = "checkpoint.json"
+CHECKPOINT_VERSION = 1
+DEFAULT_FULL_EVERY = 10
+
+
+def _write_atomic(path, write):
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class Checkpointer:
+    """Writes a checkpoint every every_months months (call maybe_save after each month)."""
+
+    def __init__(self, directory, every_months, seed, map_width, map_height, full_every=DEFAULT_FULL_EVERY,
+                 erosion_iterations=0, world_key=None):
+        self.directory = directory
+        self.every_months = every_months
+        self.seed = seed
+        self.map_width = map_width
+        self.map_height = map_height
+        # Everything besides the seed that shapes the terrain, so a resume can check it runs on the same world
+        self.erosion_iterations = erosion_iterations
+        self.world_key = world_key
+        self.full_every = full_every
+        self._count = 0
+        self._base_ownership = None
+        self._base_file = None
+        os.makedirs(directory, exist_ok=True)
+        # Files of an earlier (or the resumed) run go away with the first full checkpoint
+        self._files = sorted(name for name in os.listdir(directory)
+                             if name.startswith("month_") and name.endswith(".npz"))
+
+    def maybe_save(self, month, table, ownership, relations, rng, parts=()):
+        if self.every_months and month % self.every_months == 0:
+            self.save(month, table, ownership, relations, rng, parts)
+
+    def save(self, month, table, ownership, relations, rng, parts=()):
+        full = self._base_ownership is None or self._count % self.full_every == 0
+        self._count += 1
+
+        arrays = table.to_arrays()
+        arrays["relations"] = relations
+        arrays["rng_state"] = np.array(json.dumps(rng.bit_generator.state))
+        for part in parts:
+            arrays.update(part.to_arrays())
+        if full:
+            arrays["ownership"] = ownership
+        else:
+            changed = np.flatnonzero(ownership.ravel() != self._base_ownership.ravel())
+            arrays["changed_tiles"] = changed.astype(np.uint32)
+            arrays["changed_owners"] = ownership.ravel()[changed]
+
+        file_name = f"month_{month:06d}_{'full' if full else 'delta'}.npz"
+        _write_atomic(os.path.join(self.directory, file_name), lambda f: np.savez_compressed(f, **arrays))
+
+        previous_files = []
+        if full:
+            previous_files = [name for name in self._files if name != file_name]
+            self._files = []
+            self._base_ownership = ownership.copy()
+            self._base_file = file_name
+        self._files.append(file_name)
+
+        manifest = {
+            "version": CHECKPOINT_VERSION,
+            "engine": "grid",
+            "seed": self.seed,
+            "map_width": self.map_width,
+            "map_height": self.map_height,
+            "erosion_iterations": self.erosion_iterations,
+            "world_key": self.world_key,
+            "month": month,
+            "file": file_name,
+            "base_file": self._base_file,
+        }
+        _write_atomic(os.path.join(self.directory, MANIFEST_NAME),
+                      lambda f: f.write(json.dumps(manifest, indent=2).encode('utf-8')))
+
+        # Older checkpoints are only removed once the manifest points past them
+        for old_file in previous_files:
+            try:
+                os.remove(os.path.join(self.directory, old_file))
+            except OSError:
+                pass
+        print(f"checkpoint: month {month} written ({'full' if full else 'delta'})")
+
+
+def read_manifest(directory):
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"No checkpoint found in {directory}")
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_checkpoint(directory):
+    """
+    Restores the newest checkpoint. Returns a dict with month, seed, the world
+    parameters, table, ownership, relations, rng (a Generator in the saved state)
+    and arrays, everything the checkpoint file holds (for the optional parts).
+    """
+    manifest = read_manifest(directory)
+    with np.load(os.path.join(directory, manifest["base_file"])) as base:
+        ownership = base["ownership"].copy()
+    with np.load(os.path.join(directory, manifest["file"])) as data:
+        arrays = {name: data[name] for name in data.files}
+
+    if "changed_tiles" in arrays:
+        ownership.ravel()[arrays["changed_tiles"]] = arrays["changed_owners"]
+
+    rng = np.random.default_rng()
+    rng.bit_generator.state = json.loads(arrays["rng_state"].item())
+
+    return {
+        "month": manifest["month"],
+        "seed": manifest["seed"],
+        "map_width": manifest["map_width"],
+        "map_height": manifest["map_height"],
+        # Checkpoints written before erosion existed ran on uneroded worlds
+        "erosion_iterations": manifest.get("erosion_iterations", 0),
+        "world_key": manifest.get("world_key"),
+        "table": CivTable.from_arrays(arrays),
+        "ownership": ownership,
+        "relations": arrays["relations"].copy(),
+        "rng": rng,
+        "arrays": arrays,
+    }
@@ -1,4 +1,6 @@
 import random
+from biomes import OCEAN
+from instrumentation import span
 
 civ_profiles = {
     "Emberborn": {
@@ -77,7 +79,7 @@ def create_civ(profile_name, x, y):
     }
     return civ
 
-def spawn_civs(biome_map, map_width, map_height, num_civs=15):
+def spawn_civs(biome_ids, map_width, map_height, num_civs=15):
     civs = []
     taken = set()
 
@@ -85,15 +87,23 @@ def spawn_civs(biome_map, map_width, map_height, num_civs=15):
         while True:
             x = random.randint(0, map_width - 1)
             y = random.randint(0, map_height - 1)
-            if biome_map[y][x] != 'Ocean' and (x, y) not in taken:
+            if biome_ids[y, x] != OCEAN and (x, y) not in taken:
                 taken.add((x, y))
                 break
 
         civ = {
             "id": civ_id,
             "name": f"Civ{civ_id}",
+            # Capital location, as used by diplomacy
+            "x": x,
+            "y": y,
             "territory": {(x, y)},
+            # Owned tiles that may still border unowned land
+            "frontier": {(x, y)},
             "cities": [{"location": (x, y), "population": 500}],
+            # Territory tiles without a city, for O(1) city placement
+            "open_tiles": [],
+            "open_tile_index": {},
         }
 
         civs.append(civ)
@@ -101,6 +111,72 @@ def spawn_civs(biome_map, map_width, map_height, num_civs=15):
     return civs
 
 
+# Bookkeeping keys that are rebuilt on demand and never exported
+INTERNAL_CIV_KEYS = ("frontier", "open_tiles", "open_tile_index")
+
+# How often a city placement is retried before giving up for this month
+CITY_PLACEMENT_ATTEMPTS = 8
+
+
+def _init_open_tiles(civ):
+    city_locations = {city["location"] for city in civ["cities"]}
+    civ["open_tiles"] = [tile for tile in civ["territory"] if tile not in city_locations]
+    civ["open_tile_index"] = {tile: i for i, tile in enumerate(civ["open_tiles"])}
+
+
+def _add_open_tile(civ, tile):
+    civ["open_tile_index"][tile] = len(civ["open_tiles"])
+    civ["open_tiles"].append(tile)
+
+
+def _remove_open_tile(civ, tile):
+    # Swap-remove: move the last tile into the freed slot
+    open_tiles = civ["open_tiles"]
+    open_tile_index = civ["open_tile_index"]
+    i = open_tile_index.pop(tile)
+    last = open_tiles.pop()
+    if last != tile:
+        open_tiles[i] = last
+        open_tile_index[last] = i
+
+
+def _hash_cell(tile, cell_size):
+    return (tile[0] // cell_size, tile[1] // cell_size)
+
+
+def build_city_hash(civs, cell_size):
+    """Spatial hash of all city locations, bucketed into cell_size x cell_size cells."""
+    city_hash = {}
+    for civ in civs:
+        for city in civ["cities"]:
+            city_hash.setdefault(_hash_cell(city["location"], cell_size), []).append(city["location"])
+    return city_hash
+
+
+def _city_too_close(city_hash, tile, min_spacing):
+    # Cells are min_spacing wide, so only the 3x3 block around the tile can conflict
+    cx, cy = _hash_cell(tile, min_spacing)
+    for hx in range(cx - 1, cx + 2):
+        for hy in range(cy - 1, cy + 2):
+            for (ox, oy) in city_hash.get((hx, hy), ()):
+                if (ox - tile[0]) ** 2 + (oy - tile[1]) ** 2 < min_spacing ** 2:
+                    return True
+    return False
+
+
+def _pick_city_tile(civ, min_spacing, city_hash):
+    open_tiles = civ["open_tiles"]
+    if not open_tiles:
+        return None
+    if not min_spacing:
+        return random.choice(open_tiles)
+    for _ in range(CITY_PLACEMENT_ATTEMPTS):
+        tile = random.choice(open_tiles)
+        if not _city_too_close(city_hash, tile, min_spacing):
+            return tile
+    return None
+
+
 def get_adjacent_tiles(x, y, map_width, map_height):
     deltas = [(-1, 0), (1, 0), (0, -1), (0, 1)]
     for dx, dy in deltas:
@@ -109,30 +185,67 @@ def get_adjacent_tiles(x, y, map_width, map_height):
             yield (nx, ny)
 
 
-def monthly_civ_update(civs, biome_map, map_width, map_height, map_ownership):
-    for civ in civs:
-        new_tiles = set()
-
-        for (tx, ty) in civ["territory"]:
-            for nx, ny in get_adjacent_tiles(tx, ty, map_width, map_height):
-                if map_ownership[ny][nx] is None and biome_map[ny][nx] != 'Ocean':
-                    if random.random() < 0.2:
-                        new_tiles.add((nx, ny))
-
-        for tile in new_tiles:
-            civ["territory"].add(tile)
-            map_ownership[tile[1]][tile[0]] = civ["id"]
-
-        if len(civ["territory"]) > len(civ["cities"]) * 20 and random.random() < 0.1:
-            open_tiles = [t for t in civ["territory"] if all(c["location"] != t for c in civ["cities"])]
-            if open_tiles:
-                new_city = {
-                    "location": random.choice(open_tiles),
-                    "population": 200
-                }
-                civ["cities"].append(new_city)
+def monthly_civ_update(civs, biome_ids, map_width, map_height, map_ownership, min_city_spacing=0,
+                       city_hash=None, recorder=None):
+    """
+    One month of expansion, city founding and population growth.
+    With min_city_spacing > 0 new cities keep that Euclidean distance to every
+    existing city; pass the same city_hash (see build_city_hash) every month to
+    avoid rebuilding it. A history.HistoryRecorder passed as recorder receives
+    the claimed tiles and founded cities.
+    """
+    if min_city_spacing and city_hash is None:
+        city_hash = build_city_hash(civs, min_city_spacing)
 
-        for city in civ["cities"]:
-            city["population"] = int(city["population"] * random.uniform(1.01, 1.05))
+    for civ in civs:
+        with span("expansion"):
+            new_tiles = set()
+            # Only frontier tiles can grow; interior tiles are skipped entirely.
+            # Tiles whose free neighbours were all claimed (by this civ or another)
+            # are pruned the next time they are visited.
+            frontier = civ.setdefault("frontier", set(civ["territory"]))
+            closed_tiles = []
+
+            for (tx, ty) in frontier:
+                has_free_neighbour = False
+                for nx, ny in get_adjacent_tiles(tx, ty, map_width, map_height):
+                    if map_ownership[ny][nx] is None and biome_ids[ny, nx] != OCEAN:
+                        has_free_neighbour = True
+                        if random.random() < 0.2:
+                            new_tiles.add((nx, ny))
+                if not has_free_neighbour:
+                    closed_tiles.append((tx, ty))
+
+            frontier.difference_update(closed_tiles)
+
+            if "open_tiles" not in civ:
+                _init_open_tiles(civ)
+
+            for tile in new_tiles:
+                civ["territory"].add(tile)
+                map_ownership[tile[1]][tile[0]] = civ["id"]
+                _add_open_tile(civ, tile)
+            frontier.update(new_tiles)
+            if recorder is not None:
+                recorder.record_claims(civ["id"], new_tiles)
+
+        with span("city_founding"):
+            if len(civ["territory"]) > len(civ["cities"]) * 20 and random.random() < 0.1:
+                location = _pick_city_tile(civ, min_city_spacing, city_hash)
+                if location is not None:
+                    new_city = {
+                        "location": location,
+                        "population": 200
+                    }
+                    civ["cities"].append(new_city)
+                    _remove_open_tile(civ, location)
+                    if recorder is not None:
+                        recorder.record_city(civ["id"], new_city)
+                    if min_city_spacing:
+                        city_hash.setdefault(_hash_cell(location, min_city_spacing), []).append(location)
+
+        with span("population_growth"):
+            for city in civ["cities"]:
+                city["population"] = int(city["population"] * random.uniform(1.01, 1.05))
 
-    return civs
\ No newline at end of file
+    return civs
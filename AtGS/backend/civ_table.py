@@ -0,0 +1,226 @@
+import numpy as np
+from civ import civ_profiles
+
+# Struct-of-arrays storage for civs and cities. Every attribute is one NumPy
+# column indexed by civ id (or city row), so monthly updates are single array
+# operations instead of loops over per-civ dicts.
+
+CULTURE_STATS = ["unity", "loyalty", "hygiene", "memory", "openness", "arcane_attunement"]
+RESOURCES = ["food", "wood", "minerals"]
+PROFILE_NAMES = list(civ_profiles)
+
+
+class CityTable:
+    """All cities of all civs; rows are append-only, columns grow by doubling."""
+
+    _COLUMNS = {"owner": np.int32, "x": np.int32, "y": np.int32, "population": np.int64}
+
+    def __init__(self, capacity=64):
+        self.size = 0
+        self._data = {name: np.zeros(capacity, dtype=dtype) for name, dtype in self._COLUMNS.items()}
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def owner(self):
+        return self._data["owner"][:self.size]
+
+    @property
+    def x(self):
+        return self._data["x"][:self.size]
+
+    @property
+    def y(self):
+        return self._data["y"][:self.size]
+
+    @property
+    def population(self):
+        return self._data["population"][:self.size]
+
+    def add_many(self, owners, xs, ys, populations):
+        count = len(owners)
+        needed = self.size + count
+        capacity = len(self._data["owner"])
+        if needed > capacity:
+            while capacity < needed:
+                capacity *= 2
+            for name, column in self._data.items():
+                grown = np.zeros(capacity, dtype=column.dtype)
+                grown[:self.size] = column[:self.size]
+                self._data[name] = grown
+
+        rows = slice(self.size, needed)
+        self._data["owner"][rows] = owners
+        self._data["x"][rows] = xs
+        self._data["y"][rows] = ys
+        self._data["population"][rows] = populations
+        self.size = needed
+
+    def grow_population(self, rng, low=1.01, high=1.05):
+        """int(population * uniform(low, high)) for every city at once."""
+        population = self.population
+        population[:] = (population * rng.uniform(low, high, self.size)).astype(np.int64)
+
+    def counts_by_owner(self, num_civs):
+        return np.bincount(self.owner, minlength=num_civs)
+
+    def population_by_owner(self, num_civs):
+        return np.bincount(self.owner, weights=self.population, minlength=num_civs)
+
+    def to_arrays(self, prefix="city_"):
+        return {prefix + name: getattr(self, name).copy() for name in self._COLUMNS}
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix="city_"):
+        size = len(arrays[prefix + "owner"])
+        table = cls(capacity=max(64, size))
+        table.add_many(*(arrays[prefix + name] for name in cls._COLUMNS))
+        return table
+
+
+class CivView:
+    """Attribute access to one row of a CivTable, e.g. table.view(3).population."""
+
+    __slots__ = ("_table", "_index")
+
+    def __init__(self, table, index):
+        object.__setattr__(self, "_table", table)
+        object.__setattr__(self, "_index", index)
+
+    def __getattr__(self, name):
+        if name == "culture":
+            return dict(zip(CULTURE_STATS, self._table.culture[self._index].tolist()))
+        if name == "resources":
+            return dict(zip(RESOURCES, self._table.resources[self._index].tolist()))
+        if name == "type":
+            return PROFILE_NAMES[self._table.profile[self._index]]
+        if name == "name":
+            return self._table.names[self._index]
+        if name in CivTable.SCALAR_COLUMNS:
+            return getattr(self._table, name)[self._index].item()
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if name not in CivTable.SCALAR_COLUMNS:
+            raise AttributeError(f"{name} is not a writable civ column")
+        getattr(self._table, name)[self._index] = value
+
+
+class CivTable:
+    """Columns for all civs; the row index is the civ id."""
+
+    SCALAR_COLUMNS = ("id", "x", "y", "population", "tech_level", "nomadic", "territory_size")
+
+    def __init__(self, num_civs):
+        self.id = np.arange(num_civs, dtype=np.int32)
+        self.names = [f"Civ{civ_id}" for civ_id in range(num_civs)]
+        self.profile = np.zeros(num_civs, dtype=np.int8)
+        self.x = np.zeros(num_civs, dtype=np.int32)
+        self.y = np.zeros(num_civs, dtype=np.int32)
+        self.population = np.zeros(num_civs, dtype=np.int64)
+        self.culture = np.zeros((num_civs, len(CULTURE_STATS)), dtype=np.float64)
+        self.resources = np.zeros((num_civs, len(RESOURCES)), dtype=np.float64)
+        self.tech_level = np.ones(num_civs, dtype=np.int16)
+        self.nomadic = np.zeros(num_civs, dtype=bool)
+        self.territory_size = np.zeros(num_civs, dtype=np.int64)
+        self.cities = CityTable()
+
+    def __len__(self):
+        return len(self.id)
+
+    def view(self, civ_id):
+        return CivView(self, civ_id)
+
+    def __iter__(self):
+        return (CivView(self, civ_id) for civ_id in range(len(self)))
+
+    @classmethod
+    def from_civ_dicts(cls, civs, rng):
+        """
+        Builds the table from spawn_civs output. Attributes spawn_civs does not set
+        (profile, population, culture, resources) are drawn like create_civ does.
+        """
+        num_civs = len(civs)
+        table = cls(num_civs)
+        table.names = [civ["name"] for civ in civs]
+        table.x[:] = [civ["x"] for civ in civs]
+        table.y[:] = [civ["y"] for civ in civs]
+        table.territory_size[:] = [len(civ["territory"]) for civ in civs]
+
+        table.profile[:] = rng.integers(0, len(PROFILE_NAMES), num_civs)
+        table.population[:] = rng.integers(100, 301, num_civs)
+        table.culture[:] = np.round(rng.uniform(0.4, 0.9, table.culture.shape), 2)
+        table.resources[:, 0] = rng.integers(100, 201, num_civs)
+        table.resources[:, 1:] = rng.integers(50, 151, (num_civs, 2))
+
+        cities = [(civ["id"], city) for civ in civs for city in civ["cities"]]
+        table.cities.add_many([owner for owner, _ in cities],
+                              [city["location"][0] for _, city in cities],
+                              [city["location"][1] for _, city in cities],
+                              [city["population"] for _, city in cities])
+        return table
+
+    ARRAY_COLUMNS = ("id", "profile", "x", "y", "population", "culture", "resources", "tech_level", "nomadic",
+                     "territory_size")
+
+    def to_arrays(self):
+        """All columns as a flat dict of arrays (for np.savez), cities prefixed with city_."""
+        arrays = {name: getattr(self, name) for name in self.ARRAY_COLUMNS}
+        arrays["names"] = np.array(self.names)
+        arrays.update(self.cities.to_arrays())
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        table = cls(len(arrays["id"]))
+        for name in cls.ARRAY_COLUMNS:
+            getattr(table, name)[...] = arrays[name]
+        table.names = arrays["names"].tolist()
+        table.cities = CityTable.from_arrays(arrays)
+        return table
+
+    def to_civ_dicts(self, territories=None):
+        """Per-civ dicts in the export format, built from the columns."""
+        cities = self.cities
+        order = np.argsort(cities.owner, kind="stable")
+        bounds = np.searchsorted(cities.owner[order], np.arange(len(self) + 1))
+        xs, ys, pops = cities.x[order].tolist(), cities.y[order].tolist(), cities.population[order].tolist()
+
+        civs = []
+        for civ_id in range(len(self)):
+            profile = civ_profiles[PROFILE_NAMES[self.profile[civ_id]]]
+            start, end = bounds[civ_id], bounds[civ_id + 1]
+            civs.append({
+                "id": civ_id,
+                "name": self.names[civ_id],
+                "type": PROFILE_NAMES[self.profile[civ_id]],
+                "x": int(self.x[civ_id]),
+                "y": int(self.y[civ_id]),
+                "population": int(self.population[civ_id]),
+                "affinity": profile["affinity"],
+                "passive_traits": profile["passive_traits"],
+                "active_traits": profile["active_traits"],
+                "notes": profile["notes"],
+                "culture": dict(zip(CULTURE_STATS, self.culture[civ_id].tolist())),
+                "resources": dict(zip(RESOURCES, self.resources[civ_id].tolist())),
+                "tech_level": int(self.tech_level[civ_id]),
+                "nomadic": bool(self.nomadic[civ_id]),
+                "territory_size": int(self.territory_size[civ_id]),
+                "territory": territories[civ_id] if territories is not None else set(),
+                "cities": [{"location": (x, y), "population": population}
+                           for x, y, population in zip(xs[start:end], ys[start:end], pops[start:end])],
+            })
+        return civs
+
+
+def city_columns(civs):
+    """(owners, xs, ys, populations) of all cities, for a CivTable or a list of civ dicts."""
+    if isinstance(civs, CivTable):
+        cities = civs.cities
+        return cities.owner, cities.x, cities.y, cities.population
+    rows = [(civ["id"], city["location"][0], city["location"][1], city["population"])
+            for civ in civs for city in civ["cities"]]
+    owners, xs, ys, populations = zip(*rows) if rows else ((), (), (), ())
+    return (np.array(owners, dtype=np.int64), np.array(xs, dtype=np.int64), np.array(ys, dtype=np.int64),
+            np.array(populations, dtype=np.float64))
@@ -1,8 +1,18 @@
 import random
+import numpy as np
+from civ_table import CivTable, city_columns
 
 # Simple diplomacy states
 DIPLOMACY_STATES = ["Neutral", "Allied", "At War", "Truce"]
 
+# uint8 codes of the states above, used by the array-backed engine
+NEUTRAL = 0
+ALLIED = 1
+AT_WAR = 2
+TRUCE = 3
+
+CLOSE_DISTANCE = 50
+
 def init_diplomacy(civs):
     """Initialize a diplomacy matrix between civs as Neutral."""
     n = len(civs)
@@ -41,3 +51,109 @@ def update_diplomacy(civs, relations):
             elif state == "Truce" and random.random() < 0.005:
                 relations[(i,j)] = "Neutral"
     return relations
+
+
+# --- Array-backed engine ---------------------------------------------------
+# Relations of n civs are one condensed uint8 vector with an entry per pair
+# i < j (same order as np.triu_indices(n, 1)), so 1,000 civs take ~500 KB.
+
+
+def init_diplomacy_states(num_civs):
+    """All pairs start Neutral."""
+    return np.zeros(num_civs * (num_civs - 1) // 2, dtype=np.uint8)
+
+
+def pair_index(i, j, num_civs):
+    """Position of the pair (i, j), i < j, in the condensed state vector."""
+    return i * num_civs - i * (i + 1) // 2 + (j - i - 1)
+
+
+def _civ_locations(civs, capitals_only):
+    if isinstance(civs, CivTable):
+        if capitals_only:
+            return civs.id.astype(np.int64), civs.x.astype(np.int64), civs.y.astype(np.int64)
+        owners, xs, ys, _ = city_columns(civs)
+        return owners.astype(np.int64), xs.astype(np.int64), ys.astype(np.int64)
+    owners, xs, ys = [], [], []
+    for civ in civs:
+        cities = civ["cities"][:1] if capitals_only else civ["cities"]
+        for city in cities:
+            owners.append(civ["id"])
+            xs.append(city["location"][0])
+            ys.append(city["location"][1])
+    return np.array(owners, dtype=np.int64), np.array(xs, dtype=np.int64), np.array(ys, dtype=np.int64)
+
+
+def close_pair_indices(civs, max_distance=CLOSE_DISTANCE, capitals_only=False):
+    """
+    Condensed indices of all civ pairs with two cities (or capitals) closer than
+    max_distance (Manhattan). Locations are bucketed into max_distance-sized cells,
+    so only cities in neighbouring cells are ever compared.
+    """
+    num_civs = len(civs)
+    owners, xs, ys = _civ_locations(civs, capitals_only)
+    if owners.size < 2:
+        return np.zeros(0, dtype=np.int64)
+
+    cell_x = xs // max_distance + 1
+    cell_y = ys // max_distance + 1
+    stride = int(cell_y.max()) + 2
+    cell_key = cell_x * stride + cell_y
+    order = np.argsort(cell_key, kind="stable")
+    sorted_keys = cell_key[order]
+
+    found = []
+    # Own cell plus half of the neighbours, so every pair of cells is visited once
+    for dx, dy, same_cell in [(0, 0, True), (1, -1, False), (1, 0, False), (1, 1, False), (0, 1, False)]:
+        target = (cell_x + dx) * stride + (cell_y + dy)
+        lo = np.searchsorted(sorted_keys, target, side="left")
+        counts = np.searchsorted(sorted_keys, target, side="right") - lo
+        src = np.repeat(np.arange(owners.size), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        dst = order[np.repeat(lo, counts) + offsets]
+
+        keep = np.abs(xs[src] - xs[dst]) + np.abs(ys[src] - ys[dst]) < max_distance
+        keep &= owners[src] != owners[dst]
+        if same_cell:
+            keep &= src < dst
+        a = np.minimum(owners[src[keep]], owners[dst[keep]])
+        b = np.maximum(owners[src[keep]], owners[dst[keep]])
+        found.append(pair_index(a, b, num_civs))
+
+    return np.unique(np.concatenate(found))
+
+
+def update_diplomacy_states(civs, states, rng, close_pairs=None):
+    """
+    Vectorized update_diplomacy: the same transition probabilities, applied to all
+    pairs at once with one random draw per pair. close_pairs defaults to
+    close_pair_indices(civs).
+    """
+    if close_pairs is None:
+        close_pairs = close_pair_indices(civs)
+
+    close = np.zeros(states.size, dtype=bool)
+    close[close_pairs] = True
+    draws = rng.random(states.size)
+    new_states = states.copy()
+
+    # Close proximity
+    flips = close & (states == NEUTRAL) & (draws < 0.05)
+    new_states[flips] = np.where(rng.random(int(flips.sum())) < 0.5, ALLIED, AT_WAR)
+    new_states[close & (states == ALLIED) & (draws < 0.02)] = NEUTRAL
+    new_states[close & (states == AT_WAR) & (draws < 0.01)] = TRUCE
+
+    # Far civs tend to be neutral or truce
+    new_states[~close & (states == NEUTRAL) & (draws < 0.01)] = TRUCE
+    new_states[~close & (states == TRUCE) & (draws < 0.005)] = NEUTRAL
+
+    states[:] = new_states
+    return states
+
+
+def diplomacy_states_to_dict(states, num_civs, include_neutral=False):
+    """Converts the condensed vector to the {(i, j): "State"} form of init_diplomacy."""
+    iu, ju = np.triu_indices(num_civs, 1)
+    keep = slice(None) if include_neutral else states != NEUTRAL
+    return {(int(i), int(j)): DIPLOMACY_STATES[state]
+            for i, j, state in zip(iu[keep], ju[keep], states[keep])}
@@ -0,0 +1,177 @@
+import numpy as np
+from civ_table import RESOURCES
+
+# Monthly economy for the grid engine.
+#
+# Every owned tile holds a stock of food, wood and minerals, starting at the
+# generated resource layers (their capacity). Each month a civ harvests a fixed
+# share of the stock of all its tiles, the stocks regrow towards capacity, and
+# the food decides how fast the civ's cities grow. Ownership never reverts in
+# the grid engine, so only owned tiles are stored: compact columns that are
+# appended to as tiles are claimed. Unowned tiles are always at capacity.
+#
+# The harvest is a zonal sum per owner. Most tiles are kept sorted by owner, so
+# their sums are one np.add.reduceat over contiguous runs; tiles claimed since
+# the last sort are summed with np.bincount and merged into the sorted part
+# once they make up more than a quarter of it.
+
+RESOURCE_LAYERS = ["food_map", "wood_map", "minerals_map"]  # same order as civ_table.RESOURCES
+
+# Share of the stock harvested per month and share of the missing stock that regrows
+HARVEST_RATES = np.array([0.10, 0.05, 0.02], dtype=np.float32)
+REGROWTH_RATES = np.array([0.05, 0.02, 0.0], dtype=np.float32)
+# stock -> stock * KEEP_RATES + REGROWTH_RATES * capacity is harvest plus regrowth in one step
+KEEP_RATES = (1 - HARVEST_RATES) * (1 - REGROWTH_RATES)
+REGROWING = np.flatnonzero(REGROWTH_RATES > 0)
+
+FOOD_PER_CITIZEN = 0.002  # food per city inhabitant and month
+
+# Monthly city growth range when starving (0 % of the food demand met) and when fed
+STARVING_GROWTH = (0.97, 0.99)
+FED_GROWTH = (1.01, 1.05)
+
+# Unsorted tiles (relative to the sorted ones) that trigger a re-sort
+RESORT_FRACTION = 0.25
+
+
+class Economy:
+    """Resource stocks of all owned tiles as growable (resource, tile) columns."""
+
+    def __init__(self, resource_layers, ownership, capacity=1024):
+        self.layers = [np.asarray(layer).ravel() for layer in resource_layers]
+        self.size = 0
+        self._tiles = np.zeros(capacity, dtype=np.int64)
+        self._owners = np.zeros(capacity, dtype=np.int32)
+        self._stocks = np.zeros((len(self.layers), capacity), dtype=np.float32)
+        # REGROWTH_RATES * capacity of the layers that regrow
+        self._regrowth = np.zeros((REGROWING.size, capacity), dtype=np.float32)
+        self._sorted = 0     # the first _sorted tiles are ordered by owner
+        self._starts = None  # first sorted row of every owner
+
+        flat = ownership.ravel()
+        tiles = np.flatnonzero(flat >= 0)
+        self.add_tiles(tiles, flat[tiles])
+
+    @classmethod
+    def from_world(cls, world, ownership):
+        return cls([world[name] for name in RESOURCE_LAYERS], ownership)
+
+    def to_arrays(self, prefix="economy_"):
+        """The columns in their current order plus the sort state (for checkpoint.Checkpointer)."""
+        arrays = {
+            prefix + "tiles": self.tiles.copy(),
+            prefix + "owners": self.owners.copy(),
+            prefix + "stocks": self.stocks.copy(),
+            prefix + "sorted": np.array(self._sorted),
+        }
+        if self._starts is not None:
+            arrays[prefix + "starts"] = self._starts.copy()
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, world, arrays, prefix="economy_"):
+        """Restores to_arrays; the row order is kept, so the sums come out bit-identical."""
+        economy = cls([world[name] for name in RESOURCE_LAYERS], np.zeros(0, dtype=np.int32),
+                      capacity=max(1024, len(arrays[prefix + "tiles"])))
+        # Regrowth comes from the capacity, i.e. the layers, before the stocks are overwritten
+        economy.add_tiles(arrays[prefix + "tiles"], arrays[prefix + "owners"])
+        economy.stocks[...] = arrays[prefix + "stocks"]
+        economy._sorted = int(arrays[prefix + "sorted"])
+        if prefix + "starts" in arrays:
+            economy._starts = arrays[prefix + "starts"].copy()
+        return economy
+
+    @property
+    def tiles(self):
+        return self._tiles[:self.size]
+
+    @property
+    def owners(self):
+        return self._owners[:self.size]
+
+    @property
+    def stocks(self):
+        return self._stocks[:, :self.size]
+
+    def add_tiles(self, tiles, owners):
+        """Newly claimed flat tile indices; their stocks start full."""
+        needed = self.size + len(tiles)
+        if needed > self._tiles.size:
+            capacity = self._tiles.size
+            while capacity < needed:
+                capacity *= 2
+            self._tiles = np.resize(self._tiles, capacity)
+            self._owners = np.resize(self._owners, capacity)
+            self._stocks = np.pad(self._stocks, ((0, 0), (0, capacity - self._stocks.shape[1])))
+            self._regrowth = np.pad(self._regrowth, ((0, 0), (0, capacity - self._regrowth.shape[1])))
+
+        rows = slice(self.size, needed)
+        self._tiles[rows] = tiles
+        self._owners[rows] = owners
+        for k, layer in enumerate(self.layers):
+            self._stocks[k, rows] = layer[tiles]
+        self._regrowth[:, rows] = self._stocks[REGROWING, rows] * REGROWTH_RATES[REGROWING, None]
+        self.size = needed
+
+    def _sort(self, num_civs):
+        order = np.argsort(self.owners, kind="stable")
+        for column in (self._tiles, self._owners):
+            column[:self.size] = column[:self.size][order]
+        for columns in (self._stocks, self._regrowth):
+            columns[:, :self.size] = columns[:, :self.size][:, order]
+        self._sorted = self.size
+        self._starts = np.searchsorted(self.owners, np.arange(num_civs + 1))
+
+    def zonal_sums(self, num_civs):
+        """Stock per civ and resource, (num_civs, resources)."""
+        if self.size - self._sorted > RESORT_FRACTION * self._sorted:
+            self._sort(num_civs)
+        sums = np.zeros((num_civs, len(self.layers)))
+        if self._sorted:
+            starts = self._starts[:-1]
+            # reduceat sums [starts[i], starts[i + 1]), so only owners with tiles may contribute a start;
+            # the others stay 0
+            has_tiles = starts < self._starts[1:]
+            sums[has_tiles] = np.add.reduceat(self._stocks[:, :self._sorted], starts[has_tiles], axis=1).T
+        recent = slice(self._sorted, self.size)
+        for k in range(len(self.layers)):
+            sums[:, k] += np.bincount(self._owners[recent], weights=self._stocks[k, recent], minlength=num_civs)
+        return sums
+
+    def harvest(self, num_civs):
+        """
+        One month of harvest and regrowth on all owned tiles. Returns the harvest
+        per civ as a (num_civs, resources) array.
+        """
+        harvested = self.zonal_sums(num_civs) * HARVEST_RATES
+        stocks = self.stocks
+        stocks *= KEEP_RATES[:, None]
+        for row, k in enumerate(REGROWING):
+            stocks[k] += self._regrowth[row, :self.size]
+        return harvested
+
+    def layer(self, k):
+        """Current stock of resource k as a full (flat) map, unowned tiles at capacity."""
+        current = self.layers[k].copy()
+        current[self.tiles] = self.stocks[k]
+        return current
+
+
+def economy_step(table, economy):
+    """
+    Harvests into table.resources and feeds the cities from the food stockpile.
+    Returns the (low, high) growth factor range of every civ for CityTable.grow_population.
+    """
+    num_civs = len(table)
+    table.resources += economy.harvest(num_civs)
+
+    food = RESOURCES.index("food")
+    demand = table.cities.population_by_owner(num_civs) * FOOD_PER_CITIZEN
+    eaten = np.minimum(table.resources[:, food], demand)
+    table.resources[:, food] -= eaten
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fed = np.where(demand > 0, eaten / demand, 1.0)
+
+    low = STARVING_GROWTH[0] + (FED_GROWTH[0] - STARVING_GROWTH[0]) * fed
+    high = STARVING_GROWTH[1] + (FED_GROWTH[1] - STARVING_GROWTH[1]) * fed
+    return low, high
@@ -1,8 +1,9 @@
 import numpy as np
 import json
 import random
-from noise import pnoise2
 import os
+from world_generation import generate_noise_map as generate_fbm_map
+from biomes import BIOME_COLORS, OCEAN, biome_names_grid, classify_biome_ids
 # Use your target resolution here or pass it as args
 map_width = 1920
 map_height = 1080
@@ -16,52 +17,11 @@ variation_scale = 0.3
 num_civs = 15
 
 def generate_noise_map(width, height, scale, octaves, persistence, lacunarity, seed=0):
-    noise_map = np.zeros((height, width))
-    for y in range(height):
-        for x in range(width):
-            nx = x / scale
-            ny = y / scale
-            noise_map[y][x] = pnoise2(nx, ny, octaves=octaves, persistence=persistence,
-                                      lacunarity=lacunarity, repeatx=1024, repeaty=1024, base=seed)
-    # Normalize to [0,1]
-    noise_map = (noise_map - noise_map.min()) / (noise_map.max() - noise_map.min())
+    # Perlin noise (pnoise2) through the noise backends, normalized to [0,1]
+    noise_map = generate_fbm_map(width, height, scale, seed=seed, octaves_simplex=octaves,
+                                 persistence_simplex=persistence, lacunarity_simplex=lacunarity, backend="pnoise2")
     return noise_map.tolist()
 
-def classify_biome(h, t, m):
-    if h < sea_level:
-        return 'Ocean'
-    elif h < sea_level + 0.05:
-        return 'Beach'
-    else:
-        if t > 0.7:
-            if m < 0.3:
-                return 'Desert'
-            elif m > 0.7:
-                return 'Swamp'
-            else:
-                return 'Grassland'
-        elif t > 0.4:
-            if m < 0.3:
-                return 'Grassland'
-            else:
-                return 'Forest'
-        else:
-            if h > 0.8:
-                return 'Snow'
-            elif m > 0.5:
-                return 'Taiga'
-            else:
-                return 'Tundra'
-
-# Biome colors and traits same as before...
-
-import numpy as np
-import json
-import random
-from noise import pnoise2
-
-# (Your existing code here...)
-
 def main():
     seed = random.randint(0, 80)
     print(f"Generating world with seed: {seed}")
@@ -75,26 +35,9 @@ def main():
         lat_factor = 1 - abs((y / map_height) * 2 - 1)
         temp_map[y, :] *= lat_factor
 
-    biome_map = []
-    for y in range(map_height):
-        row = []
-        for x in range(map_width):
-            biome = classify_biome(height_map[y, x], temp_map[y, x], moist_map[y, x])
-            row.append(biome)
-        biome_map.append(row)
-
-    # Example biome colors dictionary
-    biome_colors = {
-        'Ocean': [0, 0, 128],
-        'Beach': [238, 214, 175],
-        'Desert': [210, 180, 140],
-        'Swamp': [47, 79, 47],
-        'Grassland': [124, 252, 0],
-        'Forest': [34, 139, 34],
-        'Snow': [255, 250, 250],
-        'Taiga': [0, 100, 0],
-        'Tundra': [176, 196, 222],
-    }
+    biome_ids = classify_biome_ids(height_map, temp_map, moist_map, sea_level)
+    biome_map = biome_names_grid(biome_ids)
+    biome_colors = BIOME_COLORS
 
     # Generate placeholder resources (food, wood, minerals) as arrays of floats, example:
     food_map = np.clip(height_map * 10, 0, 10).tolist()
@@ -107,7 +50,7 @@ def main():
     while len(civs) < 15 and attempts < 10000:
         x = random.randint(0, map_width-1)
         y = random.randint(0, map_height-1)
-        if biome_map[y][x] != 'Ocean':
+        if biome_ids[y, x] != OCEAN:
             civs.append({"x": x, "y": y})
         attempts += 1
 
@@ -0,0 +1,155 @@
+import numpy as np
+from instrumentation import span
+from economy import economy_step
+
+# Alternative simulation engine: ownership lives in one integer array
+# (-1 = unowned) and the monthly expansion runs for all civs at once.
+# Rules mirror civ.monthly_civ_update.
+
+UNOWNED = -1
+EXPAND_PROB = 0.2
+CITY_FOUND_PROB = 0.1
+TILES_PER_CITY = 20
+CITY_START_POPULATION = 200
+
+# Same neighbourhood as civ.get_adjacent_tiles: (dx, dy)
+NEIGHBOUR_DELTAS = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+
+
+def init_ownership_grid(civs, map_width, map_height, dtype=np.int32):
+    """Builds the ownership array from the civs' starting territory."""
+    ownership = np.full((map_height, map_width), UNOWNED, dtype=dtype)
+    for civ in civs:
+        for (x, y) in civ["territory"]:
+            ownership[y, x] = civ["id"]
+        civ["territory_size"] = len(civ["territory"])
+    return ownership
+
+
+def claim_tiles(padded, land_mask, rng, expand_prob=EXPAND_PROB):
+    """
+    Expansion claims for the inner tiles of padded, an ownership window with a
+    one-tile border of neighbours (UNOWNED outside the map). land_mask covers the
+    inner tiles. Returns (ys, xs, owners) relative to the inner part.
+    """
+    h, w = padded.shape[0] - 2, padded.shape[1] - 2
+    ownership = padded[1:-1, 1:-1]
+    neighbours = [padded[1 + dy:h + 1 + dy, 1 + dx:w + 1 + dx] for dx, dy in NEIGHBOUR_DELTAS]
+
+    has_owned_neighbour = neighbours[0] >= 0
+    for neighbour in neighbours[1:]:
+        has_owned_neighbour |= neighbour >= 0
+    ys, xs = np.nonzero(land_mask & (ownership == UNOWNED) & has_owned_neighbour)
+
+    best_key = np.full(ys.size, np.inf)
+    best_owner = np.full(ys.size, UNOWNED, dtype=ownership.dtype)
+    for neighbour in neighbours:
+        owner = neighbour[ys, xs]
+        key = rng.random(ys.size)
+        hit = (owner >= 0) & (key < expand_prob) & (key < best_key)
+        best_key[hit] = key[hit]
+        best_owner[hit] = owner[hit]
+
+    claimed = best_owner >= 0
+    return ys[claimed], xs[claimed], best_owner[claimed]
+
+
+def expansion_step(ownership, land_mask, rng, expand_prob=EXPAND_PROB):
+    """
+    One month of expansion for every civ at once.
+
+    Each free land tile gets one Bernoulli draw per owned neighbour, exactly like
+    the per-civ loop. If several neighbours succeed, the one with the smallest
+    draw wins, which is a uniform random tie-break that only depends on the rng.
+    Updates ownership in place and returns (ys, xs, owners) of the claimed tiles.
+    """
+    h, w = ownership.shape
+    padded = np.full((h + 2, w + 2), UNOWNED, dtype=ownership.dtype)
+    padded[1:-1, 1:-1] = ownership
+    ys, xs, owners = claim_tiles(padded, land_mask, rng, expand_prob)
+    ownership[ys, xs] = owners
+    return ys, xs, owners
+
+
+def _found_cities(founder_ids, table, ownership, rng, recorder=None):
+    """Places one city per founding civ on a random owned tile without a city, in one pass."""
+    _, w = ownership.shape
+    flat = ownership.ravel()
+    cities = table.cities
+
+    candidates = np.flatnonzero(np.isin(flat, founder_ids))
+    city_tiles = cities.y.astype(np.int64) * w + cities.x
+    candidates = candidates[np.isin(candidates, city_tiles, invert=True)]
+    if candidates.size == 0:
+        return
+
+    owners = flat[candidates]
+    keys = rng.random(candidates.size)
+    order = np.lexsort((keys, owners))
+    owners_sorted = owners[order]
+    first = np.ones(order.size, dtype=bool)
+    first[1:] = owners_sorted[1:] != owners_sorted[:-1]
+
+    tiles = candidates[order[first]]
+    new_owners = owners_sorted[first]
+    xs, ys = tiles % w, tiles // w
+    populations = np.full(tiles.size, CITY_START_POPULATION, dtype=np.int64)
+    cities.add_many(new_owners, xs, ys, populations)
+    if recorder is not None:
+        recorder.record_city_arrays(new_owners, xs, ys, populations)
+
+
+def monthly_grid_update(table, ownership, land_mask, rng, recorder=None, expand_prob=EXPAND_PROB, economy=None):
+    """
+    Grid counterpart of civ.monthly_civ_update (expansion, city founding, growth)
+    on a civ_table.CivTable. With an economy.Economy, city growth depends on the
+    food harvested from the civ's territory instead of being a flat 1-5 %.
+    """
+    num_civs = len(table)
+    with span("expansion"):
+        ys, xs, owners = expansion_step(ownership, land_mask, rng, expand_prob)
+        if recorder is not None:
+            recorder.record_claim_arrays(ys, xs, owners)
+        table.territory_size += np.bincount(owners, minlength=num_civs)
+        if economy is not None:
+            economy.add_tiles(ys.astype(np.int64) * ownership.shape[1] + xs, owners)
+
+    with span("city_founding"):
+        city_counts = table.cities.counts_by_owner(num_civs)
+        eligible = np.flatnonzero(table.territory_size > city_counts * TILES_PER_CITY)
+        founder_ids = eligible[rng.random(eligible.size) < CITY_FOUND_PROB]
+        if founder_ids.size:
+            _found_cities(founder_ids, table, ownership, rng, recorder=recorder)
+
+    if economy is not None:
+        with span("economy"):
+            low, high = economy_step(table, economy)
+
+    with span("population_growth"):
+        if economy is None:
+            table.cities.grow_population(rng)
+        else:
+            city_owners = table.cities.owner
+            table.cities.grow_population(rng, low[city_owners], high[city_owners])
+    return table
+
+
+def territories_from_grid(ownership, civs):
+    """Derives each civ's territory set of (x, y) tuples from the ownership array."""
+    ys, xs = np.nonzero(ownership >= 0)
+    owners = ownership[ys, xs]
+    order = np.argsort(owners, kind="stable")
+    owners, ys, xs = owners[order], ys[order], xs[order]
+
+    # civ ids are the row indices 0..n-1, for civ dicts as well as a CivTable
+    bounds = np.searchsorted(owners, np.arange(len(civs) + 1))
+    territories = {}
+    for civ_id in range(len(civs)):
+        start, end = bounds[civ_id], bounds[civ_id + 1]
+        territories[civ_id] = set(zip(xs[start:end].tolist(), ys[start:end].tolist()))
+    return territories
+
+
+def ownership_grid_to_lists(ownership):
+    """Converts the ownership array to the list-of-lists form with None for unowned tiles."""
+    return [[owner if owner >= 0 else None for owner in row] for row in ownership.tolist()]
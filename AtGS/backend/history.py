@@ -0,0 +1,137 @@
+import gzip
+import struct
+import numpy as np
+from world_export import ownership_to_array
+from civ_table import city_columns
+
+# Append-only simulation history: one gzip stream of little-endian records.
+#
+# File header:  magic "ATGH", version, map_width, map_height, keyframe_interval (months), seed (int64)
+# Record:       record_type, month, payload_length (bytes), reserved  -> then the payload
+#
+# MONTH payload (deltas from month - 1 to month):
+#   n_claims, n_cities, n_pops, reserved                       (uint32 x 4)
+#   claim_owners int32[n_claims], claim_tiles uint32[n_claims]
+#   city_owners int32[n_cities], city_tiles uint32[n_cities], city_pops float64[n_cities]
+#   pop_civs int32[n_pops], pop_values float64[n_pops]         (civs whose total population changed)
+#
+# KEYFRAME payload (full state after month months):
+#   n_civs, n_cities, reserved, reserved                       (uint32 x 4)
+#   ownership int32[map_height * map_width]  (-1 = unowned)
+#   city_owners int32[n_cities], city_tiles uint32[n_cities], city_pops float64[n_cities]
+#   pop_civs int32[n_civs], pop_values float64[n_civs]
+#
+# Tiles are packed as y * map_width + x.
+
+HISTORY_MAGIC = b"ATGH"
+HISTORY_VERSION = 2
+
+RECORD_MONTH = 1
+RECORD_KEYFRAME = 2
+
+_FILE_HEADER = struct.Struct("<4sIIIIq")
+_RECORD_HEADER = struct.Struct("<IIII")
+_COUNTS = struct.Struct("<IIII")
+
+
+class HistoryRecorder:
+    """
+    Collects the deltas of the running month and streams them to disk when the
+    month ends, so memory stays flat no matter how long the simulation runs.
+    """
+
+    def __init__(self, path, map_width, map_height, seed, keyframe_years=10):
+        if keyframe_years < 1:
+            raise ValueError(f"keyframe_years must be at least 1, got {keyframe_years}")
+        self.map_width = map_width
+        self.map_height = map_height
+        self.keyframe_interval = keyframe_years * 12
+        self._file = gzip.open(path, "wb")
+        # The seed lets a reader tell whether the history belongs to the world it loaded
+        self._file.write(_FILE_HEADER.pack(HISTORY_MAGIC, HISTORY_VERSION, map_width, map_height,
+                                           self.keyframe_interval, seed))
+        self._last_populations = None
+        self._reset_month()
+
+    def _reset_month(self):
+        self._claim_owners = []
+        self._claim_tiles = []
+        self._city_owners = []
+        self._city_tiles = []
+        self._city_pops = []
+
+    def record_claims(self, civ_id, tiles):
+        """Tiles claimed by one civ, as (x, y) tuples."""
+        for (x, y) in tiles:
+            self._claim_owners.append(civ_id)
+            self._claim_tiles.append(y * self.map_width + x)
+
+    def record_claim_arrays(self, ys, xs, owners):
+        """Tiles claimed by any civ, as parallel arrays (grid engine)."""
+        self._claim_owners.extend(owners.tolist())
+        self._claim_tiles.extend((ys * self.map_width + xs).tolist())
+
+    def record_city(self, civ_id, city):
+        x, y = city["location"]
+        self._city_owners.append(civ_id)
+        self._city_tiles.append(y * self.map_width + x)
+        self._city_pops.append(city["population"])
+
+    def record_city_arrays(self, owners, xs, ys, populations):
+        """Cities founded by any civ, as parallel arrays (grid engine)."""
+        self._city_owners.extend(owners.tolist())
+        self._city_tiles.extend((ys * self.map_width + xs).tolist())
+        self._city_pops.extend(populations.tolist())
+
+    def _civ_populations(self, civs):
+        owners, _, _, populations = city_columns(civs)
+        return np.bincount(owners, weights=populations, minlength=len(civs))
+
+    def _write_record(self, record_type, month, sections):
+        payload = b"".join(sections)
+        self._file.write(_RECORD_HEADER.pack(record_type, month, len(payload), 0))
+        self._file.write(payload)
+
+    def write_keyframe(self, month, civs, ownership):
+        ownership = ownership_to_array(ownership)
+        owners, xs, ys, city_pops = city_columns(civs)
+        populations = self._civ_populations(civs)
+        self._last_populations = populations
+
+        self._write_record(RECORD_KEYFRAME, month, [
+            _COUNTS.pack(len(populations), len(owners), 0, 0),
+            np.asarray(ownership, dtype="<i4").tobytes(),
+            np.asarray(owners, dtype="<i4").tobytes(),
+            np.asarray(ys * self.map_width + xs, dtype="<u4").tobytes(),
+            np.asarray(city_pops, dtype="<f8").tobytes(),
+            np.arange(len(populations), dtype="<i4").tobytes(),
+            populations.astype("<f8").tobytes(),
+        ])
+        # Keyframes are the natural resume points for a reader, so push them out
+        self._file.flush()
+
+    def end_month(self, month, civs, ownership):
+        """Writes the deltas of month (1-based) and a keyframe if one is due."""
+        populations = self._civ_populations(civs)
+        changed = np.arange(len(populations))
+        if self._last_populations is not None:
+            changed = np.flatnonzero(populations != self._last_populations)
+        self._last_populations = populations
+
+        self._write_record(RECORD_MONTH, month, [
+            _COUNTS.pack(len(self._claim_tiles), len(self._city_tiles), len(changed), 0),
+            np.array(self._claim_owners, dtype="<i4").tobytes(),
+            np.array(self._claim_tiles, dtype="<u4").tobytes(),
+            np.array(self._city_owners, dtype="<i4").tobytes(),
+            np.array(self._city_tiles, dtype="<u4").tobytes(),
+            np.array(self._city_pops, dtype="<f8").tobytes(),
+            changed.astype("<i4").tobytes(),
+            populations[changed].astype("<f8").tobytes(),
+        ])
+        self._reset_month()
+
+        if month % self.keyframe_interval == 0:
+            self.write_keyframe(month, civs, ownership)
+
+    def close(self):
+        self._file.close()
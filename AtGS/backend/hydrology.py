@@ -0,0 +1,245 @@
+import heapq
+import numpy as np
+from instrumentation import span
+
+# Rivers, lakes and erosion on the generated height map.
+#
+# Every land tile drains to its steepest lower D8 neighbour. Following these
+# receivers ends in a pit (a tile without lower neighbour); all tiles ending in
+# the same pit form a basin. Ocean and map edge tiles are outlets where the
+# water leaves and together form basin 0; all other basins are depressions that
+# fill up to their lowest pass.
+#
+# The priority flood runs on the basin graph instead of the tiles: two basins
+# are connected by their lowest shared border (pass height = higher of the two
+# border tiles), and a heap-ordered flood from basin 0 gives every
+# depression its spill level. Tiles below the spill level of their basin are
+# lake. Each filled pit then drains across its pass into the next basin, so
+# the receivers form a forest rooted in the sea. Flow accumulation sums the
+# precipitation down that forest level by level, deepest tiles first.
+#
+# Basin labels and tree depths use pointer jumping (log2 of the longest flow
+# path in whole-map gathers); only the basin graph, which is much smaller than
+# the map, is walked in Python. Everything else is O(N) NumPy work plus one
+# O(N log N) sort.
+
+# D8 neighbours (dy, dx) and the distance to them
+NEIGHBOURS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+NEIGHBOUR_DISTANCES = [np.sqrt(2) if dy and dx else 1.0 for dy, dx in NEIGHBOURS]
+# One direction of every neighbour pair, for the basin borders
+HALF_NEIGHBOURS = [(0, 1), (1, -1), (1, 0), (1, 1)]
+
+# Accumulated precipitation (moisture summed over the catchment) from which a tile is a river
+RIVER_DISCHARGE = 400.0
+# Water depth (in height units) below which a filled tile does not count as lake
+LAKE_MIN_DEPTH = 0.002
+
+# Stream-power erosion per iteration: K * sqrt(discharge) * slope
+EROSION_RATE = 0.0005
+# Share of a lake's depth that sediment fills per iteration
+SEDIMENT_RATE = 0.1
+
+
+def flow_receivers(height_map, outlet_mask):
+    """Flat index of the steepest lower D8 neighbour of every tile; pits and outlets point to themselves."""
+    map_height, map_width = height_map.shape
+    h = np.asarray(height_map, dtype=np.float32)
+    # Off-map neighbours are never chosen; the edge tiles themselves are outlets
+    padded = np.pad(h, 1, constant_values=np.inf)
+    tiles = np.arange(map_height * map_width, dtype=np.int32).reshape(map_height, map_width)
+
+    receivers = tiles.copy()
+    best_slope = np.zeros_like(h)
+    for (dy, dx), distance in zip(NEIGHBOURS, NEIGHBOUR_DISTANCES):
+        slope = h - padded[1 + dy:1 + dy + map_height, 1 + dx:1 + dx + map_width]
+        if distance != 1.0:
+            slope /= np.float32(distance)
+        better = slope > best_slope
+        best_slope[better] = slope[better]
+        receivers[better] = tiles[better] + (dy * map_width + dx)
+
+    receivers[outlet_mask] = tiles[outlet_mask]
+    return receivers.ravel()
+
+
+def _roots(receivers):
+    """Pointer jumping: the root every tile's receiver chain ends in."""
+    roots = receivers
+    while True:
+        jumped = roots[roots]
+        if np.array_equal(jumped, roots):
+            return roots
+        roots = jumped
+
+
+def _depths(receivers):
+    """Pointer jumping: number of receiver steps from every tile to its root."""
+    tiles = np.arange(receivers.size, dtype=np.int32)
+    depths = (receivers != tiles).astype(np.int32)
+    ancestors = receivers
+    while True:
+        jumped = ancestors[ancestors]
+        if np.array_equal(jumped, ancestors):
+            return depths
+        depths += depths[ancestors]
+        ancestors = jumped
+
+
+def _basin_borders(basins, height_map):
+    """Lowest pass between every pair of adjacent basins: (basin_a, basin_b, tile_a, tile_b, height)."""
+    map_height, map_width = height_map.shape
+    labels = basins.reshape(map_height, map_width)
+    tiles = np.arange(basins.size, dtype=np.int32).reshape(map_height, map_width)
+
+    parts = []
+    for dy, dx in HALF_NEIGHBOURS:
+        ys = slice(0, map_height - dy)
+        xs = slice(max(0, -dx), map_width - max(0, dx))
+        other_ys = slice(dy, map_height)
+        other_xs = slice(max(0, dx), map_width - max(0, -dx))
+        border = labels[ys, xs] != labels[other_ys, other_xs]
+        tile_a = tiles[ys, xs][border]
+        tile_b = tiles[other_ys, other_xs][border]
+        parts.append((tile_a, tile_b))
+    tile_a = np.concatenate([a for a, _ in parts])
+    tile_b = np.concatenate([b for _, b in parts])
+
+    flat = height_map.ravel()
+    pass_height = np.maximum(flat[tile_a], flat[tile_b])
+    basin_a = basins[tile_a].astype(np.int64)
+    basin_b = basins[tile_b].astype(np.int64)
+    pair = np.minimum(basin_a, basin_b) * (int(basins.max()) + 1) + np.maximum(basin_a, basin_b)
+
+    # Lowest pass per basin pair: sort by pair, then height, keep the first of each pair
+    order = np.lexsort((pass_height, pair))
+    first = order[np.r_[True, pair[order[1:]] != pair[order[:-1]]]]
+    return basin_a[first], basin_b[first], tile_a[first], tile_b[first], pass_height[first]
+
+
+def _flood_basins(num_basins, borders):
+    """
+    Priority flood over the basin graph from basin 0 (the outlets). Returns the
+    spill level of every basin (-inf for basin 0) and the tile across its outflow
+    pass (-1 for basin 0).
+    """
+    basin_a, basin_b, tile_a, tile_b, pass_height = borders
+    # Both directions: (from, to, tile in "from")
+    sources = np.concatenate([basin_a, basin_b])
+    targets = np.concatenate([basin_b, basin_a])
+    target_tiles = np.concatenate([tile_a, tile_b]).tolist()
+    heights = np.concatenate([pass_height, pass_height]).tolist()
+    order = np.argsort(sources, kind="stable")
+    starts = np.searchsorted(sources[order], np.arange(num_basins + 1)).tolist()
+    order = order.tolist()
+    targets = targets.tolist()
+
+    level = [np.inf] * num_basins
+    outflow = [-1] * num_basins
+    done = [False] * num_basins
+    level[0] = -np.inf
+    heap = [(-np.inf, 0)]
+
+    while heap:
+        current, basin = heapq.heappop(heap)
+        if done[basin]:
+            continue
+        done[basin] = True
+        for edge in order[starts[basin]:starts[basin + 1]]:
+            neighbour = targets[edge]
+            if done[neighbour]:
+                continue
+            spill = max(current, heights[edge])
+            if spill < level[neighbour]:
+                level[neighbour] = spill
+                # The water of the neighbour leaves into this basin
+                outflow[neighbour] = target_tiles[edge]
+                heapq.heappush(heap, (spill, neighbour))
+
+    return np.array(level, dtype=np.float32), np.array(outflow, dtype=np.int32)
+
+
+def _accumulate(receivers, precipitation):
+    """Flow accumulation: precipitation summed over every tile's catchment."""
+    depths = _depths(receivers)
+    order = np.argsort(depths, kind="stable")
+    ends = np.cumsum(np.bincount(depths))
+    discharge = precipitation.astype(np.float64).ravel()
+    # Deepest level first; a level's receivers all lie one level higher
+    for depth in range(len(ends) - 1, 0, -1):
+        tiles = order[ends[depth - 1]:ends[depth]]
+        np.add.at(discharge, receivers[tiles], discharge[tiles])
+    return discharge
+
+
+def route_water(height_map, precipitation, ocean_mask):
+    """
+    Depression filling, flow directions and accumulation in one pass. Returns the
+    filled height map, the flow receivers (filled pits drain across their pass) and
+    the discharge of every tile.
+    """
+    map_height, map_width = height_map.shape
+    h = np.asarray(height_map, dtype=np.float32)
+    outlets = ocean_mask.copy()
+    outlets[[0, -1], :] = True
+    outlets[:, [0, -1]] = True
+    receivers = flow_receivers(h, outlets)
+    tiles = np.arange(receivers.size, dtype=np.int32)
+
+    # All outlets form basin 0, every inland pit its own basin
+    pits = np.flatnonzero((receivers == tiles) & ~outlets.ravel())
+    pit_labels = np.zeros(receivers.size, dtype=np.int32)
+    pit_labels[pits] = np.arange(1, pits.size + 1, dtype=np.int32)
+    basins = pit_labels[_roots(receivers)]
+
+    levels, outflow = _flood_basins(pits.size + 1, _basin_borders(basins, h))
+    filled = np.maximum(h.ravel(), levels[basins]).reshape(map_height, map_width)
+
+    # Filled pits drain across their pass
+    receivers[pits] = outflow[1:]
+    discharge = _accumulate(receivers, precipitation)
+    return filled, receivers, discharge.reshape(map_height, map_width)
+
+
+def erode(height_map, precipitation, ocean_mask, sea_level, iterations):
+    """
+    Stream-power erosion: each iteration lowers every land tile by EROSION_RATE *
+    sqrt(discharge) * slope, never below its receiver or the sea level, and lets
+    sediment fill SEDIMENT_RATE of every lake's depth. Returns a new height map.
+    """
+    h = np.array(height_map, dtype=np.float32)
+    flat = h.ravel()
+    land = ~ocean_mask.ravel()
+    ys, xs = np.divmod(np.arange(flat.size, dtype=np.int32), h.shape[1])
+    for _ in range(iterations):
+        filled, receivers, discharge = route_water(h, precipitation, ocean_mask)
+        below = flat[receivers]
+        dy = np.abs(receivers // h.shape[1] - ys)
+        dx = np.abs(receivers % h.shape[1] - xs)
+        # Pits and filled pits draining across a pass have no downhill neighbour to cut towards
+        neighbour = land & (dy <= 1) & (dx <= 1) & (dy + dx > 0)
+        distance = np.where((dy == 1) & (dx == 1), np.sqrt(2), 1.0).astype(np.float32)
+        slope = (flat - below) / distance
+        cut = EROSION_RATE * np.sqrt(discharge.ravel()).astype(np.float32) * slope
+        lowered = np.maximum(np.maximum(flat - cut, below), np.float32(sea_level))
+        flat[neighbour] = lowered[neighbour]
+
+        depth = filled.ravel() - flat
+        flat[land] += SEDIMENT_RATE * depth[land]
+    return h
+
+
+def generate_hydrology(height_map, precipitation, sea_level, erosion_iterations=0):
+    """
+    Returns (height_map, lake_map, river_map): the height map after erosion (the
+    input itself without erosion) and uint8 masks of lake and river tiles.
+    """
+    ocean_mask = np.asarray(height_map) < sea_level
+    if erosion_iterations:
+        with span("generation.erosion"):
+            height_map = erode(height_map, precipitation, ocean_mask, sea_level, erosion_iterations)
+
+    with span("generation.hydrology"):
+        filled, _, discharge = route_water(height_map, precipitation, ocean_mask)
+        lakes = (filled - height_map > LAKE_MIN_DEPTH) & ~ocean_mask
+        rivers = (discharge >= RIVER_DISCHARGE) & ~ocean_mask & ~lakes
+    return height_map, lakes.astype(np.uint8), rivers.astype(np.uint8)
@@ -0,0 +1,200 @@
+import cProfile
+import csv
+import json
+import time
+import tracemalloc
+
+# Lightweight timing spans for generation, the monthly tick and the export.
+#
+#   with span("expansion"):
+#       ...
+#
+# While no Metrics object is enabled, span() returns a shared no-op context
+# manager, so the instrumented code pays one function call per span and
+# nothing else. enable() switches recording on for the whole process.
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+_active = None
+
+
+class _Span:
+    __slots__ = ("metrics", "name", "start", "mem_start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        if self.metrics.trace_memory:
+            self.mem_start = self.metrics._push_memory_span()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        peak = None
+        if self.metrics.trace_memory:
+            peak = self.metrics._pop_memory_span(self.mem_start)
+        self.metrics._record(self.name, seconds, peak)
+        return False
+
+
+class Metrics:
+    """
+    Collects span durations per (tick, name), optionally the tracemalloc peak of
+    each span and a cProfile of the ticks in profile_ticks = (first, last).
+    Spans outside of any tick (generation, export) are stored with tick None.
+    """
+
+    def __init__(self, trace_memory=False, profile_ticks=None, profile_path=None):
+        self.trace_memory = trace_memory
+        self.profile_ticks = profile_ticks
+        self.profile_path = profile_path
+        self.tick = None
+        # (tick, name) -> [count, seconds, peak bytes]
+        self._spans = {}
+        self._memory_stack = []
+        self._profiler = None
+
+    # --- spans ---
+
+    def _record(self, name, seconds, peak):
+        entry = self._spans.get((self.tick, name))
+        if entry is None:
+            self._spans[(self.tick, name)] = [1, seconds, peak]
+            return
+        entry[0] += 1
+        entry[1] += seconds
+        if peak is not None:
+            entry[2] = max(entry[2], peak)
+
+    def _push_memory_span(self):
+        # tracemalloc only keeps one global peak: hand the peak seen so far to
+        # the enclosing span before resetting it for this one
+        current, peak = tracemalloc.get_traced_memory()
+        if self._memory_stack:
+            self._memory_stack[-1] = max(self._memory_stack[-1], peak)
+        tracemalloc.reset_peak()
+        self._memory_stack.append(current)
+        return current
+
+    def _pop_memory_span(self, mem_start):
+        _, peak = tracemalloc.get_traced_memory()
+        peak = max(peak, self._memory_stack.pop())
+        if self._memory_stack:
+            self._memory_stack[-1] = max(self._memory_stack[-1], peak)
+        tracemalloc.reset_peak()
+        return peak - mem_start
+
+    # --- ticks ---
+
+    def begin_tick(self, tick):
+        """Marks the start of month tick; starts/stops the profiler at the profile_ticks bounds."""
+        self.tick = tick
+        if self.profile_ticks is None:
+            return
+        first, last = self.profile_ticks
+        if tick == first and self._profiler is None:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif tick == last + 1:
+            self._stop_profiler()
+
+    def end_ticks(self):
+        """Call after the last month, so export spans are not counted as a tick."""
+        self.tick = None
+        self._stop_profiler()
+
+    def _stop_profiler(self):
+        if self._profiler is None:
+            return
+        self._profiler.disable()
+        if self.profile_path:
+            self._profiler.dump_stats(self.profile_path)
+            print(f"instrumentation: profile of ticks {self.profile_ticks[0]}-{self.profile_ticks[1]} "
+                  f"written to {self.profile_path}")
+        self._profiler = None
+
+    # --- output ---
+
+    def summary(self):
+        """Totals per span name over all ticks."""
+        totals = {}
+        for (tick, name), (count, seconds, peak) in self._spans.items():
+            total = totals.setdefault(name, {"count": 0, "seconds": 0.0, "max_tick_seconds": 0.0,
+                                             "peak_mb": None})
+            total["count"] += count
+            total["seconds"] += seconds
+            total["max_tick_seconds"] = max(total["max_tick_seconds"], seconds)
+            if peak is not None:
+                total["peak_mb"] = max(total["peak_mb"] or 0.0, peak / 1024 ** 2)
+        return totals
+
+    def rows(self):
+        for (tick, name), (count, seconds, peak) in self._spans.items():
+            yield {
+                "tick": tick,
+                "name": name,
+                "count": count,
+                "seconds": seconds,
+                "peak_mb": None if peak is None else peak / 1024 ** 2,
+            }
+
+    def write(self, path):
+        """Writes the metrics as CSV (one row per tick and span) or JSON (summary plus rows)."""
+        if path.endswith(".csv"):
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=["tick", "name", "count", "seconds", "peak_mb"])
+                writer.writeheader()
+                writer.writerows(self.rows())
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({"summary": self.summary(), "spans": list(self.rows())}, f, indent=2)
+        print(f"instrumentation: metrics written to {path}")
+
+
+def enable(trace_memory=False, profile_ticks=None, profile_path=None):
+    """Starts recording spans into a new Metrics object and returns it."""
+    global _active
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _active = Metrics(trace_memory=trace_memory, profile_ticks=profile_ticks, profile_path=profile_path)
+    return _active
+
+
+def disable():
+    """Stops recording and returns the Metrics collected so far (or None)."""
+    global _active
+    metrics, _active = _active, None
+    if metrics is not None:
+        metrics.end_ticks()
+        if metrics.trace_memory:
+            tracemalloc.stop()
+    return metrics
+
+
+def span(name):
+    if _active is None:
+        return _NULL_SPAN
+    return _Span(_active, name)
+
+
+def begin_tick(tick):
+    if _active is not None:
+        _active.begin_tick(tick)
+
+
+def end_ticks():
+    if _active is not None:
+        _active.end_ticks()
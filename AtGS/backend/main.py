@@ -1,7 +1,28 @@
+import argparse
 import json
 import os
+import random
+import numpy as np
 from world_generation import generate_world
-from civ import spawn_civs, monthly_civ_update
+from world_cache import load_or_generate_world, world_cache_key
+from civ import INTERNAL_CIV_KEYS, build_city_hash, spawn_civs, monthly_civ_update
+from biomes import BIOME_NAMES, OCEAN
+from civ_table import CivTable
+from grid_engine import init_ownership_grid, monthly_grid_update, territories_from_grid
+from world_export import ownership_to_array, remove_binary_world, write_binary_world
+from tiles import write_biome_tiles
+from world import DEFAULT_EXPORT_LAYERS, DERIVED_LAYERS, BASE_LAYERS
+from history import HistoryRecorder
+import instrumentation
+from instrumentation import begin_tick, end_ticks, span
+from checkpoint import Checkpointer, load_checkpoint, read_manifest
+from nomads import HabitabilityMap, NomadGroups, nomad_step
+from economy import Economy
+from parallel_tick import ParallelTick
+from diplomacy import init_diplomacy_states, update_diplomacy_states, diplomacy_states_to_dict, DIPLOMACY_STATES
+
+HISTORY_FILE_NAME = "history.bin.gz"
+JSON_FILE_NAME = "world_data.json"
 
 
 def convert_keys_to_str(d):
@@ -22,68 +43,347 @@ def init_map_ownership(width, height):
     return [[None for _ in range(width)] for _ in range(height)]
 
 
-def main():
-    world = generate_world()
-    map_width = world["map_width"]
-    map_height = world["map_height"]
-    biome_map = world["biome_map"]
-
+def run_dict_engine(civs, biome_ids, map_width, map_height, months, city_spacing=0, recorder=None, seed=None):
+    rng = np.random.default_rng(seed)
+    relations = init_diplomacy_states(len(civs))
     map_ownership = init_map_ownership(map_width, map_height)
-    civs = spawn_civs(biome_map, map_width, map_height, num_civs=15)
-
     for civ in civs:
         for (x, y) in civ["territory"]:
             map_ownership[y][x] = civ["id"]
 
-    for month in range(30 * 12):
-        civs = monthly_civ_update(civs, biome_map, map_width, map_height, map_ownership)
+    if recorder is not None:
+        recorder.write_keyframe(0, civs, map_ownership)
+
+    city_hash = build_city_hash(civs, city_spacing) if city_spacing else None
+    for month in range(months):
+        begin_tick(month)
+        civs = monthly_civ_update(civs, biome_ids, map_width, map_height, map_ownership,
+                                  min_city_spacing=city_spacing, city_hash=city_hash, recorder=recorder)
+        with span("diplomacy"):
+            relations = update_diplomacy_states(civs, relations, rng)
+        if recorder is not None:
+            with span("history"):
+                recorder.end_month(month + 1, civs, map_ownership)
         if month % 12 == 0:
             print(f"Year {month // 12} simulation running...")
+    end_ticks()
+
+    return civs, map_ownership, relations
+
+
+def run_grid_engine(civs, biome_ids, map_width, map_height, months, seed=None, recorder=None, checkpointer=None,
+                    resume_state=None, nomads=None, habitat=None, world=None, economy=False, tick_workers=0):
+    land_mask = biome_ids != OCEAN
+    if resume_state is not None:
+        # Continue exactly where the checkpoint left off (see checkpoint.load_checkpoint)
+        rng = resume_state["rng"]
+        relations = resume_state["relations"]
+        ownership = resume_state["ownership"]
+        table = resume_state["table"]
+        start_month = resume_state["month"]
+    else:
+        rng = np.random.default_rng(seed)
+        relations = init_diplomacy_states(len(civs))
+        ownership = init_ownership_grid(civs, map_width, map_height)
+        table = CivTable.from_civ_dicts(civs, rng)
+        start_month = 0
+
+    if recorder is not None:
+        recorder.write_keyframe(0, table, ownership)
+    resource_stocks = None
+    if economy and resume_state is not None:
+        resource_stocks = Economy.from_arrays(world, resume_state["arrays"])
+    elif economy:
+        resource_stocks = Economy.from_world(world, ownership)
+    # Region-parallel tick: own random streams, identical results for any worker count
+    tick = None
+    if tick_workers:
+        tick = ParallelTick(ownership, land_mask, seed, len(table), workers=tick_workers, month=start_month)
+        if resume_state is not None:
+            tick.restore_arrays(resume_state["arrays"])
+        ownership = tick.ownership
+    # Optional state that goes into the checkpoints
+    checkpoint_parts = [part for part in (resource_stocks, nomads, habitat, tick) if part is not None]
+
+    try:
+        for month in range(start_month, months):
+            begin_tick(month)
+            if tick is not None:
+                table = tick.step(table, recorder=recorder, economy=resource_stocks)
+            else:
+                table = monthly_grid_update(table, ownership, land_mask, rng, recorder=recorder,
+                                            economy=resource_stocks)
+            with span("diplomacy"):
+                relations = update_diplomacy_states(table, relations, rng)
+            if nomads is not None:
+                with span("nomads"):
+                    nomad_step(nomads, habitat)
+            if recorder is not None:
+                with span("history"):
+                    recorder.end_month(month + 1, table, ownership)
+            if checkpointer is not None:
+                checkpointer.maybe_save(month + 1, table, ownership, relations, rng, checkpoint_parts)
+            if month % 12 == 0:
+                print(f"Year {month // 12} simulation running...")
+    finally:
+        if tick is not None:
+            ownership = tick.close()
+    end_ticks()
+
+    # Civ dicts and territory sets are only built from the columns for the export
+    civs = table.to_civ_dicts(territories_from_grid(ownership, table))
+    return civs, ownership, relations
+
+
+def _write_json_rows(f, rows):
+    """Writes an iterable of JSON-serializable rows as one array, one row at a time."""
+    f.write("[")
+    for i, row in enumerate(rows):
+        if i:
+            f.write(",\n")
+        json.dump(row, f)
+    f.write("]")
+
+
+def _export_civ(civ_dict):
+    processed_civ = civ_dict.copy()  # Make a copy to avoid modifying original during iteration
+    if "territory" in processed_civ and isinstance(processed_civ["territory"], set):
+        # Convert the set of (x,y) tuples to a list of [x,y] lists
+        processed_civ["territory"] = [list(tile_tuple) for tile_tuple in processed_civ["territory"]]
+    # Frontier and open-tile index are internal state and can be rebuilt from territory
+    for key in INTERNAL_CIV_KEYS:
+        processed_civ.pop(key, None)
+    return convert_keys_to_str(processed_civ)
 
-    export_data = world.copy()
-    export_data.update({
-        "civs": civs,
-        "map_ownership": map_ownership,
-    })
 
-    # Process civs to make them JSON serializable
-    processed_civs = []
-    for civ_dict in civs:  # civs is the list of civ dictionaries
-        processed_civ = civ_dict.copy()  # Make a copy to avoid modifying original during iteration
-        if "territory" in processed_civ and isinstance(processed_civ["territory"], set):
-            # Convert the set of (x,y) tuples to a list of [x,y] lists
-            processed_civ["territory"] = [list(tile_tuple) for tile_tuple in processed_civ["territory"]]
-        processed_civs.append(processed_civ)
-
-    export_data.update({
-        "civs": processed_civs,  # Use the processed list of civs
-        "map_ownership": map_ownership,
+def export_json(world, civs, map_ownership, relations, absolute_output_dir, layers=DEFAULT_EXPORT_LAYERS,
+                nomads=None):
+    """
+    Writes world_data.json. Grids are streamed row by row and civs one by one,
+    so only one row or civ is ever held as Python lists.
+    """
+    if isinstance(map_ownership, np.ndarray):
+        ownership_rows = ([owner if owner >= 0 else None for owner in row] for row in map_ownership.tolist())
+    else:
+        ownership_rows = iter(map_ownership)
+
+    small_values = world.metadata()
+    small_values.update({
+        "diplomacy_states": DIPLOMACY_STATES,
+        # Only non-Neutral pairs; tuple keys become "i,j"
+        "diplomacy": convert_keys_to_str(diplomacy_states_to_dict(relations, len(civs))),
     })
+    if nomads is not None:
+        small_values["nomads"] = nomads.to_dict()
+    # Only the requested layers are exported
+    grids = {name: (row.tolist() for row in world[name]) for name in layers}
+    # Das Frontend erwartet weiterhin die Biome als Namen
+    grids["biome_map"] = ([BIOME_NAMES[biome_id] for biome_id in row] for row in world["biome_ids"].tolist())
+    grids["map_ownership"] = ownership_rows
 
-    # Your existing convert_keys_to_str might still be useful for other parts of export_data,
-    # or if any dictionary keys are tuples (e.g., in diplomacy if you used tuple keys directly).
-    # However, for civ["territory"], we've handled it above.
-    # If convert_keys_to_str was *only* for territory sets, you might not need it anymore
-    # or it needs to be adapted.
+    os.makedirs(absolute_output_dir, exist_ok=True)
+    path = os.path.join(absolute_output_dir, JSON_FILE_NAME)
+
+    print("Writing JSON now:", path)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("{")
+        for key, value in small_values.items():
+            f.write(f"{json.dumps(key)}: {json.dumps(value)},\n")
+        for key, rows in grids.items():
+            f.write(f"{json.dumps(key)}: ")
+            _write_json_rows(f, rows)
+            f.write(",\n")
+        f.write('"civs": ')
+        _write_json_rows(f, (_export_civ(civ) for civ in civs))
+        f.write("}")
+    print("Write complete.")
 
-    # Let's assume convert_keys_to_str is still needed for other things:
-    export_data = convert_keys_to_str(export_data)
 
-    # ... (your path setup and file writing logic) ...
+def main(engine="dict", seed=None, city_spacing=0, export_format="json", record_history=False,
+         keyframe_years=10, use_cache=True, metrics_path=None, trace_memory=False, profile_ticks=None,
+         profile_path=None, months=30 * 12, checkpoint_every=0, resume=False, checkpoint_dir=None,
+         export_layers=DEFAULT_EXPORT_LAYERS, export_tiles=True, num_nomads=0, economy=False,
+         erosion_iterations=0, tick_workers=0):
     # Get the directory where main.py is located
     script_dir = os.path.dirname(os.path.abspath(__file__))
     absolute_output_dir = os.path.join(script_dir, 'backend', 'data')
-    os.makedirs(absolute_output_dir, exist_ok=True)
-    path = os.path.join(absolute_output_dir, 'world_data.json')
+    checkpoint_dir = checkpoint_dir or os.path.join(script_dir, 'checkpoints')
 
-    print("Current working directory:", os.getcwd())
-    print("Saving to:", os.path.abspath('backend/data/world_data.json'))
+    if (checkpoint_every or resume) and engine != "grid":
+        raise ValueError("Checkpoints are only supported by the grid engine (--engine grid)")
+    if resume and record_history:
+        raise ValueError("--history records from month 0 and cannot be combined with --resume")
+    if num_nomads and engine != "grid":
+        raise ValueError("Nomads need the grid engine")
+    if economy and engine != "grid":
+        raise ValueError("The economy needs the grid engine")
+    if tick_workers and engine != "grid":
+        raise ValueError("The parallel tick needs the grid engine")
+    if resume:
+        # The checkpoint decides the world
+        seed = read_manifest(checkpoint_dir)["seed"]
 
-    print("Writing JSON now...")
-    with open('backend/data/world_data.json', 'w', encoding='utf-8') as f:
-        json.dump(export_data, f, indent=2)
-    print("Write complete.")
+    if metrics_path or profile_ticks:
+        instrumentation.enable(trace_memory=trace_memory, profile_ticks=profile_ticks,
+                               profile_path=profile_path or "tick_profile.prof")
+
+    if seed is None:
+        seed = random.randint(0, 99999)
+    print(f"World seed: {seed}")
+    with span("world"):
+        if use_cache:
+            world = load_or_generate_world(seed, erosion_iterations=erosion_iterations)
+        else:
+            world = generate_world(seed=seed, erosion_iterations=erosion_iterations)
+    map_width = world["map_width"]
+    map_height = world["map_height"]
+    biome_ids = world["biome_ids"]
+    world_key = world_cache_key(seed, map_width, map_height, erosion_iterations)
+
+    # Capital placement (and the dict engine) draw from the random module
+    random.seed(seed)
+    civs = spawn_civs(biome_ids, map_width, map_height, num_civs=15)
+
+    resume_state = None
+    if resume:
+        resume_state = load_checkpoint(checkpoint_dir)
+        if (resume_state["map_width"], resume_state["map_height"]) != (map_width, map_height):
+            raise ValueError(f"Checkpoint is for a {resume_state['map_width']}x{resume_state['map_height']} map, "
+                             f"the world is {map_width}x{map_height}")
+        if resume_state["erosion_iterations"] != erosion_iterations:
+            raise ValueError(f"Checkpoint was written with --erosion {resume_state['erosion_iterations']}, "
+                             f"resuming with --erosion {erosion_iterations}")
+        if resume_state["world_key"] not in (None, world_key):
+            raise ValueError("Checkpoint was written for a different world (generator settings changed)")
+        if ("economy_tiles" in resume_state["arrays"]) != economy:
+            raise ValueError(f"Checkpoint was written {'with' if not economy else 'without'} --economy, "
+                             f"resume {'with' if not economy else 'without'} it as well")
+        saved_nomads = len(resume_state["arrays"]["nomad_x"]) if "nomad_x" in resume_state["arrays"] else 0
+        if saved_nomads != num_nomads:
+            raise ValueError(f"Checkpoint was written with --nomads {saved_nomads}, resuming with --nomads {num_nomads}")
+        # Any worker count continues a parallel run, but the serial and the parallel tick draw differently
+        if ("tick_civ_rng_states" in resume_state["arrays"]) != bool(tick_workers):
+            raise ValueError(f"Checkpoint was written {'with' if not tick_workers else 'without'} --tick-workers, "
+                             f"resume {'with' if not tick_workers else 'without'} it as well")
+        print(f"Resuming from month {resume_state['month']} (checkpoint in {checkpoint_dir})")
+    checkpointer = None
+    if checkpoint_every:
+        checkpointer = Checkpointer(checkpoint_dir, checkpoint_every, seed, map_width, map_height,
+                                    erosion_iterations=erosion_iterations, world_key=world_key)
+
+    nomads = habitat = None
+    if num_nomads:
+        with span("habitability"):
+            layers = (biome_ids, world["food_map"], world["wood_map"], world["minerals_map"])
+            if resume_state is not None:
+                habitat = HabitabilityMap.from_arrays(*layers, resume_state["arrays"])
+                nomads = NomadGroups.from_arrays(resume_state["arrays"])
+            else:
+                habitat = HabitabilityMap(*layers)
+                nomads = NomadGroups.spawn(habitat.land_mask, num_nomads, np.random.default_rng([seed, 1]))
+
+    recorder = None
+    if record_history:
+        os.makedirs(absolute_output_dir, exist_ok=True)
+        recorder = HistoryRecorder(os.path.join(absolute_output_dir, HISTORY_FILE_NAME), map_width, map_height,
+                                   seed, keyframe_years=keyframe_years)
+    elif os.path.exists(os.path.join(absolute_output_dir, HISTORY_FILE_NAME)):
+        # The history of an earlier run would be replayed over this world
+        os.remove(os.path.join(absolute_output_dir, HISTORY_FILE_NAME))
+
+    try:
+        if engine == "grid":
+            civs, map_ownership, relations = run_grid_engine(civs, biome_ids, map_width, map_height, months,
+                                                             seed=seed, recorder=recorder, checkpointer=checkpointer,
+                                                             resume_state=resume_state, nomads=nomads, habitat=habitat,
+                                                             world=world, economy=economy, tick_workers=tick_workers)
+        else:
+            civs, map_ownership, relations = run_dict_engine(civs, biome_ids, map_width, map_height, months,
+                                                             city_spacing=city_spacing, recorder=recorder,
+                                                             seed=seed)
+    finally:
+        if recorder is not None:
+            recorder.close()
+
+    with span("export"):
+        # The frontend prefers the binary export, so the other format's files of an earlier run must go
+        if export_format == "binary":
+            json_path = os.path.join(absolute_output_dir, JSON_FILE_NAME)
+            if os.path.exists(json_path):
+                os.remove(json_path)
+            print("Writing binary layers now...")
+            path = write_binary_world(absolute_output_dir, world, civs, ownership_to_array(map_ownership),
+                                      relations=relations, layers=export_layers, nomads=nomads)
+            print("Write complete:", path)
+        else:
+            remove_binary_world(absolute_output_dir)
+            export_json(world, civs, map_ownership, relations, absolute_output_dir, layers=export_layers,
+                        nomads=nomads)
+
+    if export_tiles:
+        with span("tiles"):
+            path = write_biome_tiles(absolute_output_dir, world["biome_rgb"])
+            world.release("biome_rgb")
+        print("Biome tiles written:", path)
+
+    metrics = instrumentation.disable()
+    if metrics is not None and metrics_path:
+        metrics.write(metrics_path)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Generate a world and simulate its civilizations.")
+    parser.add_argument("--engine", choices=["dict", "grid"], default="dict",
+                        help="dict: per-civ territory sets, grid: vectorized ownership array")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="world seed (random if omitted); also seeds civ placement and the simulation")
+    parser.add_argument("--city-spacing", type=int, default=0,
+                        help="minimum distance between cities (dict engine, 0 = no limit)")
+    parser.add_argument("--format", choices=["json", "binary"], default="json",
+                        help="json: single world_data.json, binary: manifest plus raw typed layer files")
+    parser.add_argument("--history", action="store_true",
+                        help=f"stream per-month deltas to {HISTORY_FILE_NAME} for replay in the frontend")
+    parser.add_argument("--keyframe-years", type=int, default=10, help="years between full history keyframes")
+    parser.add_argument("--no-cache", action="store_true", help="always regenerate the world, bypassing the cache")
+    parser.add_argument("--metrics", default=None,
+                        help="write per-phase timings to this file (.json, or .csv for one row per month and phase)")
+    parser.add_argument("--trace-memory", action="store_true", help="also record the tracemalloc peak of each phase")
+    parser.add_argument("--profile-ticks", type=int, nargs=2, metavar=("FIRST", "LAST"), default=None,
+                        help="run cProfile for months FIRST..LAST (0-based, inclusive)")
+    parser.add_argument("--profile-output", default="tick_profile.prof", help="cProfile stats file (for pstats/snakeviz)")
+    parser.add_argument("--months", type=int, default=30 * 12, help="months to simulate (in total, also when resuming)")
+    parser.add_argument("--checkpoint-every", type=int, default=0,
+                        help="write a checkpoint every N months (grid engine, 0 = off)")
+    parser.add_argument("--checkpoint-dir", default=None, help="checkpoint directory (default: backend/checkpoints)")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue from the newest checkpoint; seed and world are taken from it")
+    parser.add_argument("--layers", nargs="*", default=DEFAULT_EXPORT_LAYERS,
+                        choices=[name for name in BASE_LAYERS + list(DERIVED_LAYERS) if name != "biome_ids"],
+                        help="world layers to export besides biome map and ownership (default: the resource maps)")
+    parser.add_argument("--no-tiles", action="store_true", help="skip the biome tile pyramid for the frontend")
+    parser.add_argument("--nomads", type=int, default=0,
+                        help="number of nomad groups migrating towards habitable land (grid engine)")
+    parser.add_argument("--economy", action="store_true",
+                        help="harvest the resource layers of each civ's territory and let food drive city growth "
+                             "(grid engine)")
+    parser.add_argument("--erosion", type=int, default=0, metavar="ITERATIONS",
+                        help="hydraulic erosion iterations before rivers and lakes are placed (0 = off)")
+    parser.add_argument("--tick-workers", type=int, default=0, metavar="N",
+                        help="run expansion, city founding and growth region by region on N processes "
+                             "(grid engine; results do not depend on N, 0 = serial tick)")
+    args = parser.parse_args()
+    if (args.checkpoint_every or args.resume) and args.engine != "grid":
+        parser.error("--checkpoint-every and --resume need --engine grid")
+    if args.nomads and args.engine != "grid":
+        parser.error("--nomads needs --engine grid")
+    if args.economy and args.engine != "grid":
+        parser.error("--economy needs --engine grid")
+    if args.tick_workers and args.engine != "grid":
+        parser.error("--tick-workers needs --engine grid")
+    main(engine=args.engine, seed=args.seed, city_spacing=args.city_spacing, export_format=args.format,
+         record_history=args.history, keyframe_years=args.keyframe_years, use_cache=not args.no_cache,
+         metrics_path=args.metrics, trace_memory=args.trace_memory, profile_ticks=args.profile_ticks,
+         profile_path=args.profile_output, months=args.months, checkpoint_every=args.checkpoint_every,
+         resume=args.resume, checkpoint_dir=args.checkpoint_dir, export_layers=args.layers,
+         export_tiles=not args.no_tiles, num_nomads=args.nomads, economy=args.economy,
+         erosion_iterations=args.erosion, tick_workers=args.tick_workers)
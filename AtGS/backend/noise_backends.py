@@ -0,0 +1,328 @@
+import argparse
+import importlib
+import importlib.metadata
+import importlib.util
+import json
+import os
+import platform
+import time
+import numpy as np
+
+# Noise backends for world_generation.generate_noise_map.
+#
+# A backend computes the raw (unnormalized) FBM noise of one map tile:
+#
+#   tile(seed, x_start, x_end, y_start, y_end, scale, octaves, persistence, lacunarity)
+#
+# The libraries behind a backend are only imported when it is first used.
+# Backends of the same family produce the same values and only differ in
+# speed; "numpy" is a NumPy port of OpenSimplex that needs no library at all.
+# "pnoise2" (Perlin noise from the noise package) is a different family and is
+# only used when asked for by name.
+#
+# python noise_backends.py times the installed backends of a family on a sample
+# tile, drops those whose output differs from the reference implementation and
+# caches the fastest one; generate_noise_map uses it from then on.
+
+DEFAULT_BACKEND = "numpy"
+REFERENCE_BACKEND = "opensimplex"  # per-pixel opensimplex.noise2, defines the "opensimplex" family
+
+DEFAULT_CALIBRATION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'noise_backend.json')
+CALIBRATION_TILE = 64  # tile side in pixels
+CALIBRATION_REPEAT = 3
+# Largest absolute difference to the reference that still counts as equivalent
+EQUIVALENCE_TOLERANCE = 1e-9
+
+# OpenSimplex 2D Konstanten (identisch zu opensimplex.constants), damit der
+# vektorisierte Pfad exakt dieselben Werte liefert wie simplex.noise2
+STRETCH_CONSTANT2 = -0.211324865405187
+SQUISH_CONSTANT2 = 0.366025403784439
+NORM_CONSTANT2 = 47
+GRADIENTS2 = np.array([5, 2, 2, 5, -5, 2, -2, 5, 5, -2, 2, -5, -5, -2, -2, -5], dtype=np.int64)
+
+# pnoise2 indexes its permutation table with base, larger values crash the C code (see test.py)
+PNOISE2_BASES = 256
+PNOISE2_REPEAT = 1024
+
+
+def _int64(value):
+    return (value + 2 ** 63) % 2 ** 64 - 2 ** 63
+
+
+def opensimplex_perm(seed):
+    """Permutation table of opensimplex.OpenSimplex(seed), computed without the library."""
+    perm = np.zeros(256, dtype=np.int64)
+    source = list(range(256))
+    for _ in range(3):
+        seed = _int64(seed * 6364136223846793005 + 1442695040888963407)
+    for i in range(255, -1, -1):
+        seed = _int64(seed * 6364136223846793005 + 1442695040888963407)
+        r = (seed + 31) % (i + 1)
+        perm[i] = source[r]
+        source[r] = source[i]
+    return perm
+
+
+def _attenuate(perm, xsv, ysv, dx, dy):
+    """Vectorized OpenSimplex vertex contribution (attn^4 * gradient dot)."""
+    attn = 2 - dx * dx - dy * dy
+    index = perm[(perm[xsv & 0xFF] + ysv) & 0xFF] & 0x0E
+    extrapolation = GRADIENTS2[index] * dx + GRADIENTS2[index + 1] * dy
+    attn = np.where(attn > 0, attn, 0.0)
+    attn *= attn
+    return attn * attn * extrapolation
+
+
+def noise2_grid(perm, x, y):
+    """
+    NumPy port of opensimplex's scalar noise2 for whole coordinate arrays.
+    x and y must be broadcastable; the result matches simplex.noise2 per element.
+    """
+    stretch_offset = (x + y) * STRETCH_CONSTANT2
+    xs = x + stretch_offset
+    ys = y + stretch_offset
+
+    xsb_f = np.floor(xs)
+    ysb_f = np.floor(ys)
+
+    squish_offset = (xsb_f + ysb_f) * SQUISH_CONSTANT2
+    xb = xsb_f + squish_offset
+    yb = ysb_f + squish_offset
+
+    xins = xs - xsb_f
+    yins = ys - ysb_f
+    in_sum = xins + yins
+
+    dx0 = x - xb
+    dy0 = y - yb
+
+    xsb = xsb_f.astype(np.int64)
+    ysb = ysb_f.astype(np.int64)
+
+    # Contribution (1,0) und (0,1)
+    dx1 = dx0 - 1 - SQUISH_CONSTANT2
+    dy1 = dy0 - 0 - SQUISH_CONSTANT2
+    value = _attenuate(perm, xsb + 1, ysb + 0, dx1, dy1)
+
+    dx2 = dx0 - 0 - SQUISH_CONSTANT2
+    dy2 = dy0 - 1 - SQUISH_CONSTANT2
+    value = value + _attenuate(perm, xsb + 0, ysb + 1, dx2, dy2)
+
+    lower = in_sum <= 1
+    x_gt_y = xins > yins
+    # (0,0) bzw. (1,1) ist einer der beiden naechsten Dreieckspunkte
+    near_lower = (1 - in_sum > xins) | (1 - in_sum > yins)
+    near_upper = (2 - in_sum < xins) | (2 - in_sum < yins)
+
+    two_squish = 2 * SQUISH_CONSTANT2
+    cases = [lower & near_lower & x_gt_y, lower & near_lower, lower, near_upper & x_gt_y, near_upper]
+    xsv_ext = np.select(cases, [xsb + 1, xsb - 1, xsb + 1, xsb + 2, xsb + 0], default=xsb)
+    ysv_ext = np.select(cases, [ysb - 1, ysb + 1, ysb + 1, ysb + 0, ysb + 2], default=ysb)
+    dx_ext = np.select(cases, [dx0 - 1, dx0 + 1, dx0 - 1 - two_squish, dx0 - 2 - two_squish,
+                               dx0 + 0 - two_squish], default=dx0)
+    dy_ext = np.select(cases, [dy0 + 1, dy0 - 1, dy0 - 1 - two_squish, dy0 + 0 - two_squish,
+                               dy0 - 2 - two_squish], default=dy0)
+
+    # Im oberen Dreieck (1,1) verschiebt sich der Ursprung
+    xsb = np.where(lower, xsb, xsb + 1)
+    ysb = np.where(lower, ysb, ysb + 1)
+    dx0 = np.where(lower, dx0, dx0 - 1 - two_squish)
+    dy0 = np.where(lower, dy0, dy0 - 1 - two_squish)
+
+    # Contribution (0,0) oder (1,1), dann Extra Vertex
+    value = value + _attenuate(perm, xsb, ysb, dx0, dy0)
+    value = value + _attenuate(perm, xsv_ext, ysv_ext, dx_ext, dy_ext)
+
+    return value / NORM_CONSTANT2
+
+
+def _fbm(noise2, x_start, x_end, y_start, y_end, scale, octaves, persistence, lacunarity):
+    """FBM over the tile; noise2(nx, ny) returns the (len(ny), len(nx)) noise of two coordinate vectors."""
+    xs = np.arange(x_start, x_end, dtype=np.float64)
+    ys = np.arange(y_start, y_end, dtype=np.float64)
+
+    current_amplitude = 1.0
+    current_frequency = 1.0
+    total_value = np.zeros((y_end - y_start, x_end - x_start))
+
+    for i in range(octaves):
+        # Gleiche Rechenreihenfolge wie im Skalarpfad: x / scale * frequency
+        nx = xs / scale * current_frequency
+        ny = ys / scale * current_frequency
+        total_value += noise2(nx, ny) * current_amplitude
+
+        current_amplitude *= persistence
+        current_frequency *= lacunarity
+
+    return total_value
+
+
+def _numpy_backend(_):
+    def tile(seed, x_start, x_end, y_start, y_end, scale, octaves, persistence, lacunarity):
+        perm = opensimplex_perm(seed)
+
+        def noise2(nx, ny):
+            return noise2_grid(perm, *np.broadcast_arrays(nx[np.newaxis, :], ny[:, np.newaxis]))
+        return _fbm(noise2, x_start, x_end, y_start, y_end, scale, octaves, persistence, lacunarity)
+    return tile
+
+
+def _opensimplex_array_backend(opensimplex):
+    def tile(seed, x_start, x_end, y_start, y_end, scale, octaves, persistence, lacunarity):
+        # noise2array is compiled with numba if that is installed, a Python loop otherwise
+        simplex = opensimplex.OpenSimplex(seed=seed)
+        return _fbm(simplex.noise2array, x_start, x_end, y_start, y_end, scale, octaves, persistence, lacunarity)
+    return tile
+
+
+def _opensimplex_backend(opensimplex):
+    def tile(seed, x_start, x_end, y_start, y_end, scale, octaves, persistence, lacunarity):
+        simplex = opensimplex.OpenSimplex(seed=seed)
+
+        def noise2(nx, ny):
+            return np.array([[simplex.noise2(x, y) for x in nx.tolist()] for y in ny.tolist()])
+        return _fbm(noise2, x_start, x_end, y_start, y_end, scale, octaves, persistence, lacunarity)
+    return tile
+
+
+def _pnoise2_backend(noise):
+    def tile(seed, x_start, x_end, y_start, y_end, scale, octaves, persistence, lacunarity):
+        # pnoise2 sums the octaves itself
+        base = seed % PNOISE2_BASES
+        return np.array([[noise.pnoise2(x / scale, y / scale, octaves=octaves, persistence=persistence,
+                                        lacunarity=lacunarity, repeatx=PNOISE2_REPEAT, repeaty=PNOISE2_REPEAT,
+                                        base=base)
+                          for x in range(x_start, x_end)]
+                         for y in range(y_start, y_end)])
+    return tile
+
+
+# name -> (module to import or None, family, factory(module) -> tile function)
+NOISE_BACKENDS = {
+    "numpy": (None, "opensimplex", _numpy_backend),
+    "opensimplex-array": ("opensimplex", "opensimplex", _opensimplex_array_backend),
+    "opensimplex": ("opensimplex", "opensimplex", _opensimplex_backend),
+    "pnoise2": ("noise", "perlin", _pnoise2_backend),
+}
+
+_loaded = {}
+
+
+def load_backend(name):
+    """The tile function of a backend; imports its library on first use."""
+    if name not in NOISE_BACKENDS:
+        raise ValueError(f"Unknown noise backend {name!r}, expected one of {sorted(NOISE_BACKENDS)}")
+    if name not in _loaded:
+        module_name, _, factory = NOISE_BACKENDS[name]
+        module = importlib.import_module(module_name) if module_name else None
+        _loaded[name] = factory(module)
+    return _loaded[name]
+
+
+def backend_family(name):
+    return NOISE_BACKENDS[name][1]
+
+
+def available_backends(family=None):
+    """Backends whose library is installed (checked without importing it)."""
+    return [name for name, (module_name, backend_family_name, _) in NOISE_BACKENDS.items()
+            if (family is None or backend_family_name == family)
+            and (module_name is None or importlib.util.find_spec(module_name) is not None)]
+
+
+def _environment():
+    """What the timings depend on; a calibration from another environment is not reused."""
+    versions = {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine()}
+    # numba decides whether opensimplex's array functions are compiled
+    for package in sorted({module for module, _, _ in NOISE_BACKENDS.values() if module} | {"numba"}):
+        try:
+            versions[package] = importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+def _read_calibration(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def calibrate(family="opensimplex", tile_size=CALIBRATION_TILE, repeat=CALIBRATION_REPEAT,
+              path=DEFAULT_CALIBRATION_FILE, seed=0):
+    """
+    Times every installed backend of the family on a tile_size x tile_size tile
+    with the world generation's FBM parameters, compares its output with the
+    reference backend and caches the fastest equivalent one in path (one record
+    per family). Returns the calibration record.
+    """
+    import world_generation
+
+    args = (seed, 0, tile_size, 0, tile_size, world_generation.scale, world_generation.octaves,
+            world_generation.persistence, world_generation.lacunarity)
+    results = {}
+    for name in available_backends(family):
+        tile = load_backend(name)
+        # Warm-up on a small tile, e.g. for numba's compilation
+        tile(seed, 0, 8, 0, 8, *args[5:])
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            values = tile(*args)
+            times.append(time.perf_counter() - start)
+        results[name] = (min(times), values)
+        print(f"noise backend {name:18s} {min(times):.4f} s")
+
+    # Without the reference installed, the first backend of the family is compared against
+    reference = results[REFERENCE_BACKEND if REFERENCE_BACKEND in results else next(iter(results))][1]
+    equivalent = {name: seconds for name, (seconds, values) in results.items()
+                  if np.abs(values - reference).max() <= EQUIVALENCE_TOLERANCE}
+    for name in results:
+        if name not in equivalent:
+            print(f"noise backend {name}: output differs from the reference, skipped")
+    best = min(equivalent, key=equivalent.get)
+
+    record = {
+        "family": family,
+        "backend": best,
+        "tile_size": tile_size,
+        "seconds": {name: seconds for name, (seconds, _) in results.items()},
+        "equivalent": sorted(equivalent),
+        "environment": _environment(),
+    }
+    calibration = _read_calibration(path)
+    calibration[family] = record
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(calibration, f, indent=2)
+    print(f"noise backend: using {best} (written to {path})")
+    return record
+
+
+def default_backend(family="opensimplex", path=DEFAULT_CALIBRATION_FILE):
+    """
+    The calibrated backend of the family if the calibration matches this
+    environment, else DEFAULT_BACKEND (or the first installed one of another family).
+    """
+    record = _read_calibration(path).get(family)
+    if isinstance(record, dict) and record.get("environment") == _environment() \
+            and record.get("backend") in available_backends(family):
+        return record["backend"]
+    return DEFAULT_BACKEND if backend_family(DEFAULT_BACKEND) == family else available_backends(family)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times the installed noise backends and caches the fastest one")
+    parser.add_argument("--family", default="opensimplex", choices=sorted({family for _, family, _ in
+                                                                            NOISE_BACKENDS.values()}))
+    parser.add_argument("--tile-size", type=int, default=CALIBRATION_TILE)
+    parser.add_argument("--repeat", type=int, default=CALIBRATION_REPEAT)
+    parser.add_argument("--output", default=DEFAULT_CALIBRATION_FILE, help="calibration file")
+    args = parser.parse_args()
+    calibrate(args.family, tile_size=args.tile_size, repeat=args.repeat, path=args.output)
+
+
+if __name__ == "__main__":
+    main()
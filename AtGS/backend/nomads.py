@@ -0,0 +1,252 @@
+import numpy as np
+from biomes import BIOME_IDS, BIOME_NAMES
+
+# Nomad migration on a habitability raster.
+#
+# habitability = biome weight * (food + wood + minerals) per tile. The tiles are
+# grouped into cell_size x cell_size cells; a cell's score is its mean
+# habitability. "Best cell within radius R" is a range-maximum query over the
+# cell grid, answered in O(1) from a max pyramid: level k holds, for every
+# cell, the best score (and its cell) of the 2^k x 2^k block starting there.
+# Any square window is covered by four such blocks of one level. The grid is
+# padded with -inf cells, so windows at the map edge need no clipping.
+#
+# Consumption changes single tiles: their cells' sums are updated in place and
+# only the pyramid entries over the REFRESH_CHUNK-sized areas with changed cells
+# are rebuilt.
+
+# Same weights as the migration scoring in the frontend
+BIOME_HABITABILITY = {
+    "Ocean": 0.0,
+    "Beach": 0.5,
+    "Desert": 0.1,
+    "Swamp": 0.4,
+    "Grassland": 0.8,
+    "Forest": 0.7,
+    "Snow": 0.1,
+    "Taiga": 0.5,
+    "Tundra": 0.3,
+    "Lake": 0.2,
+    "River": 0.9,
+}
+# Index = biome id
+HABITABILITY_TABLE = np.array([BIOME_HABITABILITY[name] for name in BIOME_NAMES], dtype=np.float32)
+
+CELL_SIZE = 4
+REFRESH_CHUNK = 32     # cells per side of the areas the pyramid is rebuilt in after consumption
+MAX_RADIUS = 32        # tiles; the largest radius best_in_radius accepts
+SEARCH_RADIUS = 16     # tiles a group looks around each month
+MOVE_SPEED = 2         # tiles per month (in x and y)
+FOOD_PER_PERSON = 0.001
+GROWTH = 1.01
+DECLINE = 0.95
+
+
+class HabitabilityMap:
+    """Habitability raster, per-cell scores and the max pyramid over them."""
+
+    def __init__(self, biome_ids, food_map, wood_map, minerals_map, cell_size=CELL_SIZE, max_radius=MAX_RADIUS):
+        self.map_height, self.map_width = biome_ids.shape
+        self.cell_size = cell_size
+        self.weights = HABITABILITY_TABLE[biome_ids]
+        self.resources = (np.asarray(food_map, dtype=np.float32) + wood_map + minerals_map).astype(np.float32)
+        self.land_mask = biome_ids != BIOME_IDS["Ocean"]
+        # Tiles whose resources were eaten from, the only ones a checkpoint has to store
+        self.consumed = np.zeros(biome_ids.shape, dtype=bool)
+
+        self.cells_y = -(-self.map_height // cell_size)
+        self.cells_x = -(-self.map_width // cell_size)
+        # -inf border wide enough for the largest window
+        self.pad = -(-max_radius // cell_size)
+        self.max_level = int(np.log2(2 * self.pad + 1))
+        self.span = 2 ** self.max_level
+
+        habitability = self.weights * self.resources
+        padded = np.zeros((self.cells_y * cell_size, self.cells_x * cell_size), dtype=np.float64)
+        padded[:self.map_height, :self.map_width] = habitability
+        self.cell_sums = padded.reshape(self.cells_y, cell_size, self.cells_x, cell_size).sum(axis=(1, 3))
+        tiles = np.zeros_like(padded)
+        tiles[:self.map_height, :self.map_width] = 1
+        self.cell_tiles = tiles.reshape(self.cells_y, cell_size, self.cells_x, cell_size).sum(axis=(1, 3))
+
+        # levels[k, y, x]: best score in the 2^k block at padded cell (y, x); arg: its flat padded cell index
+        # The extra span rows/columns let every level read its shifted neighbours without bounds checks
+        shape = (self.max_level + 1, self.cells_y + 2 * self.pad + self.span, self.cells_x + 2 * self.pad + self.span)
+        self.levels = np.full(shape, -np.inf, dtype=np.float32)
+        self.args = np.zeros(shape, dtype=np.int32)
+        self.args[:] = np.arange(shape[1] * shape[2], dtype=np.int32).reshape(shape[1:])
+        self._refresh(0, self.cells_y, 0, self.cells_x)
+
+    @classmethod
+    def from_arrays(cls, biome_ids, food_map, wood_map, minerals_map, arrays, prefix="habitat_"):
+        """Rebuilds the map from the world and restores what to_arrays saved."""
+        habitat = cls(biome_ids, food_map, wood_map, minerals_map)
+        tiles = arrays[prefix + "tiles"]
+        habitat.resources.ravel()[tiles] = arrays[prefix + "resources"]
+        habitat.consumed.ravel()[tiles] = True
+        # The sums were updated incrementally, recomputing them could differ in the last bits
+        habitat.cell_sums[...] = arrays[prefix + "cell_sums"]
+        habitat._refresh(0, habitat.cells_y, 0, habitat.cells_x)
+        return habitat
+
+    def to_arrays(self, prefix="habitat_"):
+        """The consumed tiles and the cell sums (for checkpoint.Checkpointer)."""
+        tiles = np.flatnonzero(self.consumed)
+        return {
+            prefix + "tiles": tiles.astype(np.uint32),
+            prefix + "resources": self.resources.ravel()[tiles],
+            prefix + "cell_sums": self.cell_sums,
+        }
+
+    def cell_scores(self):
+        return self.cell_sums / self.cell_tiles
+
+    def _refresh(self, cy0, cy1, cx0, cx1):
+        """Rebuilds all pyramid entries that cover cells [cy0, cy1) x [cx0, cx1)."""
+        p = self.pad
+        self.levels[0, p + cy0:p + cy1, p + cx0:p + cx1] = self.cell_sums[cy0:cy1, cx0:cx1] / \
+            self.cell_tiles[cy0:cy1, cx0:cx1]
+        width = self.levels.shape[2] - self.span
+        height = self.levels.shape[1] - self.span
+        for k in range(1, self.max_level + 1):
+            half = 2 ** (k - 1)
+            # Blocks starting up to 2^k - 1 cells before the changed area contain it
+            y0 = max(0, p + cy0 - 2 * half + 1)
+            x0 = max(0, p + cx0 - 2 * half + 1)
+            y1 = min(height, p + cy1)
+            x1 = min(width, p + cx1)
+            values = self.levels[k - 1]
+            args = self.args[k - 1]
+            best = values[y0:y1, x0:x1].copy()
+            best_arg = args[y0:y1, x0:x1].copy()
+            for dy, dx in ((0, half), (half, 0), (half, half)):
+                other = values[y0 + dy:y1 + dy, x0 + dx:x1 + dx]
+                better = other > best
+                best[better] = other[better]
+                best_arg[better] = args[y0 + dy:y1 + dy, x0 + dx:x1 + dx][better]
+            self.levels[k, y0:y1, x0:x1] = best
+            self.args[k, y0:y1, x0:x1] = best_arg
+
+    def _refresh_cells(self, cell_y, cell_x):
+        if cell_y.size == 0:
+            return
+        chunks_x = -(-self.cells_x // REFRESH_CHUNK)
+        chunks = np.unique(cell_y // REFRESH_CHUNK * chunks_x + cell_x // REFRESH_CHUNK)
+        if chunks.size * 2 > chunks_x * -(-self.cells_y // REFRESH_CHUNK):
+            # Changes all over the map: one pass is cheaper than the overlapping chunk borders
+            self._refresh(int(cell_y.min()), int(cell_y.max()) + 1, int(cell_x.min()), int(cell_x.max()) + 1)
+            return
+        for chunk in chunks.tolist():
+            cy0 = chunk // chunks_x * REFRESH_CHUNK
+            cx0 = chunk % chunks_x * REFRESH_CHUNK
+            self._refresh(cy0, min(cy0 + REFRESH_CHUNK, self.cells_y), cx0, min(cx0 + REFRESH_CHUNK, self.cells_x))
+
+    def best_in_radius(self, xs, ys, radius):
+        """
+        For tile positions xs, ys: the centre tile of the best cell whose cell lies within
+        radius tiles (Chebyshev, rounded up to whole cells) and its score. O(1) per position.
+        """
+        r = min(-(-radius // self.cell_size), self.pad)
+        side = 2 * r + 1
+        k = int(np.log2(side))
+        size = 2 ** k
+        cy = ys // self.cell_size + self.pad
+        cx = xs // self.cell_size + self.pad
+        top, left = cy - r, cx - r
+        bottom, right = cy + r - size + 1, cx + r - size + 1
+
+        best = self.levels[k, top, left]
+        best_arg = self.args[k, top, left]
+        for y, x in ((top, right), (bottom, left), (bottom, right)):
+            value = self.levels[k, y, x]
+            better = value > best
+            best = np.where(better, value, best)
+            best_arg = np.where(better, self.args[k, y, x], best_arg)
+
+        row_length = self.levels.shape[2]
+        cell_y = best_arg // row_length - self.pad
+        cell_x = best_arg % row_length - self.pad
+        target_x = np.minimum(cell_x * self.cell_size + self.cell_size // 2, self.map_width - 1)
+        target_y = np.minimum(cell_y * self.cell_size + self.cell_size // 2, self.map_height - 1)
+        return target_x, target_y, best
+
+    def consume(self, xs, ys, demand):
+        """
+        Removes up to demand resources from the tiles (xs, ys); several entries may name the
+        same tile and share it. Returns the fraction of its demand each entry received.
+        """
+        tiles = ys.astype(np.int64) * self.map_width + xs
+        unique_tiles, inverse = np.unique(tiles, return_inverse=True)
+        total_demand = np.bincount(inverse, weights=demand)
+        flat = self.resources.ravel()
+        available = flat[unique_tiles].astype(np.float64)
+        taken = np.minimum(available, total_demand)
+        flat[unique_tiles] = available - taken
+        self.consumed.ravel()[unique_tiles] = True
+
+        delta = -taken * self.weights.ravel()[unique_tiles]
+        cell_y = unique_tiles // self.map_width // self.cell_size
+        cell_x = unique_tiles % self.map_width // self.cell_size
+        np.add.at(self.cell_sums, (cell_y, cell_x), delta)
+        self._refresh_cells(cell_y, cell_x)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fed = np.where(total_demand > 0, taken / total_demand, 1.0)
+        return fed[inverse]
+
+
+class NomadGroups:
+    """Struct-of-arrays of all nomad groups: position and population."""
+
+    def __init__(self, xs, ys, populations):
+        self.x = np.asarray(xs, dtype=np.int32)
+        self.y = np.asarray(ys, dtype=np.int32)
+        self.population = np.asarray(populations, dtype=np.float64)
+
+    def __len__(self):
+        return self.x.size
+
+    @classmethod
+    def spawn(cls, land_mask, count, rng, low=50, high=200):
+        """count groups on random land tiles."""
+        land = np.flatnonzero(land_mask.ravel())
+        tiles = land[rng.integers(0, land.size, count)]
+        width = land_mask.shape[1]
+        return cls(tiles % width, tiles // width, rng.integers(low, high, count))
+
+    def to_arrays(self, prefix="nomad_"):
+        return {prefix + "x": self.x.copy(), prefix + "y": self.y.copy(), prefix + "population": self.population.copy()}
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix="nomad_"):
+        return cls(arrays[prefix + "x"], arrays[prefix + "y"], arrays[prefix + "population"])
+
+    def to_dict(self):
+        return {"x": self.x.tolist(), "y": self.y.tolist(), "population": np.round(self.population, 1).tolist()}
+
+
+def nomad_step(groups, habitat, radius=SEARCH_RADIUS, speed=MOVE_SPEED):
+    """
+    One month for all groups: move up to speed tiles towards the best cell within
+    radius (never onto ocean), then eat from the tile they stand on. Fed groups
+    grow, hungry ones shrink.
+    """
+    target_x, target_y, _ = habitat.best_in_radius(groups.x, groups.y, radius)
+    step_x = np.clip(target_x - groups.x, -speed, speed)
+    step_y = np.clip(target_y - groups.y, -speed, speed)
+
+    # Diagonal step first, then either axis alone if that one would end in the sea
+    x, y = groups.x, groups.y
+    moved = np.zeros(len(groups), dtype=bool)
+    for dx, dy in ((step_x, step_y), (step_x, 0), (0, step_y)):
+        new_x = x + dx
+        new_y = y + dy
+        ok = ~moved & habitat.land_mask[new_y, new_x]
+        groups.x = np.where(ok, new_x, groups.x).astype(np.int32)
+        groups.y = np.where(ok, new_y, groups.y).astype(np.int32)
+        moved |= ok
+
+    fed = habitat.consume(groups.x, groups.y, groups.population * FOOD_PER_PERSON)
+    groups.population *= np.where(fed >= 1.0, GROWTH, DECLINE)
+    np.maximum(groups.population, 1.0, out=groups.population)
+    return groups
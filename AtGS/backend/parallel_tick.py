@@ -0,0 +1,254 @@
+import json
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from grid_engine import CITY_FOUND_PROB, CITY_START_POPULATION, EXPAND_PROB, TILES_PER_CITY, UNOWNED, claim_tiles
+from economy import economy_step
+from instrumentation import span
+
+# Region-parallel monthly tick for the grid engine.
+#
+# The map is cut into bands of REGION_ROWS rows. Every month runs the phases of
+# grid_engine.monthly_grid_update, three of them in parallel over the regions:
+#
+#   1. expansion: each region computes the claims on its own rows, reading one
+#      halo row above and below. All regions read the ownership as it was at
+#      the start of the month and the claims are applied only once all regions
+#      returned, so a border tile is decided by the region that owns its row
+#      alone, with the same smallest-draw rule as grid_engine.claim_tiles.
+#   2. city founding: each region proposes a site for every founding civ (the
+#      owned tile with the smallest draw); the smallest draw over all regions
+#      wins.
+#   3. population growth: each region grows the cities on its rows.
+#
+# Randomness never depends on which process runs what: every region draws from
+# a generator seeded with (seed, month, region, phase), and every civ has its
+# own persistent generator for its founding decisions. The regions do not
+# depend on the worker count either, so a run is bit-identical for any number
+# of workers.
+#
+# With workers > 1 the ownership and the land mask live in shared memory; the
+# workers only read them, all writes happen in the main process.
+
+REGION_ROWS = 128
+
+# Mixed into the seeds so region and civ streams never coincide
+REGION_STREAM = 1
+CIV_STREAM = 2
+EXPANSION_PHASE = 0
+CITY_PHASE = 1
+GROWTH_PHASE = 2
+
+# Worker side: views on the shared arrays, set up once per process
+_shared = {}
+
+
+def region_rng(seed, month, region, phase):
+    return np.random.default_rng([seed, REGION_STREAM, month, region, phase])
+
+
+def _attach_shared(ownership_name, land_name, shape, dtype):
+    for key, name, array_dtype in (("ownership", ownership_name, dtype), ("land_mask", land_name, bool)):
+        shm = shared_memory.SharedMemory(name=name)
+        _shared[key + "_shm"] = shm
+        _shared[key] = np.ndarray(shape, dtype=array_dtype, buffer=shm.buf)
+
+
+def region_claims(ownership, land_mask, y0, y1, rng, expand_prob=EXPAND_PROB):
+    """Expansion claims on rows [y0, y1) from the month-start ownership; returns map (ys, xs, owners)."""
+    h, w = ownership.shape
+    padded = np.full((y1 - y0 + 2, w + 2), UNOWNED, dtype=ownership.dtype)
+    # Halo rows, UNOWNED beyond the map edge
+    top, bottom = max(y0 - 1, 0), min(y1 + 1, h)
+    padded[top - y0 + 1:bottom - y0 + 1, 1:-1] = ownership[top:bottom]
+    ys, xs, owners = claim_tiles(padded, land_mask[y0:y1], rng, expand_prob)
+    return ys + y0, xs, owners
+
+
+def region_sites(ownership, y0, y1, rng, founder_ids, city_tiles):
+    """
+    Site proposals for one region: (site_owners, site_tiles, site_keys) with the
+    smallest-draw owned tile of every founder on rows [y0, y1) that has no city yet.
+    """
+    w = ownership.shape[1]
+    flat = ownership[y0:y1].ravel()
+    candidates = np.flatnonzero(np.isin(flat, founder_ids))
+    candidates = candidates[np.isin(candidates + y0 * w, city_tiles, invert=True)]
+    owners = flat[candidates]
+    keys = rng.random(candidates.size)
+    order = np.lexsort((keys, owners))
+    first = np.ones(order.size, dtype=bool)
+    first[1:] = owners[order[1:]] != owners[order[:-1]]
+    return owners[order[first]], candidates[order[first]] + y0 * w, keys[order[first]]
+
+
+def region_growth(rng, populations, low, high):
+    """Grown populations of the cities on one region's rows."""
+    return (populations * rng.uniform(low, high, populations.size)).astype(np.int64)
+
+
+def _claims_worker(y0, y1, seed, month, region, expand_prob):
+    return region_claims(_shared["ownership"], _shared["land_mask"], y0, y1,
+                         region_rng(seed, month, region, EXPANSION_PHASE), expand_prob)
+
+
+def _sites_worker(y0, y1, seed, month, region, founder_ids, city_tiles):
+    return region_sites(_shared["ownership"], y0, y1, region_rng(seed, month, region, CITY_PHASE), founder_ids,
+                        city_tiles)
+
+
+def _growth_worker(seed, month, region, populations, low, high):
+    return region_growth(region_rng(seed, month, region, GROWTH_PHASE), populations, low, high)
+
+
+class ParallelTick:
+    """
+    Runs grid_engine.monthly_grid_update's expansion, city founding and population growth
+    region by region on a process pool. Use self.ownership instead of the array
+    passed in; close() ends the pool and returns the final ownership.
+    """
+
+    def __init__(self, ownership, land_mask, seed, num_civs, workers=1, month=0, region_rows=REGION_ROWS):
+        self.seed = seed
+        self.month = month
+        self.workers = workers
+        height = ownership.shape[0]
+        self.regions = [(y0, min(y0 + region_rows, height)) for y0 in range(0, height, region_rows)]
+        self.region_rows = region_rows
+        self.civ_rngs = [np.random.default_rng(child)
+                         for child in np.random.SeedSequence([seed, CIV_STREAM]).spawn(num_civs)]
+
+        self._pool = None
+        self._shms = []
+        if workers > 1:
+            self.ownership = self._share(ownership)
+            shared_land = self._share(land_mask.astype(bool))
+            self._pool = ProcessPoolExecutor(max_workers=workers, initializer=_attach_shared,
+                                             initargs=(self._shms[0].name, self._shms[1].name, ownership.shape,
+                                                       ownership.dtype))
+            self.land_mask = shared_land
+        else:
+            self.ownership = ownership
+            self.land_mask = land_mask
+
+    def _share(self, array):
+        shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self._shms.append(shm)
+        shared = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+        shared[:] = array
+        return shared
+
+    def _run(self, worker, local, tasks):
+        """Results of all region tasks in region order, on the pool or in this process."""
+        if self._pool is not None:
+            return list(self._pool.map(worker, *zip(*tasks)))
+        return [local(*task) for task in tasks]
+
+    def _local_claims(self, y0, y1, seed, month, region, expand_prob):
+        return region_claims(self.ownership, self.land_mask, y0, y1, region_rng(seed, month, region, EXPANSION_PHASE),
+                             expand_prob)
+
+    def _local_sites(self, y0, y1, seed, month, region, *args):
+        return region_sites(self.ownership, y0, y1, region_rng(seed, month, region, CITY_PHASE), *args)
+
+    def _local_growth(self, seed, month, region, *args):
+        return region_growth(region_rng(seed, month, region, GROWTH_PHASE), *args)
+
+    def step(self, table, recorder=None, expand_prob=EXPAND_PROB, economy=None):
+        """
+        One month on a civ_table.CivTable. With an economy.Economy the growth
+        range of every civ comes from its food.
+        """
+        num_civs = len(table)
+        cities = table.cities
+        width = self.ownership.shape[1]
+
+        with span("expansion"):
+            tasks = [(y0, y1, self.seed, self.month, region, expand_prob)
+                     for region, (y0, y1) in enumerate(self.regions)]
+            claims = self._run(_claims_worker, self._local_claims, tasks)
+            ys, xs, owners = (np.concatenate(part) for part in zip(*claims))
+            self.ownership[ys, xs] = owners
+            if recorder is not None:
+                recorder.record_claim_arrays(ys, xs, owners)
+            table.territory_size += np.bincount(owners, minlength=num_civs)
+            if economy is not None:
+                economy.add_tiles(ys.astype(np.int64) * width + xs, owners)
+
+        with span("city_founding"):
+            # One draw per civ and month, so every civ's stream advances the same way
+            draws = np.array([rng.random() for rng in self.civ_rngs])
+            city_counts = cities.counts_by_owner(num_civs)
+            founding = (table.territory_size > city_counts * TILES_PER_CITY) & (draws < CITY_FOUND_PROB)
+            founder_ids = np.flatnonzero(founding).astype(self.ownership.dtype)
+            if founder_ids.size:
+                city_tiles = cities.y.astype(np.int64) * width + cities.x
+                tasks = [(y0, y1, self.seed, self.month, region, founder_ids, city_tiles)
+                         for region, (y0, y1) in enumerate(self.regions)]
+                results = self._run(_sites_worker, self._local_sites, tasks)
+                site_owners, site_tiles, site_keys = (np.concatenate(part) for part in zip(*results))
+                # Smallest draw over all regions; ties (never in practice) go to the upper region
+                order = np.lexsort((np.arange(site_owners.size), site_keys, site_owners))
+                first = np.ones(order.size, dtype=bool)
+                first[1:] = site_owners[order[1:]] != site_owners[order[:-1]]
+                new_owners = site_owners[order[first]].astype(np.int32)
+                tiles = site_tiles[order[first]]
+                xs, ys = tiles % width, tiles // width
+                populations = np.full(new_owners.size, CITY_START_POPULATION, dtype=np.int64)
+                if recorder is not None:
+                    recorder.record_city_arrays(new_owners, xs, ys, populations)
+                cities.add_many(new_owners, xs, ys, populations)
+
+        if economy is not None:
+            with span("economy"):
+                low, high = economy_step(table, economy)
+        else:
+            # CityTable.grow_population's default range
+            low, high = np.full(num_civs, 1.01), np.full(num_civs, 1.05)
+
+        with span("population_growth"):
+            city_regions = cities.y // self.region_rows
+            order = np.argsort(city_regions, kind="stable")
+            bounds = np.searchsorted(city_regions[order], np.arange(len(self.regions) + 1))
+            tasks = []
+            for region in range(len(self.regions)):
+                rows = order[bounds[region]:bounds[region + 1]]
+                city_owners = cities.owner[rows]
+                tasks.append((self.seed, self.month, region, cities.population[rows], low[city_owners],
+                              high[city_owners]))
+            results = self._run(_growth_worker, self._local_growth, tasks)
+            population = cities.population
+            for region, grown in enumerate(results):
+                population[order[bounds[region]:bounds[region + 1]]] = grown
+
+        self.month += 1
+        return table
+
+    def to_arrays(self, prefix="tick_"):
+        """The civ stream states (for checkpoint.Checkpointer); the region streams only depend on the month."""
+        return {prefix + "civ_rng_states": np.array(json.dumps([rng.bit_generator.state for rng in self.civ_rngs]))}
+
+    def restore_arrays(self, arrays, prefix="tick_"):
+        """Continues the civ streams saved by to_arrays; create the tick with the checkpoint's month."""
+        for rng, state in zip(self.civ_rngs, json.loads(arrays[prefix + "civ_rng_states"].item())):
+            rng.bit_generator.state = state
+
+    def close(self):
+        """Shuts the pool down and returns the ownership as a regular array."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        if self._shms:
+            self.ownership = self.ownership.copy()
+            self.land_mask = None
+            for shm in self._shms:
+                shm.close()
+                shm.unlink()
+            self._shms = []
+        return self.ownership
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,452 @@
+import argparse
+import asyncio
+import base64
+import json
+import mimetypes
+import os
+import random
+import time
+import urllib.parse
+from email.utils import formatdate, parsedate_to_datetime
+
+import numpy as np
+import world_generation
+from world_cache import load_or_generate_world
+from biomes import OCEAN
+from civ import spawn_civs
+from civ_table import CivTable, city_columns
+from grid_engine import init_ownership_grid, monthly_grid_update
+from diplomacy import init_diplomacy_states, update_diplomacy_states
+from world_export import write_binary_world
+from tiles import write_biome_tiles
+
+# Live simulation server (asyncio, standard library only).
+#
+#   python server.py --seed 42 --months 2400
+#   -> http://127.0.0.1:8000/
+#
+# The grid engine runs as a background task and every month is pushed to the
+# connected browsers as a Server-Sent Event:
+#
+#   GET /live/events   "snapshot" on connect (full ownership, cities, populations,
+#                      diplomacy), then one "tick" per month with the changes only
+#   GET /live/status   month, months, finished, connected clients
+#
+# Each client has its own queue of ticks that have not been sent yet. The
+# simulation only appends to it; a slow client gets the queued ticks merged into
+# one coalesced "tick" once its socket drains, and if it falls so far behind that
+# the queue holds more claims than an eighth of the map, it gets a fresh
+# snapshot instead. The simulation never waits for a client.
+#
+# The static terrain layers (world_manifest.json, *.bin, tiles/) are exported
+# once at startup and served under the same paths as with http.server, next to
+# the frontend, with ETag/Last-Modified revalidation.
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8000
+DEFAULT_TICK_SECONDS = 0.1
+
+STATIC_CACHE_CONTROL = "no-cache"  # Always revalidate; unchanged files are answered with 304
+EVENTS_RETRY_MS = 2000
+
+
+def _b64(array):
+    return base64.b64encode(np.ascontiguousarray(array).tobytes()).decode("ascii")
+
+
+class TickRecorder:
+    """Recorder for monthly_grid_update that keeps the claims and new cities of one month in memory."""
+
+    def __init__(self, map_width):
+        self.map_width = map_width
+        self._reset()
+
+    def _reset(self):
+        self._claims = []
+        self._cities = []
+
+    def record_claim_arrays(self, ys, xs, owners):
+        self._claims.append((ys.astype(np.int64) * self.map_width + xs, owners))
+
+    def record_city_arrays(self, owners, xs, ys, populations):
+        self._cities.append((owners, ys.astype(np.int64) * self.map_width + xs, populations))
+
+    def take(self):
+        """Returns (claim_tiles, claim_owners, city_owners, city_tiles, city_pops) and starts a new month."""
+        claims = self._claims or [(np.zeros(0, np.int64), np.zeros(0, np.int64))]
+        cities = self._cities or [(np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0))]
+        result = (np.concatenate([tiles for tiles, _ in claims]),
+                  np.concatenate([owners for _, owners in claims]),
+                  np.concatenate([owners for owners, _, _ in cities]),
+                  np.concatenate([tiles for _, tiles, _ in cities]),
+                  np.concatenate([pops for _, _, pops in cities]))
+        self._reset()
+        return result
+
+
+class TickDelta:
+    """The changes of one month: claimed tiles, new cities, civ populations and diplomacy pairs."""
+
+    __slots__ = ("month", "claim_tiles", "claim_owners", "city_owners", "city_tiles", "city_pops",
+                 "pop_civs", "pop_values", "diplomacy_pairs", "diplomacy_states", "finished")
+
+    def __init__(self, month, claim_tiles, claim_owners, city_owners, city_tiles, city_pops,
+                 pop_civs, pop_values, diplomacy_pairs, diplomacy_states, finished=False):
+        self.month = month
+        self.claim_tiles = claim_tiles
+        self.claim_owners = claim_owners
+        self.city_owners = city_owners
+        self.city_tiles = city_tiles
+        self.city_pops = city_pops
+        self.pop_civs = pop_civs
+        self.pop_values = pop_values
+        self.diplomacy_pairs = diplomacy_pairs
+        self.diplomacy_states = diplomacy_states
+        self.finished = finished
+
+    @staticmethod
+    def _last_per_key(key_arrays, value_arrays):
+        """Concatenates (key, value) arrays in order; for repeated keys the last value wins."""
+        keys = np.concatenate(key_arrays)
+        values = np.concatenate(value_arrays)
+        unique, last = np.unique(keys[::-1], return_index=True)
+        return unique, values[::-1][last]
+
+    @classmethod
+    def coalesce(cls, deltas):
+        """Merges consecutive deltas into one that leads from the state before the first to the state after the last."""
+        if len(deltas) == 1:
+            return deltas[0]
+        claim_tiles, claim_owners = cls._last_per_key([d.claim_tiles for d in deltas],
+                                                      [d.claim_owners for d in deltas])
+        pop_civs, pop_values = cls._last_per_key([d.pop_civs for d in deltas], [d.pop_values for d in deltas])
+        pairs, states = cls._last_per_key([d.diplomacy_pairs for d in deltas],
+                                          [d.diplomacy_states for d in deltas])
+        return cls(deltas[-1].month, claim_tiles, claim_owners,
+                   np.concatenate([d.city_owners for d in deltas]),
+                   np.concatenate([d.city_tiles for d in deltas]),
+                   np.concatenate([d.city_pops for d in deltas]),
+                   pop_civs, pop_values, pairs, states, finished=deltas[-1].finished)
+
+    def to_json(self, ticks=1):
+        return json.dumps({
+            "month": self.month,
+            "ticks": ticks,
+            "finished": self.finished,
+            "claim_tiles": self.claim_tiles.tolist(),
+            "claim_owners": self.claim_owners.tolist(),
+            "city_owners": self.city_owners.tolist(),
+            "city_tiles": self.city_tiles.tolist(),
+            "city_pops": np.round(self.city_pops, 1).tolist(),
+            "pop_civs": self.pop_civs.tolist(),
+            "pop_values": np.round(self.pop_values, 1).tolist(),
+            "diplomacy_pairs": self.diplomacy_pairs.tolist(),
+            "diplomacy_states": self.diplomacy_states.tolist(),
+        }, separators=(",", ":"))
+
+
+class _Client:
+    __slots__ = ("pending", "pending_claims", "needs_snapshot", "wakeup")
+
+    def __init__(self):
+        self.pending = []
+        self.pending_claims = 0
+        self.needs_snapshot = True
+        self.wakeup = asyncio.Event()
+        self.wakeup.set()
+
+
+class LiveSimulation:
+    """Grid engine state plus the clients that follow it."""
+
+    def __init__(self, seed, num_civs=15, months=30 * 12, tick_seconds=DEFAULT_TICK_SECONDS,
+                 width=world_generation.map_width, height=world_generation.map_height):
+        self.seed = seed
+        self.months = months
+        self.tick_seconds = tick_seconds
+        self.world = load_or_generate_world(seed, width, height)
+        self.map_width = self.world["map_width"]
+        self.map_height = self.world["map_height"]
+        self.land_mask = self.world["biome_ids"] != OCEAN
+
+        # Same start as main.py --engine grid with this seed
+        random.seed(seed)
+        self.civs = spawn_civs(self.world["biome_ids"], self.map_width, self.map_height, num_civs=num_civs)
+        self.rng = np.random.default_rng(seed)
+        self.relations = init_diplomacy_states(len(self.civs))
+        self.ownership = init_ownership_grid(self.civs, self.map_width, self.map_height)
+        self.table = CivTable.from_civ_dicts(self.civs, self.rng)
+        self.month = 0
+        self.finished = False
+
+        self.recorder = TickRecorder(self.map_width)
+        self.populations = self._civ_populations()
+        self.max_pending_claims = self.map_width * self.map_height // 8
+        self.clients = set()
+        self.state_lock = asyncio.Lock()
+        self._snapshot = None  # (month, JSON text), shared by clients connecting in the same month
+
+    def export_static(self, output_dir, export_tiles=True):
+        """Writes the terrain layers and the starting state the frontend loads before it subscribes."""
+        path = write_binary_world(output_dir, self.world, self.civs, self.ownership, relations=self.relations)
+        print("Static layers written:", path)
+        if export_tiles:
+            print("Biome tiles written:", write_biome_tiles(output_dir, self.world["biome_rgb"]))
+            self.world.release("biome_rgb")
+
+    def _civ_populations(self):
+        owners, _, _, populations = city_columns(self.table)
+        return np.bincount(owners, weights=populations, minlength=len(self.table))
+
+    def _step(self):
+        """One month; runs in a worker thread while state_lock is held."""
+        previous_relations = self.relations.copy()
+        self.table = monthly_grid_update(self.table, self.ownership, self.land_mask, self.rng,
+                                         recorder=self.recorder)
+        self.relations = update_diplomacy_states(self.table, self.relations, self.rng)
+        self.month += 1
+        self.finished = self.month >= self.months
+
+        populations = self._civ_populations()
+        pop_civs = np.flatnonzero(populations != self.populations)
+        self.populations = populations
+        pairs = np.flatnonzero(self.relations != previous_relations)
+        return TickDelta(self.month, *self.recorder.take(), pop_civs, populations[pop_civs],
+                         pairs, self.relations[pairs], finished=self.finished)
+
+    def snapshot_json(self):
+        """Full state of the current month (call with state_lock held)."""
+        if self._snapshot is None or self._snapshot[0] != self.month:
+            owners, xs, ys, city_pops = city_columns(self.table)
+            # owner + 1 (0 = unowned) like write_binary_world, int32 once the ids no longer fit uint16
+            ownership = self.ownership.ravel().astype(np.int64) + 1
+            ownership_dtype = "uint16" if len(self.table) < np.iinfo(np.uint16).max else "int32"
+            ownership = ownership.astype("<u2" if ownership_dtype == "uint16" else "<i4")
+            self._snapshot = (self.month, json.dumps({
+                "month": self.month,
+                "months": self.months,
+                "finished": self.finished,
+                "ownership": _b64(ownership),
+                "ownership_dtype": ownership_dtype,
+                "city_owners": owners.tolist(),
+                "city_tiles": (ys.astype(np.int64) * self.map_width + xs).tolist(),
+                "city_pops": np.round(city_pops, 1).tolist(),
+                "populations": np.round(self.populations, 1).tolist(),
+                "diplomacy": _b64(self.relations.astype(np.uint8)),
+            }, separators=(",", ":")))
+        return self._snapshot[1]
+
+    def status(self):
+        return {"seed": self.seed, "month": self.month, "months": self.months, "finished": self.finished,
+                "clients": len(self.clients)}
+
+    def _broadcast(self, delta):
+        for client in self.clients:
+            if client.needs_snapshot:
+                continue  # The snapshot will already contain this month
+            client.pending.append(delta)
+            client.pending_claims += delta.claim_tiles.size
+            if client.pending_claims > self.max_pending_claims:
+                client.pending = []
+                client.pending_claims = 0
+                client.needs_snapshot = True
+            client.wakeup.set()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        print(f"Simulating {self.months} months, {self.tick_seconds}s per month at most...")
+        while self.month < self.months:
+            start = time.perf_counter()
+            async with self.state_lock:
+                delta = await loop.run_in_executor(None, self._step)
+                self._broadcast(delta)
+            if self.month % 12 == 0:
+                print(f"Year {self.month // 12} simulated, {len(self.clients)} clients")
+            await asyncio.sleep(max(0.0, self.tick_seconds - (time.perf_counter() - start)))
+        print("Simulation finished; still serving the final state.")
+
+    async def next_event(self, client):
+        """Waits until client has something to receive; returns (event name, data)."""
+        while True:
+            await client.wakeup.wait()
+            client.wakeup.clear()
+            async with self.state_lock:
+                if client.needs_snapshot:
+                    client.needs_snapshot = False
+                    client.pending = []
+                    client.pending_claims = 0
+                    return "snapshot", self.snapshot_json()
+                if client.pending:
+                    deltas = client.pending
+                    client.pending = []
+                    client.pending_claims = 0
+                    return "tick", TickDelta.coalesce(deltas).to_json(ticks=len(deltas))
+
+
+class LiveServer:
+    """Minimal HTTP/1.1 server: static files, the status and the event stream. One request per connection."""
+
+    def __init__(self, simulation, static_routes):
+        self.simulation = simulation
+        # URL prefix -> directory, longest prefix first
+        self.static_routes = sorted(static_routes.items(), key=lambda route: -len(route[0]))
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            parts = request_line.decode("latin-1").split()
+            if len(parts) != 3:
+                return
+            method, target, _ = parts
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            path = urllib.parse.unquote(urllib.parse.urlsplit(target).path)
+            if method not in ("GET", "HEAD"):
+                await self._respond(writer, 405, b"Method not allowed", extra={"Allow": "GET, HEAD"})
+            elif path == "/":
+                await self._respond(writer, 302, b"", extra={"Location": "/frontend/index.html"})
+            elif path == "/live/status":
+                body = json.dumps(self.simulation.status()).encode("utf-8")
+                await self._respond(writer, 200, body, "application/json", head_only=method == "HEAD",
+                                    extra={"Cache-Control": "no-store"})
+            elif path == "/live/events":
+                await self._stream_events(reader, writer)
+            else:
+                await self._serve_static(writer, path, headers, head_only=method == "HEAD")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, body, content_type="text/plain; charset=utf-8", head_only=False,
+                       extra=None):
+        reason = {200: "OK", 302: "Found", 304: "Not Modified", 404: "Not Found",
+                  405: "Method Not Allowed"}[status]
+        lines = [f"HTTP/1.1 {status} {reason}", f"Content-Type: {content_type}",
+                 f"Content-Length: {len(body)}", "Connection: close"]
+        lines += [f"{name}: {value}" for name, value in (extra or {}).items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        if not head_only and status != 304:
+            writer.write(body)
+        await writer.drain()
+
+    def _resolve_static(self, path):
+        for prefix, directory in self.static_routes:
+            if path.startswith(prefix):
+                root = os.path.realpath(directory)
+                file_path = os.path.realpath(os.path.join(root, path[len(prefix):]))
+                if file_path.startswith(root + os.sep) and os.path.isfile(file_path):
+                    return file_path
+        return None
+
+    async def _serve_static(self, writer, path, headers, head_only=False):
+        file_path = self._resolve_static(path)
+        if file_path is None:
+            await self._respond(writer, 404, b"Not found")
+            return
+        stat = os.stat(file_path)
+        etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        cache_headers = {"ETag": etag, "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+                         "Cache-Control": STATIC_CACHE_CONTROL}
+        if _not_modified(headers, etag, stat.st_mtime):
+            await self._respond(writer, 304, b"", extra=cache_headers)
+            return
+        with open(file_path, "rb") as f:
+            body = f.read()
+        content_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+        await self._respond(writer, 200, body, content_type, head_only=head_only, extra=cache_headers)
+
+    async def _stream_events(self, reader, writer):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-store\r\n"
+                     b"Connection: close\r\n\r\n" + f"retry: {EVENTS_RETRY_MS}\n\n".encode("ascii"))
+        await writer.drain()
+        client = _Client()
+        self.simulation.clients.add(client)
+        # The browser sends nothing more; EOF means it went away (also while no ticks are coming)
+        disconnected = asyncio.ensure_future(reader.read())
+        try:
+            while True:
+                next_event = asyncio.ensure_future(self.simulation.next_event(client))
+                await asyncio.wait({next_event, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if not next_event.done():
+                    next_event.cancel()
+                    return
+                event, data = next_event.result()
+                writer.write(f"event: {event}\ndata: {data}\n\n".encode("utf-8"))
+                # Blocks while the socket buffer is full; ticks pile up in client.pending meanwhile
+                await writer.drain()
+        finally:
+            disconnected.cancel()
+            self.simulation.clients.discard(client)
+
+
+def _not_modified(headers, etag, mtime):
+    """Conditional GET: If-None-Match decides when present, If-Modified-Since otherwise (RFC 7232)."""
+    if "if-none-match" in headers:
+        # "*" or a list of tags; If-None-Match compares weakly, so W/ prefixes are ignored
+        tags = [tag.strip() for tag in headers["if-none-match"].split(",")]
+        return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+    if "if-modified-since" in headers:
+        try:
+            since = parsedate_to_datetime(headers["if-modified-since"])
+        except (TypeError, ValueError):
+            return False
+        # HTTP dates have whole seconds, like the Last-Modified we sent
+        return since.tzinfo is not None and int(mtime) <= since.timestamp()
+    return False
+
+
+async def serve(simulation, host=DEFAULT_HOST, port=DEFAULT_PORT, static_routes=None):
+    server = LiveServer(simulation, static_routes or {})
+    http_server = await asyncio.start_server(server.handle, host, port)
+    print(f"Serving on http://{host}:{port}/")
+    simulation_task = asyncio.create_task(simulation.run())
+    async with http_server:
+        await http_server.serve_forever()
+    await simulation_task
+
+
+def main(seed=None, num_civs=15, months=30 * 12, tick_seconds=DEFAULT_TICK_SECONDS, host=DEFAULT_HOST,
+         port=DEFAULT_PORT, export_tiles=True, width=world_generation.map_width, height=world_generation.map_height):
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    data_dir = os.path.join(script_dir, 'backend', 'data')
+    frontend_dir = os.path.join(os.path.dirname(script_dir), 'frontend')
+
+    if seed is None:
+        seed = random.randint(0, 99999)
+    print(f"World seed: {seed}")
+
+    async def run():
+        simulation = LiveSimulation(seed, num_civs=num_civs, months=months, tick_seconds=tick_seconds,
+                                    width=width, height=height)
+        simulation.export_static(data_dir, export_tiles=export_tiles)
+        # Same URLs as http.server started in AtGS, so the frontend's relative paths work unchanged
+        await serve(simulation, host, port, {"/frontend/": frontend_dir, "/backend/backend/data/": data_dir})
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the grid engine live and stream it to the browser.")
+    parser.add_argument("--seed", type=int, default=None, help="world seed (random if omitted)")
+    parser.add_argument("--num-civs", type=int, default=15)
+    parser.add_argument("--months", type=int, default=30 * 12, help="months to simulate")
+    parser.add_argument("--tick-seconds", type=float, default=DEFAULT_TICK_SECONDS,
+                        help="minimum wall time per month (0 = as fast as possible)")
+    parser.add_argument("--width", type=int, default=world_generation.map_width)
+    parser.add_argument("--height", type=int, default=world_generation.map_height)
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--no-tiles", action="store_true", help="skip the biome tile pyramid")
+    args = parser.parse_args()
+    main(seed=args.seed, num_civs=args.num_civs, months=args.months, tick_seconds=args.tick_seconds,
+         host=args.host, port=args.port, export_tiles=not args.no_tiles, width=args.width, height=args.height)
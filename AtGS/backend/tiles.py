@@ -0,0 +1,84 @@
+import json
+import os
+import struct
+import zlib
+import numpy as np
+
+# Mipmapped biome tile pyramid for the frontend.
+#
+#   tiles/tiles.json                       tile size, map size and the levels
+#   tiles/<level>/<row>_<col>.png          RGB tiles of at most TILE_SIZE x TILE_SIZE
+#
+# Level 0 is the full resolution; every further level halves width and height
+# (2x2 color average) until the whole map fits into a single tile. The frontend
+# only fetches the tiles visible at its current zoom and pan.
+
+TILE_SIZE = 256
+TILES_DIR_NAME = "tiles"
+TILES_MANIFEST_NAME = "tiles.json"
+
+
+def _png_chunk(chunk_type, data):
+    return (struct.pack(">I", len(data)) + chunk_type + data
+            + struct.pack(">I", zlib.crc32(chunk_type + data) & 0xFFFFFFFF))
+
+
+def encode_png(rgb, compress_level=6):
+    """Encodes an (h, w, 3) uint8 array as an RGB PNG (filter type 0 on every row)."""
+    height, width, _ = rgb.shape
+    rows = np.empty((height, 1 + width * 3), dtype=np.uint8)
+    rows[:, 0] = 0
+    rows[:, 1:] = rgb.reshape(height, width * 3)
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", header)
+            + _png_chunk(b"IDAT", zlib.compress(rows.tobytes(), compress_level)) + _png_chunk(b"IEND", b""))
+
+
+def downsample(rgb):
+    """Halves an RGB image by averaging 2x2 blocks; odd edges are padded by repeating the last row/column."""
+    height, width, _ = rgb.shape
+    padded = np.pad(rgb, ((0, height % 2), (0, width % 2), (0, 0)), mode="edge").astype(np.uint16)
+    summed = padded[0::2, 0::2] + padded[1::2, 0::2] + padded[0::2, 1::2] + padded[1::2, 1::2]
+    return ((summed + 2) // 4).astype(np.uint8)
+
+
+def write_biome_tiles(output_dir, biome_rgb, tile_size=TILE_SIZE):
+    """
+    Writes the tile pyramid of an (h, w, 3) biome color image (world["biome_rgb"])
+    to output_dir/tiles and returns the path of the manifest.
+    """
+    tiles_dir = os.path.join(output_dir, TILES_DIR_NAME)
+    map_height, map_width, _ = biome_rgb.shape
+
+    levels = []
+    image = np.ascontiguousarray(biome_rgb)
+    level = 0
+    while True:
+        height, width, _ = image.shape
+        rows = -(-height // tile_size)
+        cols = -(-width // tile_size)
+        level_dir = os.path.join(tiles_dir, str(level))
+        os.makedirs(level_dir, exist_ok=True)
+        for row in range(rows):
+            for col in range(cols):
+                tile = image[row * tile_size:(row + 1) * tile_size, col * tile_size:(col + 1) * tile_size]
+                with open(os.path.join(level_dir, f"{row}_{col}.png"), 'wb') as f:
+                    f.write(encode_png(tile))
+        levels.append({"level": level, "scale": 2 ** level, "width": width, "height": height,
+                       "rows": rows, "cols": cols})
+
+        if rows == 1 and cols == 1:
+            break
+        image = downsample(image)
+        level += 1
+
+    manifest = {
+        "map_width": map_width,
+        "map_height": map_height,
+        "tile_size": tile_size,
+        "levels": levels,
+    }
+    path = os.path.join(tiles_dir, TILES_MANIFEST_NAME)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return path
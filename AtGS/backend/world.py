@@ -0,0 +1,82 @@
+import numpy as np
+from biomes import BIOME_COLOR_TABLE, BIOME_COLORS, BIOME_NAMES
+
+# Generated terrain as float32 arrays. Only the noise layers and the biome IDs
+# are stored; resource maps and the biome color image are computed from them
+# on first access and cached on the object.
+
+LAYER_DTYPE = np.float32
+
+# lake_map/river_map: uint8 masks from the hydrology pass
+BASE_LAYERS = ["height_map", "temp_map", "moist_map", "biome_ids", "lake_map", "river_map"]
+
+
+def _resource_layer(source):
+    def compute(world):
+        return np.clip(world[source] * LAYER_DTYPE(10), 0, 10).astype(LAYER_DTYPE, copy=False)
+    return compute
+
+
+DERIVED_LAYERS = {
+    "food_map": _resource_layer("height_map"),
+    "wood_map": _resource_layer("temp_map"),
+    "minerals_map": _resource_layer("moist_map"),
+    # (h, w, 3) uint8 RGB image of the biome map
+    "biome_rgb": lambda world: BIOME_COLOR_TABLE[world["biome_ids"]],
+}
+
+# What the frontend reads besides the biome map and ownership
+DEFAULT_EXPORT_LAYERS = ["food_map", "wood_map", "minerals_map"]
+
+
+class World:
+    """
+    Dict-style access to one generated world: world["map_width"], world["height_map"],
+    world["food_map"] (computed on first access), ...
+    """
+
+    VALUE_KEYS = ("seed", "map_width", "map_height", "biome_names", "biome_colors")
+
+    def __init__(self, seed, map_width, map_height, layers, biome_names=BIOME_NAMES, biome_colors=BIOME_COLORS):
+        self.seed = seed
+        self.map_width = map_width
+        self.map_height = map_height
+        self.biome_names = biome_names
+        self.biome_colors = biome_colors
+        self._layers = dict(layers)
+
+    def __getitem__(self, name):
+        if name in self.VALUE_KEYS:
+            return getattr(self, name)
+        layer = self._layers.get(name)
+        if layer is None:
+            if name not in DERIVED_LAYERS:
+                raise KeyError(name)
+            layer = self._layers[name] = DERIVED_LAYERS[name](self)
+        return layer
+
+    def __contains__(self, name):
+        return name in self.VALUE_KEYS or name in self._layers or name in DERIVED_LAYERS
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def layer_names(self):
+        return BASE_LAYERS + [name for name in DERIVED_LAYERS if name not in BASE_LAYERS]
+
+    def metadata(self):
+        """The non-array values, e.g. for a JSON header."""
+        return {key: getattr(self, key) for key in self.VALUE_KEYS}
+
+    def base_layers(self):
+        """The stored layers everything else is derived from."""
+        return {name: self._layers[name] for name in BASE_LAYERS}
+
+    def release(self, name):
+        """Drops a cached derived layer; it is recomputed on the next access."""
+        if name in DERIVED_LAYERS:
+            self._layers.pop(name, None)
+
+    def nbytes(self):
+        """Bytes held by the layers that are currently materialized."""
+        return sum(layer.nbytes for layer in self._layers.values())
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+import world_generation
+from world_generation import generate_world
+from world import World
+
+# On-disk cache of generated worlds. Each entry is a directory named after the
+# hash of everything that determines the terrain; array layers are stored as
+# .npy files and opened memory-mapped, everything else goes into meta.json.
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'worlds')
+DEFAULT_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+META_FILE_NAME = "meta.json"
+
+
+def world_cache_key(seed, width, height, erosion_iterations=None):
+    """Hash of the generation inputs (seed, size, noise parameters, sea level, erosion, generator version)."""
+    if erosion_iterations is None:
+        erosion_iterations = world_generation.erosion_iterations
+    params = {
+        "seed": seed,
+        "width": width,
+        "height": height,
+        "scale": world_generation.scale,
+        "octaves": world_generation.octaves,
+        "persistence": world_generation.persistence,
+        "lacunarity": world_generation.lacunarity,
+        "sea_level": world_generation.sea_level,
+        "erosion_iterations": erosion_iterations,
+        "generator_version": world_generation.GENERATOR_VERSION,
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()[:20]
+
+
+def _entry_size(entry_dir):
+    return sum(os.path.getsize(os.path.join(entry_dir, name)) for name in os.listdir(entry_dir))
+
+
+def _load_entry(entry_dir):
+    with open(os.path.join(entry_dir, META_FILE_NAME), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+
+    # Read-only memory maps: only the pages that are actually touched get loaded
+    layers = {name: np.load(os.path.join(entry_dir, f"{name}.npy"), mmap_mode='r') for name in meta["layers"]}
+
+    # Mark as recently used for the LRU eviction
+    os.utime(os.path.join(entry_dir, META_FILE_NAME))
+    return World(layers=layers, **meta["values"])
+
+
+def _store_entry(cache_dir, key, world):
+    entry_dir = os.path.join(cache_dir, key)
+    tmp_dir = f"{entry_dir}.tmp-{os.getpid()}"
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    # Derived layers are cheap to recompute and not stored
+    layers = world.base_layers()
+    for name, layer in layers.items():
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), layer)
+
+    with open(os.path.join(tmp_dir, META_FILE_NAME), 'w', encoding='utf-8') as f:
+        json.dump({"key": key, "layers": list(layers), "values": world.metadata()}, f)
+
+    # Publish the finished entry in one step; a concurrent writer may have won the race
+    try:
+        os.replace(tmp_dir, entry_dir)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return entry_dir
+
+
+def evict_lru(cache_dir, max_bytes, keep=None):
+    """Deletes least recently used entries until the cache fits into max_bytes."""
+    entries = []
+    for name in os.listdir(cache_dir):
+        entry_dir = os.path.join(cache_dir, name)
+        meta_path = os.path.join(entry_dir, META_FILE_NAME)
+        if os.path.isfile(meta_path):
+            entries.append((os.path.getmtime(meta_path), name, _entry_size(entry_dir)))
+
+    total = sum(size for _, _, size in entries)
+    for _, name, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if name == keep:
+            continue
+        print(f"world_cache: evicting {name} ({size / 1024 ** 2:.1f} MB)")
+        shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+        total -= size
+
+
+def load_or_generate_world(seed, width=world_generation.map_width, height=world_generation.map_height,
+                           cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_MAX_BYTES, **generate_kwargs):
+    """
+    Returns the world for seed/width/height from the cache, generating and storing
+    it on a miss. Cached layers are read-only memory maps.
+    """
+    key = world_cache_key(seed, width, height, generate_kwargs.get("erosion_iterations"))
+    entry_dir = os.path.join(cache_dir, key)
+
+    if os.path.isfile(os.path.join(entry_dir, META_FILE_NAME)):
+        print(f"world_cache: hit {key} (seed {seed}, {width}x{height})")
+        return _load_entry(entry_dir)
+
+    print(f"world_cache: miss {key} (seed {seed}, {width}x{height}), generating...")
+    world = generate_world(width, height, seed=seed, **generate_kwargs)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    _store_entry(cache_dir, key, world)
+    evict_lru(cache_dir, max_bytes, keep=key)
+    return world
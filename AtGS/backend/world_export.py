@@ -0,0 +1,109 @@
+import json
+import os
+import numpy as np
+from civ import INTERNAL_CIV_KEYS
+from diplomacy import DIPLOMACY_STATES
+from world import DEFAULT_EXPORT_LAYERS
+
+# Binary export: a small JSON manifest plus one raw little-endian blob per layer.
+# The frontend maps each blob straight into a typed array without parsing.
+MANIFEST_NAME = "world_manifest.json"
+BINARY_FORMAT_VERSION = 2
+
+# numpy dtype -> name of the matching JavaScript typed array element type
+DTYPE_NAMES = {
+    "<f4": "float32",
+    "|u1": "uint8",
+    "<u2": "uint16",
+    "<i2": "int16",
+    "<i4": "int32",
+}
+
+
+def ownership_to_array(map_ownership):
+    """Returns ownership as an integer array with -1 for unowned tiles."""
+    if isinstance(map_ownership, np.ndarray):
+        return map_ownership
+    return np.array([[-1 if owner is None else owner for owner in row] for row in map_ownership],
+                    dtype=np.int32)
+
+
+def _write_layer(output_dir, name, values, dtype):
+    array = np.ascontiguousarray(values, dtype=dtype)
+    file_name = f"{name}.bin"
+    array.tofile(os.path.join(output_dir, file_name))
+    return {
+        "file": file_name,
+        "dtype": DTYPE_NAMES[array.dtype.str],
+        "shape": list(array.shape),
+    }
+
+
+def write_binary_world(output_dir, world, civs, ownership, relations=None, layers=DEFAULT_EXPORT_LAYERS,
+                       nomads=None):
+    """
+    Writes the requested world layers, the biome map and ownership as raw blobs
+    and the metadata (dimensions, biome tables, civs without their territory) as
+    the manifest. Territory is derivable from the ownership layer, so it is not
+    repeated in the manifest. relations is the condensed diplomacy state vector
+    (see diplomacy.init_diplomacy_states), nomads a nomads.NomadGroups.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    layer_names = layers
+    layers = {}
+    for name in layer_names:
+        values = world[name]
+        layers[name] = _write_layer(output_dir, name, values, "<f4" if values.dtype.kind == "f" else values.dtype.str)
+    layers["biome_map"] = _write_layer(output_dir, "biome_map", world["biome_ids"], "|u1")
+
+    # Stored as owner + 1 (0 = unowned), so the frontend can use it as its uint16 raster as is
+    if len(civs) < np.iinfo(np.uint16).max:
+        layers["map_ownership"] = _write_layer(output_dir, "map_ownership", ownership + 1, "<u2")
+    else:
+        layers["map_ownership"] = _write_layer(output_dir, "map_ownership", ownership.astype(np.int64) + 1, "<i4")
+    layers["map_ownership"]["owner_offset"] = 1
+    if relations is not None:
+        layers["diplomacy"] = _write_layer(output_dir, "diplomacy", relations, "|u1")
+
+    manifest_civs = []
+    for civ in civs:
+        manifest_civ = {key: value for key, value in civ.items()
+                        if key != "territory" and key not in INTERNAL_CIV_KEYS}
+        manifest_civ["territory_size"] = len(civ["territory"])
+        manifest_civs.append(manifest_civ)
+
+    manifest = {
+        "format_version": BINARY_FORMAT_VERSION,
+        "seed": world["seed"],
+        "map_width": world["map_width"],
+        "map_height": world["map_height"],
+        "biome_names": world["biome_names"],
+        "biome_colors": world["biome_colors"],
+        "diplomacy_states": DIPLOMACY_STATES,
+        "layers": layers,
+        "civs": manifest_civs,
+    }
+    if nomads is not None:
+        manifest["nomads"] = nomads.to_dict()
+
+    # Manifest last, so a reader never sees it before its blobs exist
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    return path
+
+
+def remove_binary_world(output_dir):
+    """Deletes the manifest and the blobs it lists, e.g. before a JSON export replaces them."""
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    # Manifest first, so the frontend never finds it without its blobs
+    os.remove(path)
+    for layer in manifest.get("layers", {}).values():
+        layer_path = os.path.join(output_dir, layer["file"])
+        if os.path.exists(layer_path):
+            os.remove(layer_path)
@@ -1,7 +1,13 @@
 import numpy as np
 import json
 import random
-from opensimplex import OpenSimplex
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from biomes import add_water_biomes, classify_biome_ids
+from noise_backends import default_backend, load_backend
+from hydrology import generate_hydrology
+from world import LAYER_DTYPE, World
+from instrumentation import span
 
 map_width = 1920
 map_height = 1080
@@ -11,39 +17,119 @@ octaves = 6
 persistence = 0.5
 lacunarity = 2.0
 sea_level = 0.4
+# Iterations of the hydraulic erosion pass (0 = off)
+erosion_iterations = 0
+
+# Bump whenever a change alters the generated layers, so cached worlds are not reused
+GENERATOR_VERSION = 3
+
+
+# Anzahl Zeilen, die pro Block auf einmal ausgewertet werden (begrenzt Zwischenspeicher)
+NOISE_ROW_CHUNK = 128
+# Kantenlaenge der Kacheln im Multiprozess-Modus
+NOISE_TILE_SIZE = 512
+
+
+def _generate_noise_map_rows(tile, seed, width, height, scale, octaves_simplex, persistence_simplex,
+                             lacunarity_simplex):
+    noise_map = np.empty((height, width))
+
+    for y_start in range(0, height, NOISE_ROW_CHUNK):
+        y_end = min(y_start + NOISE_ROW_CHUNK, height)
+        noise_map[y_start:y_end] = tile(seed, 0, width, y_start, y_end, scale, octaves_simplex,
+                                        persistence_simplex, lacunarity_simplex)
+
+    return noise_map
+
+
+def _split_tiles(width, height, tile_size):
+    return [(x, min(x + tile_size, width), y, min(y + tile_size, height))
+            for y in range(0, height, tile_size)
+            for x in range(0, width, tile_size)]
+
+
+def _noise_tile_worker(shm_name, width, height, tile, backend, seed, scale, octaves_simplex, persistence_simplex,
+                       lacunarity_simplex):
+    """Pass 1: compute one tile into the shared map and report its local min/max."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        noise_map = np.ndarray((height, width), dtype=np.float64, buffer=shm.buf)
+        x_start, x_end, y_start, y_end = tile
+        values = load_backend(backend)(seed, x_start, x_end, y_start, y_end, scale, octaves_simplex,
+                                       persistence_simplex, lacunarity_simplex)
+        noise_map[y_start:y_end, x_start:x_end] = values
+        result = (values.min(), values.max())
+        del noise_map
+        return result
+    finally:
+        shm.close()
+
+
+def _normalize_tile_worker(shm_name, width, height, tile, min_val, max_val):
+    """Pass 2: normalize one tile in place with the global min/max."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        noise_map = np.ndarray((height, width), dtype=np.float64, buffer=shm.buf)
+        x_start, x_end, y_start, y_end = tile
+        view = noise_map[y_start:y_end, x_start:x_end]
+        if max_val == min_val:
+            view.fill(0.5)
+        else:
+            view[...] = (view - min_val) / (max_val - min_val)
+        del view, noise_map
+    finally:
+        shm.close()
+
+
+def _generate_noise_map_tiled(backend, seed, width, height, scale, octaves_simplex, persistence_simplex,
+                              lacunarity_simplex, workers, tile_size):
+    """
+    Computes the noise map tile by tile in a process pool. All tiles write into one
+    shared-memory array; normalization runs as a second pass with the global min/max,
+    so the result is identical to the single-process path.
+    """
+    tiles = _split_tiles(width, height, tile_size)
+    shm = shared_memory.SharedMemory(create=True, size=width * height * np.dtype(np.float64).itemsize)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            extrema = list(pool.map(_noise_tile_worker,
+                                    *zip(*[(shm.name, width, height, tile, backend, seed, scale, octaves_simplex,
+                                            persistence_simplex, lacunarity_simplex) for tile in tiles])))
+            print(f"generate_noise_map: {len(tiles)} tiles finished on {workers} workers")
+
+            min_val = min(lo for lo, hi in extrema)
+            max_val = max(hi for lo, hi in extrema)
+            list(pool.map(_normalize_tile_worker,
+                          *zip(*[(shm.name, width, height, tile, min_val, max_val) for tile in tiles])))
+
+        noise_map = np.ndarray((height, width), dtype=np.float64, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return noise_map
 
 
 def generate_noise_map(width, height, scale, seed=0, octaves_simplex=6, persistence_simplex=0.5,
-                       lacunarity_simplex=2.0):  # Parameter für FBM hinzugefügt
-    print(f"generate_noise_map (opensimplex): START - w:{width}, h:{height}, sc:{scale}, seed:{seed}")
-    simplex = OpenSimplex(seed=seed)
-    noise_map = np.zeros((height, width))
-    print(f"generate_noise_map: np.zeros created")
-
-    for y in range(height):
-        if y % (height // 10 if height >= 10 else 1) == 0:  # Print progress
-            print(f"generate_noise_map: Processing row {y}/{height}")
-        for x in range(width):
-            # Fractional Brownian Motion (FBM)
-            current_amplitude = 1.0
-            current_frequency = 1.0
-            total_value = 0.0
-
-            for i in range(octaves_simplex):
-                nx = x / scale * current_frequency
-                ny = y / scale * current_frequency
-                try:
-                    # OpenSimplex noise2 gibt Werte im Bereich [-1, 1] zurück
-                    noise_val = simplex.noise2(nx, ny)
-                    total_value += noise_val * current_amplitude
-                except Exception as e:
-                    print(f"ERROR in OpenSimplex noise2 at x={x}, y={y}, nx={nx}, ny={ny}: {e}")
-                    # Hier sollte kein C-Crash passieren, eher eine Python Exception
-
-                current_amplitude *= persistence_simplex
-                current_frequency *= lacunarity_simplex
-
-            noise_map[y][x] = total_value
+                       lacunarity_simplex=2.0, vectorized=True, workers=1,
+                       tile_size=NOISE_TILE_SIZE, dtype=np.float64, backend=None):  # Parameter für FBM hinzugefügt
+    """
+    Returns a (height, width) array of FBM noise normalized to [0, 1]. The noise is
+    always accumulated in float64; dtype only sets the type of the result.
+    backend names a noise_backends backend; by default the calibrated (or else the
+    NumPy) OpenSimplex backend is used, vectorized=False picks the per-pixel one.
+    With workers > 1 the map is computed in tiles on a process pool.
+    """
+    if backend is None:
+        backend = default_backend() if vectorized else "opensimplex"
+    print(f"generate_noise_map ({backend}): START - w:{width}, h:{height}, sc:{scale}, seed:{seed}")
+
+    if workers > 1:
+        # Tiled-Modus normalisiert bereits selbst mit globalem min/max
+        return _generate_noise_map_tiled(backend, seed, width, height, scale, octaves_simplex, persistence_simplex,
+                                         lacunarity_simplex, workers, tile_size).astype(dtype, copy=False)
+    noise_map = _generate_noise_map_rows(load_backend(backend), seed, width, height, scale, octaves_simplex,
+                                         persistence_simplex, lacunarity_simplex)
 
     print(f"generate_noise_map: noise generation loop finished")
 
@@ -53,107 +139,64 @@ def generate_noise_map(width, height, scale, seed=0, octaves_simplex=6, persiste
     if max_val == min_val:  # Verhindert Division durch Null, falls alle Werte gleich sind
         noise_map.fill(0.5)  # oder einen anderen Standardwert
     else:
-        noise_map = (noise_map - min_val) / (max_val - min_val)
+        noise_map -= min_val
+        noise_map /= max_val - min_val
 
     print(f"generate_noise_map: Normalization complete")
-    return noise_map.tolist()
-def classify_biome(h, t, m):
-    if h < sea_level:
-        return 'Ocean'
-    elif h < sea_level + 0.05:
-        return 'Beach'
-    else:
-        if t > 0.7:
-            if m < 0.3:
-                return 'Desert'
-            elif m > 0.7:
-                return 'Swamp'
-            else:
-                return 'Grassland'
-        elif t > 0.4:
-            if m < 0.3:
-                return 'Grassland'
-            else:
-                return 'Forest'
-        else:
-            if h > 0.8:
-                return 'Snow'
-            elif m > 0.5:
-                return 'Taiga'
-            else:
-                return 'Tundra'
-
-def generate_world():
-    seed = random.randint(0, 99999)
+    return noise_map.astype(dtype, copy=False)
+
+
+def generate_world(width=map_width, height=map_height, workers=1, tile_size=NOISE_TILE_SIZE, seed=None,
+                   erosion_iterations=erosion_iterations):
+    """
+    Generates the float32 height/temp/moisture layers and the biome IDs as a
+    world.World; resource maps are derived from them on first access.
+    The height map is eroded for erosion_iterations and gets lake and river
+    layers from the hydrology pass (the moisture is the precipitation).
+    workers > 1 switches noise generation to the tiled multi-process mode.
+    Without a seed a random one is picked; it is returned as world["seed"].
+    """
+    if seed is None:
+        seed = random.randint(0, 99999)
+    noise_kwargs = {
+        "seed": seed,
+        "octaves_simplex": octaves,
+        "persistence_simplex": persistence,
+        "lacunarity_simplex": lacunarity,
+        "workers": workers,
+        "tile_size": tile_size,
+        "dtype": LAYER_DTYPE,
+    }
+
     print("generate_world: Generating height_map...")
-    height_map = np.array(
-        generate_noise_map(map_width, map_height, scale,  # Positionale Argumente: width, height, scale
-                           seed=seed,  # Schlüsselwortargument für seed
-                           octaves_simplex=octaves,
-                           # Schlüsselwortargument für octaves_simplex (verwendet die globale Variable 'octaves')
-                           persistence_simplex=persistence,
-                           # Schlüsselwortargument für persistence_simplex (verwendet globale 'persistence')
-                           lacunarity_simplex=lacunarity)
-        # Schlüsselwortargument für lacunarity_simplex (verwendet globale 'lacunarity')
-    )
+    with span("generation.height_map"):
+        height_map = generate_noise_map(width, height, scale, **noise_kwargs)
     print("generate_world: height_map generated.")
 
     print("generate_world: Generating temp_map...")
-    temp_map = np.array(
-        generate_noise_map(map_width, map_height, scale * 2,  # Positionale Argumente, beachte scale * 2
-                           seed=seed,
-                           octaves_simplex=octaves,
-                           persistence_simplex=persistence,
-                           lacunarity_simplex=lacunarity)
-    )
+    with span("generation.temp_map"):
+        temp_map = generate_noise_map(width, height, scale * 2, **noise_kwargs)
     print("generate_world: temp_map generated.")
 
     print("generate_world: Generating moist_map...")
-    moist_map = np.array(
-        generate_noise_map(map_width, map_height, scale * 1.5,  # Positionale Argumente, beachte scale * 1.5
-                           seed=seed,
-                           octaves_simplex=octaves,
-                           persistence_simplex=persistence,
-                           lacunarity_simplex=lacunarity)
-    )
-
-    for y_idx in range(map_height):
-        lat_factor = 1 - abs((y_idx / map_height) * 2 - 1)
-        temp_map[y_idx, :] *= lat_factor
-
-    biome_map = []
-    for y in range(map_height):
-        row = []
-        for x in range(map_width):
-            biome = classify_biome(height_map[y, x], temp_map[y, x], moist_map[y, x])
-            row.append(biome)
-        biome_map.append(row)
-
-    biome_colors = {
-        'Ocean': [0, 0, 128],
-        'Beach': [238, 214, 175],
-        'Desert': [210, 180, 140],
-        'Swamp': [47, 79, 47],
-        'Grassland': [124, 252, 0],
-        'Forest': [34, 139, 34],
-        'Snow': [255, 250, 250],
-        'Taiga': [0, 100, 0],
-        'Tundra': [176, 196, 222],
-    }
-
-    food_map = np.clip(height_map * 10, 0, 10).tolist()
-    wood_map = np.clip(temp_map * 10, 0, 10).tolist()
-    minerals_map = np.clip(moist_map * 10, 0, 10).tolist()
-
-    return {
-        "map_width": map_width,
-        "map_height": map_height,
-        "height_map": height_map.tolist(),
-        "temp_map": temp_map.tolist(),
-        "moist_map": moist_map.tolist(),
-        "biome_map": biome_map,
-        "biome_colors": biome_colors,
-        "food_map": food_map,
-        "wood_map": wood_map,
-        "minerals_map": minerals_map,
-    }
+    with span("generation.moist_map"):
+        moist_map = generate_noise_map(width, height, scale * 1.5, **noise_kwargs)
+
+    print("generate_world: Running hydrology...")
+    height_map, lake_map, river_map = generate_hydrology(height_map, moist_map, sea_level, erosion_iterations)
+
+    lat_factor = 1 - np.abs((np.arange(height) / height) * 2 - 1)
+    temp_map *= lat_factor[:, np.newaxis].astype(LAYER_DTYPE)
+
+    with span("generation.biomes"):
+        biome_ids = classify_biome_ids(height_map, temp_map, moist_map, sea_level)
+        biome_ids = add_water_biomes(biome_ids, lake_map, river_map)
+
+    return World(seed, width, height, {
+        "height_map": height_map,
+        "temp_map": temp_map,
+        "moist_map": moist_map,
+        "biome_ids": biome_ids,
+        "lake_map": lake_map,
+        "river_map": river_map,
+    })
@@ -10,21 +10,519 @@ let info;   // Element to display information
 let biomeCanvas; // Offscreen canvas for biomes
 let biomeCtx;    // Context for biome canvas
 
-const DEBUG_DRAW_SCALE_TERRITORY = 3; // Make territory tiles 3x3 for visibility
+let history = null;     // Indexed history.bin.gz, if the backend recorded one
+let live = null;        // Live state streamed by server.py, if the page is served by it
+let replayMonth = -1;   // Month currently shown by the replay (-1 = nothing applied yet)
+let monthsPerFrame = 1; // Replay speed
+let civsById = new Map();
+let scrubber;           // Range input used to scrub through the history
+
 const DEBUG_DRAW_SCALE_CITY = 5;     // Make city radius 5 for visibility
 
+// Territory raster: ownership[tile] = civ id + 1, 0 = unowned. It is painted into
+// territoryImage (one RGBA pixel per tile); only the blocks whose ownership
+// changed are copied to territoryCanvas before the next frame.
+let ownership = null;
+let territoryCanvas;
+let territoryCtx;
+let territoryImage;
+let territoryPixels;              // Uint32Array view of territoryImage.data
+let ownerColors = new Uint32Array(1); // Packed RGBA per ownership value, 0 = transparent
+const TERRITORY_ALPHA = 150;
+const DIRTY_BLOCK_SIZE = 64;      // Tiles per side of a repaint block
+let dirtyBlocks = null;           // 1 = block has to be repainted
+let dirtyCols = 0;
+let dirtyList = [];               // Indices of the dirty blocks, in marking order
+let allDirty = false;
+let oceanId = -1;
+let cityTiles = new Set();        // Tile indices that hold a city (JS simulation)
+
+const DATA_BASE_URL = '../backend/backend/data/';
+const TILES_BASE_URL = DATA_BASE_URL + 'tiles/';
+const LIVE_BASE_URL = '../live/';
+
+let tileManifest = null;     // tiles/tiles.json, if the backend wrote a biome tile pyramid
+const tileCache = new Map(); // "level/row_col" -> Image, in least recently used order
+const TILE_CACHE_LIMIT = 256;
+
+// zoom = canvas pixels per map tile, offsetX/offsetY = map coordinate at the canvas top-left
+const view = { zoom: 1, offsetX: 0, offsetY: 0 };
+const ZOOM_STEP = 1.5;
+const MAX_ZOOM = 32;
+let dragStart = null;
+
+// Element types of the binary layers listed in world_manifest.json
+const TYPED_ARRAYS = {
+  float32: Float32Array,
+  uint8: Uint8Array,
+  uint16: Uint16Array,
+  int16: Int16Array,
+  int32: Int32Array,
+};
+
+// The binary layers are little-endian; typed arrays use the platform byte order.
+const IS_LITTLE_ENDIAN = new Uint8Array(new Uint16Array([1]).buffer)[0] === 1;
+
+// Loads the compact export (manifest + raw layer blobs). Returns null if there is none.
+async function loadBinaryWorld() {
+  if (!IS_LITTLE_ENDIAN) {
+    console.warn('loadBinaryWorld: Big-endian platform, falling back to JSON.');
+    return null;
+  }
+  const response = await fetch(DATA_BASE_URL + 'world_manifest.json');
+  if (!response.ok) {
+    return null;
+  }
+  const manifest = await response.json();
+
+  const data = {
+    seed: manifest.seed,
+    map_width: manifest.map_width,
+    map_height: manifest.map_height,
+    biome_names: manifest.biome_names,
+    biome_colors: manifest.biome_colors,
+    civs: manifest.civs,
+  };
+
+  const layerNames = Object.keys(manifest.layers);
+  const buffers = await Promise.all(layerNames.map(async (name) => {
+    const layerResponse = await fetch(DATA_BASE_URL + manifest.layers[name].file);
+    if (!layerResponse.ok) {
+      throw new Error(`Failed to load layer ${name}: ${layerResponse.status}`);
+    }
+    return layerResponse.arrayBuffer();
+  }));
+  layerNames.forEach((name, i) => {
+    data[name] = new TYPED_ARRAYS[manifest.layers[name].dtype](buffers[i]);
+  });
+  // Format 1 stored the owner ids with -1 for unowned tiles
+  data.ownerOffset = manifest.layers.map_ownership ? (manifest.layers.map_ownership.owner_offset || 0) : 0;
+
+  console.log(`loadBinaryWorld: Loaded ${layerNames.length} binary layers.`);
+  return data;
+}
+
+// Loads the legacy world_data.json and flattens its grids into the same typed layers.
+async function loadJsonWorld() {
+  const response = await fetch(DATA_BASE_URL + 'world_data.json');
+  if (!response.ok) {
+    throw new Error(`Failed to load world data: ${response.status} ${response.statusText}`);
+  }
+  const data = await response.json();
+  console.log('loadJsonWorld: World data JSON loaded and parsed.');
+
+  data.biome_names = data.biome_names || Object.keys(data.biome_colors);
+  const biomeIds = new Map(data.biome_names.map((name, id) => [name, id]));
+  data.biome_map = flattenGrid(data.biome_map, Uint8Array, name => biomeIds.get(name));
+  for (const name of ['food_map', 'wood_map', 'minerals_map']) {
+    if (data[name]) data[name] = flattenGrid(data[name], Float32Array, value => value);
+  }
+  data.map_ownership = flattenGrid(data.map_ownership, Int32Array, owner => (owner === null ? -1 : owner));
+  data.ownerOffset = 0;
+  return data;
+}
+
+function flattenGrid(rows, ArrayType, convert) {
+  if (!rows) return null;
+  const width = rows.length > 0 ? rows[0].length : 0;
+  const flat = new ArrayType(rows.length * width);
+  for (let y = 0; y < rows.length; y++) {
+    const row = rows[y];
+    for (let x = 0; x < width; x++) {
+      flat[y * width + x] = convert(row[x]);
+    }
+  }
+  return flat;
+}
+
+// --- Territory raster ---
+
+// Packs an RGBA color into one Uint32 pixel of an ImageData buffer
+function packColor(r, g, b, a) {
+  return IS_LITTLE_ENDIAN ? ((a << 24) | (b << 16) | (g << 8) | r) >>> 0 : ((r << 24) | (g << 16) | (b << 8) | a) >>> 0;
+}
+
+function hexToRgb(hexColor) {
+  const value = parseInt(hexColor.slice(1), 16);
+  return [(value >> 16) & 255, (value >> 8) & 255, value & 255];
+}
+
+function updateOwnerColors() {
+  let maxId = 0;
+  for (const civ of worldData.civs) {
+    if (typeof civ.id === 'number') maxId = Math.max(maxId, civ.id);
+  }
+  ownerColors = new Uint32Array(maxId + 2);
+  for (const civ of worldData.civs) {
+    if (typeof civ.id !== 'number') continue;
+    const [r, g, b] = hexToRgb(civ.color);
+    ownerColors[civ.id + 1] = packColor(r, g, b, TERRITORY_ALPHA);
+  }
+  markAllDirty();
+}
+
+// Creates the raster and the overlay; owners is the ownership layer, stored with owners[tile] = id + offset
+function initTerritoryLayer(owners, offset) {
+  const width = worldData.map_width;
+  const height = worldData.map_height;
+  if (owners instanceof Uint16Array && offset === 1) {
+    ownership = owners;
+  } else {
+    ownership = new Uint16Array(width * height);
+    if (owners) setOwnership(owners, offset);
+  }
+
+  territoryCanvas = document.createElement('canvas');
+  territoryCanvas.width = width;
+  territoryCanvas.height = height;
+  territoryCtx = territoryCanvas.getContext('2d');
+  territoryImage = territoryCtx.createImageData(width, height);
+  territoryPixels = new Uint32Array(territoryImage.data.buffer);
+
+  dirtyCols = Math.ceil(width / DIRTY_BLOCK_SIZE);
+  dirtyBlocks = new Uint8Array(dirtyCols * Math.ceil(height / DIRTY_BLOCK_SIZE));
+  markAllDirty();
+}
+
+// Replaces the whole raster, e.g. from a history keyframe (owners[tile] = id + offset, unowned below offset)
+function setOwnership(owners, offset) {
+  const shift = 1 - offset;
+  for (let i = 0; i < owners.length; i++) {
+    const value = owners[i] + shift;
+    ownership[i] = value > 0 ? value : 0;
+  }
+  markAllDirty();
+}
+
+function setTileOwner(idx, owner) {
+  ownership[idx] = owner + 1;
+  if (allDirty) return;
+  const x = idx % worldData.map_width;
+  const y = (idx - x) / worldData.map_width;
+  const block = Math.floor(y / DIRTY_BLOCK_SIZE) * dirtyCols + Math.floor(x / DIRTY_BLOCK_SIZE);
+  if (!dirtyBlocks[block]) {
+    dirtyBlocks[block] = 1;
+    dirtyList.push(block);
+  }
+}
+
+function markAllDirty() {
+  allDirty = true;
+  if (dirtyBlocks) dirtyBlocks.fill(0);
+  dirtyList = [];
+}
+
+function paintTerritoryRect(x0, y0, x1, y1) {
+  const width = worldData.map_width;
+  for (let y = y0; y < y1; y++) {
+    let i = y * width + x0;
+    const end = y * width + x1;
+    for (; i < end; i++) territoryPixels[i] = ownerColors[ownership[i]];
+  }
+  territoryCtx.putImageData(territoryImage, 0, 0, x0, y0, x1 - x0, y1 - y0);
+}
+
+// Copies the changed blocks (or everything after a keyframe) to the overlay canvas
+function repaintTerritory() {
+  if (!ownership) return;
+  const width = worldData.map_width;
+  const height = worldData.map_height;
+  if (allDirty) {
+    paintTerritoryRect(0, 0, width, height);
+    allDirty = false;
+    return;
+  }
+  for (const block of dirtyList) {
+    const x0 = (block % dirtyCols) * DIRTY_BLOCK_SIZE;
+    const y0 = Math.floor(block / dirtyCols) * DIRTY_BLOCK_SIZE;
+    paintTerritoryRect(x0, y0, Math.min(width, x0 + DIRTY_BLOCK_SIZE), Math.min(height, y0 + DIRTY_BLOCK_SIZE));
+    dirtyBlocks[block] = 0;
+  }
+  dirtyList = [];
+}
+
+// Per-civ tile lists for the JS simulation: tiles for city sites, frontier for expansion
+function initSimulationTerritory() {
+  for (const civ of worldData.civs) {
+    civ.tiles = [];
+    civ.frontier = [];
+  }
+  for (let i = 0; i < ownership.length; i++) {
+    if (ownership[i] === 0) continue;
+    const civ = civsById.get(ownership[i] - 1);
+    if (civ) civ.tiles.push(i);
+  }
+  cityTiles = new Set();
+  for (const civ of worldData.civs) {
+    civ.frontier = civ.tiles.slice();
+    for (const city of civ.cities || []) {
+      if (city.location) cityTiles.add(tileIndex(city.location[0], city.location[1]));
+    }
+  }
+}
+
+const HISTORY_RECORD_MONTH = 1;
+const HISTORY_RECORD_KEYFRAME = 2;
+const HISTORY_VERSION = 2;
+const HISTORY_FILE_HEADER_BYTES = 28;
+const HISTORY_RECORD_HEADER_BYTES = 16;
+const MAX_MONTHS_PER_FRAME = 120;
+
+// Loads the per-month delta log written by main.py --history. Returns null if there is none
+// or if it was recorded for a different world.
+async function loadHistory() {
+  if (typeof DecompressionStream === 'undefined') {
+    console.warn('loadHistory: DecompressionStream not supported, replay disabled.');
+    return null;
+  }
+  const response = await fetch(DATA_BASE_URL + 'history.bin.gz');
+  if (!response.ok) {
+    return null;
+  }
+  const stream = response.body.pipeThrough(new DecompressionStream('gzip'));
+  const buffer = await new Response(stream).arrayBuffer();
+  const indexed = indexHistory(buffer);
+  if (indexed.width !== worldData.map_width ||
+      indexed.height !== worldData.map_height || indexed.seed !== worldData.seed) {
+    console.warn(`loadHistory: History (seed ${indexed.seed}, ${indexed.width}x${indexed.height}) does not match ` +
+      `the world (seed ${worldData.seed}, ${worldData.map_width}x${worldData.map_height}), ignoring it.`);
+    return null;
+  }
+  return indexed;
+}
+
+// Scans the record headers once so seeking never has to parse payloads it skips.
+function indexHistory(buffer) {
+  const view = new DataView(buffer);
+  const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+  if (magic !== 'ATGH') {
+    throw new Error('Invalid history file');
+  }
+  // Version 1 files have no seed to check them against the world
+  if (view.getUint32(4, true) < HISTORY_VERSION) {
+    throw new Error('Outdated history file, record it again with --history');
+  }
+  const indexed = {
+    buffer,
+    view,
+    seed: Number(view.getBigInt64(20, true)),
+    width: view.getUint32(8, true),
+    height: view.getUint32(12, true),
+    keyframeInterval: view.getUint32(16, true),
+    monthRecords: [],
+    keyframes: [],
+    lastMonth: 0,
+  };
+
+  let offset = HISTORY_FILE_HEADER_BYTES;
+  while (offset + HISTORY_RECORD_HEADER_BYTES <= buffer.byteLength) {
+    const record = {
+      type: view.getUint32(offset, true),
+      month: view.getUint32(offset + 4, true),
+      offset: offset + HISTORY_RECORD_HEADER_BYTES,
+      length: view.getUint32(offset + 8, true),
+    };
+    if (record.type === HISTORY_RECORD_KEYFRAME) {
+      indexed.keyframes.push(record);
+    } else if (record.type === HISTORY_RECORD_MONTH) {
+      indexed.monthRecords[record.month] = record;
+    }
+    indexed.lastMonth = Math.max(indexed.lastMonth, record.month);
+    offset = record.offset + record.length;
+  }
+  console.log(`indexHistory: ${indexed.lastMonth} months, ${indexed.keyframes.length} keyframes.`);
+  return indexed;
+}
+
+// Copies count elements out of the history buffer (slice keeps typed arrays aligned).
+function readHistoryArray(offset, ArrayType, count) {
+  const byteLength = count * ArrayType.BYTES_PER_ELEMENT;
+  return new ArrayType(history.buffer.slice(offset, offset + byteLength));
+}
+
+function readHistoryCities(offset, count) {
+  const owners = readHistoryArray(offset, Int32Array, count);
+  offset += owners.byteLength;
+  const tiles = readHistoryArray(offset, Uint32Array, count);
+  offset += tiles.byteLength;
+  const pops = readHistoryArray(offset, Float64Array, count);
+  offset += pops.byteLength;
+  return { owners, tiles, pops, offset };
+}
+
+function addCityAtTile(owner, tile, population) {
+  const civ = civsById.get(owner);
+  if (!civ) return;
+  civ.cities.push({
+    location: [tile % worldData.map_width, Math.floor(tile / worldData.map_width)],
+    population: population,
+  });
+}
+
+function setReplayPopulations(offset, count) {
+  const civIds = readHistoryArray(offset, Int32Array, count);
+  const values = readHistoryArray(offset + civIds.byteLength, Float64Array, count);
+  for (let i = 0; i < count; i++) {
+    const civ = civsById.get(civIds[i]);
+    if (civ) civ.population = values[i];
+  }
+}
+
+function applyKeyframe(record) {
+  let offset = record.offset;
+  const civCount = history.view.getUint32(offset, true);
+  const cityCount = history.view.getUint32(offset + 4, true);
+  offset += 16;
+
+  const owners = readHistoryArray(offset, Int32Array, history.width * history.height);
+  offset += owners.byteLength;
+  setOwnership(owners, 0);
+
+  for (const civ of worldData.civs) civ.cities = [];
+  const cities = readHistoryCities(offset, cityCount);
+  for (let i = 0; i < cityCount; i++) addCityAtTile(cities.owners[i], cities.tiles[i], cities.pops[i]);
+
+  setReplayPopulations(cities.offset, civCount);
+  replayMonth = record.month;
+}
+
+function applyMonth(record) {
+  let offset = record.offset;
+  const claimCount = history.view.getUint32(offset, true);
+  const cityCount = history.view.getUint32(offset + 4, true);
+  const popCount = history.view.getUint32(offset + 8, true);
+  offset += 16;
+
+  const claimOwners = readHistoryArray(offset, Int32Array, claimCount);
+  offset += claimOwners.byteLength;
+  const claimTiles = readHistoryArray(offset, Uint32Array, claimCount);
+  offset += claimTiles.byteLength;
+  for (let i = 0; i < claimCount; i++) {
+    setTileOwner(claimTiles[i], claimOwners[i]);
+  }
+
+  const cities = readHistoryCities(offset, cityCount);
+  for (let i = 0; i < cityCount; i++) addCityAtTile(cities.owners[i], cities.tiles[i], cities.pops[i]);
+
+  setReplayPopulations(cities.offset, popCount);
+  replayMonth = record.month;
+}
+
+// --- Live stream (server.py) ---
+
+// Subscribes to the server's event stream; returns null when the page is served statically.
+async function connectLive() {
+  let status;
+  try {
+    const response = await fetch(LIVE_BASE_URL + 'status');
+    if (!response.ok) return null;
+    status = await response.json();
+  } catch (e) {
+    return null;
+  }
+  const state = { month: status.month, months: status.months, finished: status.finished, ticksPerEvent: 1 };
+  const source = new EventSource(LIVE_BASE_URL + 'events');
+  source.addEventListener('snapshot', event => applyLiveSnapshot(state, JSON.parse(event.data)));
+  source.addEventListener('tick', event => applyLiveTick(state, JSON.parse(event.data)));
+  // EventSource reconnects by itself and the server starts the new stream with a snapshot
+  source.onerror = () => console.warn('connectLive: Event stream interrupted, reconnecting...');
+  console.log(`connectLive: Following the live simulation at month ${status.month}.`);
+  return state;
+}
+
+function decodeBase64(text) {
+  const binary = atob(text);
+  const bytes = new Uint8Array(binary.length);
+  for (let i = 0; i < binary.length; i++) bytes[i] = binary.charCodeAt(i);
+  return bytes;
+}
+
+function applyLiveSnapshot(state, data) {
+  const OwnershipArray = TYPED_ARRAYS[data.ownership_dtype || 'uint16'];
+  setOwnership(new OwnershipArray(decodeBase64(data.ownership).buffer), 1);
+  for (const civ of worldData.civs) civ.cities = [];
+  for (let i = 0; i < data.city_owners.length; i++) {
+    addCityAtTile(data.city_owners[i], data.city_tiles[i], data.city_pops[i]);
+  }
+  data.populations.forEach((population, id) => {
+    const civ = civsById.get(id);
+    if (civ) civ.population = population;
+  });
+  worldData.diplomacy = decodeBase64(data.diplomacy);
+  state.month = data.month;
+  state.months = data.months;
+  state.finished = data.finished;
+}
+
+// A tick may stand for several months the server coalesced while this client lagged behind
+function applyLiveTick(state, data) {
+  for (let i = 0; i < data.claim_tiles.length; i++) setTileOwner(data.claim_tiles[i], data.claim_owners[i]);
+  for (let i = 0; i < data.city_owners.length; i++) {
+    addCityAtTile(data.city_owners[i], data.city_tiles[i], data.city_pops[i]);
+  }
+  for (let i = 0; i < data.pop_civs.length; i++) {
+    const civ = civsById.get(data.pop_civs[i]);
+    if (civ) civ.population = data.pop_values[i];
+  }
+  if (worldData.diplomacy) {
+    for (let i = 0; i < data.diplomacy_pairs.length; i++) worldData.diplomacy[data.diplomacy_pairs[i]] = data.diplomacy_states[i];
+  }
+  state.month = data.month;
+  state.finished = data.finished;
+  state.ticksPerEvent = data.ticks;
+}
+
+// Jumps to month: restores the nearest keyframe when going backwards or far ahead,
+// then applies the monthly deltas up to the target.
+function seekHistory(month) {
+  month = Math.max(0, Math.min(history.lastMonth, month));
+  if (replayMonth < 0 || month < replayMonth || month - replayMonth > history.keyframeInterval) {
+    let keyframe = history.keyframes[0];
+    for (const candidate of history.keyframes) {
+      if (candidate.month <= month) keyframe = candidate;
+    }
+    applyKeyframe(keyframe);
+  }
+  while (replayMonth < month) {
+    const record = history.monthRecords[replayMonth + 1];
+    if (record) {
+      applyMonth(record);
+    } else {
+      replayMonth++;
+    }
+  }
+  if (scrubber) scrubber.value = replayMonth;
+}
+
+function speedUp() {
+  monthsPerFrame = Math.min(MAX_MONTHS_PER_FRAME, monthsPerFrame * 2);
+}
+
+function slowDown() {
+  monthsPerFrame = Math.max(1, Math.floor(monthsPerFrame / 2));
+}
+
+function tileIndex(x, y) {
+  return y * worldData.map_width + x;
+}
+
+function biomeNameAt(x, y) {
+  return worldData.biome_names[worldData.biome_map[tileIndex(x, y)]];
+}
+
+function isLand(idx) {
+  return worldData.biome_map[idx] !== oceanId;
+}
+
 async function loadData() {
   console.log('loadData: Attempting to load world data...');
   if (info) info.textContent = 'Loading world data...';
   try {
-    const response = await fetch('../backend/backend/data/world_data.json');
-    if (!response.ok) {
-      console.error('loadData: Failed to load world data HTTP error:', response.status, response.statusText);
-      if (info) info.textContent = `Failed to load world data: ${response.status}`;
-      return;
+    worldData = await loadBinaryWorld();
+    if (!worldData) {
+      console.log('loadData: No binary export found, loading world_data.json.');
+      worldData = await loadJsonWorld();
     }
-    worldData = await response.json();
-    console.log('loadData: World data JSON loaded and parsed.');
 
     if (!worldData || !worldData.map_width || !worldData.map_height) {
         console.error('loadData: World data is invalid or incomplete (missing map_width/map_height).');
@@ -33,10 +531,12 @@ async function loadData() {
     }
     console.log(`loadData: Map dimensions: ${worldData.map_width}x${worldData.map_height}`);
 
-    canvas.width = Math.floor(worldData.map_width);
-    canvas.height = Math.floor(worldData.map_height);
-
-    createBiomeCanvas(); // This seems to work as biomes are visible
+    tileManifest = await loadTileManifest();
+    if (!tileManifest) {
+      // Older exports without tiles: render the whole biome map once
+      createBiomeCanvas();
+    }
+    resizeCanvas();
 
     if (!worldData.civs || !Array.isArray(worldData.civs)) {
         console.warn('loadData: worldData.civs is missing or not an array.');
@@ -80,6 +580,35 @@ async function loadData() {
         console.warn("loadData: No civilizations were loaded from the JSON. Nothing to draw for civs.");
     }
 
+    civsById = new Map(worldData.civs.map(civ => [civ.id, civ]));
+    oceanId = worldData.biome_names.indexOf('Ocean');
+    initTerritoryLayer(worldData.map_ownership, worldData.ownerOffset);
+    worldData.map_ownership = null; // The raster replaces it
+    for (const civ of worldData.civs) delete civ.territory;
+    updateOwnerColors();
+
+    live = await connectLive();
+    if (!live) {
+      try {
+        history = await loadHistory();
+      } catch (e) {
+        console.warn('loadData: Could not load simulation history, using the JS simulation.', e);
+        history = null;
+      }
+    }
+    if (live) {
+      // The state arrives with the first "snapshot" event
+    } else if (history) {
+      seekHistory(0);
+      if (scrubber) {
+        scrubber.max = history.lastMonth;
+        scrubber.disabled = false;
+        scrubber.addEventListener('input', () => seekHistory(Number(scrubber.value)));
+      }
+    } else {
+      initSimulationTerritory();
+    }
+
 
     if (info) info.textContent = 'Simulation started';
     requestAnimationFrame(drawFrame);
@@ -89,6 +618,139 @@ async function loadData() {
   }
 }
 
+// --- Biome tile pyramid and view ---
+
+async function loadTileManifest() {
+  try {
+    const response = await fetch(TILES_BASE_URL + 'tiles.json');
+    if (!response.ok) return null;
+    const manifest = await response.json();
+    // Tiles left over from an export with a different map size are ignored
+    if (manifest.map_width !== worldData.map_width || manifest.map_height !== worldData.map_height) {
+      console.warn('loadTileManifest: Tile pyramid does not match the world size, ignoring it.');
+      return null;
+    }
+    console.log(`loadTileManifest: ${manifest.levels.length} tile levels of ${manifest.tile_size}px.`);
+    return manifest;
+  } catch (e) {
+    console.warn('loadTileManifest: No biome tiles available.', e);
+    return null;
+  }
+}
+
+function getTile(level, row, col) {
+  const key = `${level}/${row}_${col}`;
+  let image = tileCache.get(key);
+  if (image) {
+    // Re-insert to mark as most recently used
+    tileCache.delete(key);
+    tileCache.set(key, image);
+    return image;
+  }
+  image = new Image();
+  image.onload = () => renderScene();
+  image.src = `${TILES_BASE_URL}${key}.png`;
+  tileCache.set(key, image);
+  while (tileCache.size > TILE_CACHE_LIMIT) {
+    tileCache.delete(tileCache.keys().next().value);
+  }
+  return image;
+}
+
+// Coarsest level whose pixels are still at most one screen pixel wide
+function pickTileLevel() {
+  const level = Math.floor(Math.log2(1 / view.zoom));
+  return Math.max(0, Math.min(tileManifest.levels.length - 1, level));
+}
+
+function drawTileLevel(level) {
+  const span = tileManifest.tile_size * level.scale; // map tiles covered by one image tile
+  const x1 = view.offsetX + canvas.width / view.zoom;
+  const y1 = view.offsetY + canvas.height / view.zoom;
+  const colStart = Math.max(0, Math.floor(view.offsetX / span));
+  const rowStart = Math.max(0, Math.floor(view.offsetY / span));
+  const colEnd = Math.min(level.cols - 1, Math.floor(x1 / span));
+  const rowEnd = Math.min(level.rows - 1, Math.floor(y1 / span));
+
+  for (let row = rowStart; row <= rowEnd; row++) {
+    for (let col = colStart; col <= colEnd; col++) {
+      const image = getTile(level.level, row, col);
+      if (image.complete && image.naturalWidth) {
+        ctx.drawImage(image, col * span, row * span, image.naturalWidth * level.scale, image.naturalHeight * level.scale);
+      }
+    }
+  }
+}
+
+function drawBiomeTiles() {
+  const levels = tileManifest.levels;
+  // The single top-level tile is the placeholder until the detailed tiles arrive
+  drawTileLevel(levels[levels.length - 1]);
+  const level = pickTileLevel();
+  if (level !== levels.length - 1) drawTileLevel(levels[level]);
+}
+
+function resizeCanvas() {
+  canvas.width = window.innerWidth;
+  canvas.height = window.innerHeight;
+  resetView();
+}
+
+function fitZoom() {
+  return Math.min(canvas.width / worldData.map_width, canvas.height / worldData.map_height);
+}
+
+// Zooms by factor while keeping the map point under canvas pixel (cx, cy) in place
+function zoomAt(factor, cx, cy) {
+  if (!worldData) return;
+  const mapX = view.offsetX + cx / view.zoom;
+  const mapY = view.offsetY + cy / view.zoom;
+  view.zoom = Math.max(fitZoom() / 2, Math.min(MAX_ZOOM, view.zoom * factor));
+  view.offsetX = mapX - cx / view.zoom;
+  view.offsetY = mapY - cy / view.zoom;
+  renderScene();
+}
+
+function zoomIn() {
+  zoomAt(ZOOM_STEP, canvas.width / 2, canvas.height / 2);
+}
+
+function zoomOut() {
+  zoomAt(1 / ZOOM_STEP, canvas.width / 2, canvas.height / 2);
+}
+
+function resetView() {
+  if (!worldData) return;
+  view.zoom = fitZoom();
+  // Center the map
+  view.offsetX = (worldData.map_width - canvas.width / view.zoom) / 2;
+  view.offsetY = (worldData.map_height - canvas.height / view.zoom) / 2;
+  renderScene();
+}
+
+function setupViewControls() {
+  canvas.addEventListener('mousedown', (e) => {
+    dragStart = { x: e.clientX, y: e.clientY };
+  });
+  window.addEventListener('mousemove', (e) => {
+    if (!dragStart) return;
+    view.offsetX -= (e.clientX - dragStart.x) / view.zoom;
+    view.offsetY -= (e.clientY - dragStart.y) / view.zoom;
+    dragStart = { x: e.clientX, y: e.clientY };
+    renderScene();
+  });
+  window.addEventListener('mouseup', () => {
+    dragStart = null;
+  });
+  canvas.addEventListener('wheel', (e) => {
+    e.preventDefault();
+    zoomAt(e.deltaY < 0 ? ZOOM_STEP : 1 / ZOOM_STEP, e.offsetX, e.offsetY);
+  }, { passive: false });
+  window.addEventListener('resize', () => {
+    if (worldData) resizeCanvas();
+  });
+}
+
 function createBiomeCanvas() {
   // ... (this function seems to be working correctly, keep as is)
   biomeCanvas = document.createElement('canvas');
@@ -101,16 +763,15 @@ function createBiomeCanvas() {
   const imgData = biomeCtx.createImageData(width, height);
 
   const data = imgData.data;
-  for (let y = 0; y < worldData.map_height; y++) {
-    for (let x = 0; x < worldData.map_width; x++) {
-      const biome = worldData.biome_map[y][x];
-      const color = worldData.biome_colors[biome] || [0, 0, 0];
-      const idx = (y * worldData.map_width + x) * 4;
-      data[idx] = color[0];
-      data[idx + 1] = color[1];
-      data[idx + 2] = color[2];
-      data[idx + 3] = 255;
-    }
+  const palette = worldData.biome_names.map(name => worldData.biome_colors[name] || [0, 0, 0]);
+  const biomeMap = worldData.biome_map;
+  for (let i = 0; i < biomeMap.length; i++) {
+    const color = palette[biomeMap[i]] || [0, 0, 0];
+    const idx = i * 4;
+    data[idx] = color[0];
+    data[idx + 1] = color[1];
+    data[idx + 2] = color[2];
+    data[idx + 3] = 255;
   }
   biomeCtx.putImageData(imgData, 0, 0);
   console.log("createBiomeCanvas: Biome canvas created and rendered.");
@@ -124,28 +785,11 @@ function drawCivs() {
 
   // console.log("drawCivs: Starting to draw civs. Count:", worldData.civs.length);
 
-  for (let civ of worldData.civs) {
-    ctx.fillStyle = civ.color; // Base color for the civ
-
-    // Draw Territory
-    if (Array.isArray(civ.territory) && civ.territory.length > 0) {
-      // console.log(`drawCivs: Drawing territory for Civ ID ${civ.id}. Tiles: ${civ.territory.length}. Color: ${civ.color}`);
-      for (const tile of civ.territory) {
-        if (Array.isArray(tile) && tile.length === 2) {
-          const [x, y] = tile;
-          if (typeof x === 'number' && typeof y === 'number') {
-            ctx.fillRect(x, y, DEBUG_DRAW_SCALE_TERRITORY, DEBUG_DRAW_SCALE_TERRITORY);
-          } else {
-            console.warn(`drawCivs: Invalid tile [${x},${y}] in territory for civ ID ${civ.id}`);
-          }
-        } else {
-           console.warn(`drawCivs: Malformed tile data in territory for civ ID ${civ.id}:`, tile);
-        }
-      }
-    } else {
-      // console.log(`drawCivs: Civ ID ${civ.id} has no territory to draw or territory is not an array.`);
-    }
+  // Territory: one blit of the overlay, whatever its size
+  repaintTerritory();
+  if (territoryCanvas) ctx.drawImage(territoryCanvas, 0, 0);
 
+  for (let civ of worldData.civs) {
     // Draw Cities
     if (Array.isArray(civ.cities) && civ.cities.length > 0) {
       // console.log(`drawCivs: Drawing cities for Civ ID ${civ.id}. Count: ${civ.cities.length}.`);
@@ -182,13 +826,14 @@ function updateCivs() {
       currentY = Math.max(0, Math.min(worldData.map_height - 1, currentY));
     }
 
-    if (!worldData.food_map || !worldData.food_map[currentY] || worldData.food_map[currentY][currentX] === undefined) {
+    const currentIdx = tileIndex(currentX, currentY);
+    if (!worldData.food_map || worldData.food_map[currentIdx] === undefined) {
       continue;
     }
 
-    const food = worldData.food_map[currentY][currentX];
-    const wood = worldData.wood_map[currentY][currentX];
-    const minerals = worldData.minerals_map[currentY][currentX];
+    const food = worldData.food_map[currentIdx];
+    const wood = worldData.wood_map[currentIdx];
+    const minerals = worldData.minerals_map[currentIdx];
     const totalResources = food + wood + minerals;
 
     if (totalResources > 3) {
@@ -196,58 +841,60 @@ function updateCivs() {
       civ.js_population += civ.js_population * 0.02;
 
       // Resource consumption
-      worldData.food_map[currentY][currentX] = Math.max(0, food - civ.js_population * 0.1);
-      worldData.wood_map[currentY][currentX] = Math.max(0, wood - civ.js_population * 0.05);
-      worldData.minerals_map[currentY][currentX] = Math.max(0, minerals - civ.js_population * 0.05);
+      worldData.food_map[currentIdx] = Math.max(0, food - civ.js_population * 0.1);
+      worldData.wood_map[currentIdx] = Math.max(0, wood - civ.js_population * 0.05);
+      worldData.minerals_map[currentIdx] = Math.max(0, minerals - civ.js_population * 0.05);
 
       // TERRITORY EXPANSION - chance to expand if population is growing
-      if (Math.random() < 0.1 && civ.territory && Array.isArray(civ.territory)) {
+      // Only frontier tiles (with unowned land next to them) are visited, so the cost
+      // follows the border length instead of the territory size
+      if (Math.random() < 0.1 && civ.frontier) {
         const expandChance = 0.3;
+        const width = worldData.map_width;
+        const height = worldData.map_height;
         const newTiles = [];
+        const frontier = [];
 
-        for (const tile of civ.territory) {
-          if (Array.isArray(tile) && tile.length === 2) {
-            const [tx, ty] = tile;
-            // Check adjacent tiles
-            const adjacent = [
-              [tx-1, ty], [tx+1, ty], [tx, ty-1], [tx, ty+1]
-            ];
-
-            for (const [ax, ay] of adjacent) {
-              if (ax >= 0 && ax < worldData.map_width && ay >= 0 && ay < worldData.map_height) {
-                if (worldData.biome_map[ay][ax] !== 'Ocean') {
-                  // Check if tile is not already owned by this civ
-                  const alreadyOwned = civ.territory.some(t =>
-                    Array.isArray(t) && t[0] === ax && t[1] === ay
-                  );
-                  if (!alreadyOwned && Math.random() < expandChance) {
-                    newTiles.push([ax, ay]);
-                  }
-                }
-              }
-            }
+        for (const idx of civ.frontier) {
+          const tx = idx % width;
+          const ty = (idx - tx) / width;
+          let open = false;
+          // Check adjacent tiles
+          const adjacent = [
+            tx > 0 ? idx - 1 : -1, tx < width - 1 ? idx + 1 : -1,
+            ty > 0 ? idx - width : -1, ty < height - 1 ? idx + width : -1,
+          ];
+          for (const nIdx of adjacent) {
+            if (nIdx < 0 || ownership[nIdx] !== 0 || !isLand(nIdx)) continue;
+            open = true;
+            if (Math.random() < expandChance) newTiles.push(nIdx);
           }
+          if (open) frontier.push(idx);
         }
 
         // Add new tiles to territory
-        for (const newTile of newTiles) {
-          civ.territory.push(newTile);
+        for (const nIdx of newTiles) {
+          if (ownership[nIdx] !== 0) continue; // Claimed by an earlier neighbour this frame
+          setTileOwner(nIdx, civ.id);
+          civ.tiles.push(nIdx);
+          frontier.push(nIdx);
         }
+        civ.frontier = frontier;
       }
 
       // CITY FOUNDING - chance to found new city if population is high enough
       if (civ.js_population > 50 && Math.random() < 0.05 && civ.cities && Array.isArray(civ.cities)) {
-        if (civ.territory && civ.territory.length > civ.cities.length * 10) {
-          // Find a territory tile that doesn't have a city
-          const availableTiles = civ.territory.filter(tile => {
-            if (!Array.isArray(tile) || tile.length !== 2) return false;
-            return !civ.cities.some(city =>
-              city.location && city.location[0] === tile[0] && city.location[1] === tile[1]
-            );
-          });
-
-          if (availableTiles.length > 0) {
-            const newCityLocation = availableTiles[Math.floor(Math.random() * availableTiles.length)];
+        if (civ.tiles && civ.tiles.length > civ.cities.length * 10) {
+          // Find a territory tile that doesn't have a city (a few random tries)
+          let site = -1;
+          for (let attempt = 0; attempt < 10 && site < 0; attempt++) {
+            const idx = civ.tiles[Math.floor(Math.random() * civ.tiles.length)];
+            if (!cityTiles.has(idx)) site = idx;
+          }
+
+          if (site >= 0) {
+            const newCityLocation = [site % worldData.map_width, Math.floor(site / worldData.map_width)];
+            cityTiles.add(site);
             civ.cities.push({
               location: newCityLocation,
               population: 100 + Math.floor(Math.random() * 200)
@@ -269,16 +916,19 @@ function updateCivs() {
           const nx = currentX + dx;
           const ny = currentY + dy;
           if (nx < 0 || ny < 0 || nx >= worldData.map_width || ny >= worldData.map_height) continue;
-          if (worldData.biome_map[ny][nx] === 'Ocean') continue;
-          if (!worldData.food_map[ny] || worldData.food_map[ny][nx] === undefined) continue;
+          const biome = biomeNameAt(nx, ny);
+          if (biome === 'Ocean') continue;
+          const nIdx = tileIndex(nx, ny);
+          if (worldData.food_map[nIdx] === undefined) continue;
 
-          const r = worldData.food_map[ny][nx] + worldData.wood_map[ny][nx] + worldData.minerals_map[ny][nx];
+          const r = worldData.food_map[nIdx] + worldData.wood_map[nIdx] + worldData.minerals_map[nIdx];
           const habit = (() => {
-            switch (worldData.biome_map[ny][nx]) {
+            switch (biome) {
               case 'Grassland': return 0.8; case 'Forest': return 0.7;
               case 'Beach': return 0.5; case 'Taiga': return 0.5;
               case 'Swamp': return 0.4; case 'Tundra': return 0.3;
               case 'Desert': return 0.1; case 'Snow': return 0.1;
+              case 'River': return 0.9; case 'Lake': return 0.2;
               default: return 0.5;
             }
           })();
@@ -297,20 +947,52 @@ function updateCivs() {
   }
 }
 
+// Draws biomes and civs with the current view; also called on pan/zoom and when a tile arrives
+function renderScene() {
+  if (!ctx || !canvas || !worldData) return;
+  ctx.setTransform(1, 0, 0, 1, 0, 0);
+  ctx.clearRect(0, 0, canvas.width, canvas.height);
+  ctx.setTransform(view.zoom, 0, 0, view.zoom, -view.offsetX * view.zoom, -view.offsetY * view.zoom);
+  ctx.imageSmoothingEnabled = false;
+
+  if (tileManifest) {
+    drawBiomeTiles();
+  } else if (biomeCanvas) {
+    ctx.drawImage(biomeCanvas, 0, 0);
+  } else {
+    console.warn("renderScene: biomeCanvas not available to draw.");
+  }
+
+  drawCivs();   // Draws current state of worldData.civs (Python output + JS modifications to non-geometric props)
+  ctx.setTransform(1, 0, 0, 1, 0, 0);
+}
+
 function drawFrame() {
   if (!ctx || !canvas || !worldData) {
     console.log("drawFrame: Canvas or worldData not ready. Aborting frame.");
     return;
   }
-  ctx.clearRect(0, 0, canvas.width, canvas.height);
+  renderScene();
 
-  if (biomeCanvas) {
-    ctx.drawImage(biomeCanvas, 0, 0);
-  } else {
-    console.warn("drawFrame: biomeCanvas not available to draw.");
+  if (live) {
+    // The server simulates; events update the raster and cities between frames
+    if (info) {
+      const status = live.finished ? 'finished' : `${live.ticksPerEvent} month(s) per update`;
+      info.textContent = `Live month: ${live.month} | Year: ${Math.floor(live.month / 12)} / ${Math.floor(live.months / 12)} | ${status}`;
+    }
+    requestAnimationFrame(drawFrame);
+    return;
   }
 
-  drawCivs();   // Draws current state of worldData.civs (Python output + JS modifications to non-geometric props)
+  if (history) {
+    // Replay what Python actually simulated instead of the local JS simulation
+    if (replayMonth < history.lastMonth) seekHistory(replayMonth + monthsPerFrame);
+    if (info) {
+      info.textContent = `Replay month: ${replayMonth} | Year: ${Math.floor(replayMonth / 12)} / ${Math.floor(history.lastMonth / 12)}`;
+    }
+    requestAnimationFrame(drawFrame);
+    return;
+  }
 
   updateCivs(); // This function modifies worldData for the *next* JS frame.
                 // It simulates civ behavior in JS, separate from Python's sim.
@@ -363,6 +1045,7 @@ function shadeColor(hexColor, percent) {
 window.onload = () => {
   canvas = document.getElementById('worldCanvas');
   info = document.getElementById('info');
+  scrubber = document.getElementById('historyScrubber');
 
   if (!canvas) {
     console.error("CRITICAL: Canvas element with ID 'worldCanvas' not found.");
@@ -376,10 +1059,11 @@ window.onload = () => {
     return;
   }
   console.log("window.onload: Canvas and context obtained successfully.");
+  setupViewControls();
 
   if (!info) {
     console.warn("Info element with ID 'info' not found. Status messages will not be displayed on the page.");
   }
 
   loadData();
-};
\ No newline at end of file
+};